@@ -1,27 +1,26 @@
 # gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
 # Author: ©David Martínez. 
 # website-categorizer.py: Tries to categorize automatically the original sample websites based on string matches on website metadata. It generates the file "categorized_websites.json" with the results.
-#     It checks patterns on the domain name, website title, 'keywords' and 'description' HTML metadata. 
+#     It checks patterns on the domain name, website title, 'keywords' and 'description' HTML metadata. Only the head of each website is downloaded (once).
+#     Each categorized website is appended to the "website-categorizer-journal.jsonl" journal (see crawl_journal.py), so an interrupted run can be resumed ('--resume').
 # TFM algorithm implementation: categoritzador.
 
 # Dependencies.
 import json
+import time
+import argparse
+import threading
 import requests
-from requests.exceptions import ConnectionError
-from bs4 import BeautifulSoup
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from page_head import fetch_head
+from reachability import record_results
+from phase_timer import PhaseTimer
+from crawl_journal import CrawlJournal
 
 # Functions.
 
-# Checks if an URL exists.
-def is_online(url):
-    try:
-        requests.get(url, timeout=10)
-    except:
-        return False
-    else:
-        return True
-
-
 # Parses and returns the original sample JSON.
 def read_websites():
     try:
@@ -42,21 +41,8 @@ def read_strings():
         print(e)
 
 
-# Function that returns true if the website content 'soup' contains some of the strings 'meta_strings'.
-def website_contains(soup, meta_strings):
-    tags = []
-    if(soup.find("title")):
-        tags = [soup.find("title").text.lower()]
-    meta_tags = soup.find_all("meta", {"name": lambda x: x in ["description","Description","keywords","Keywords"]})
-    meta_property_tags = soup.find_all("meta", {"property": lambda x: x in ["og:description","og:keywords"]})
-    try:
-        tags += list(map(lambda x: x.attrs['content'].lower(), meta_tags))
-    except Exception as e:
-        tags += []
-    try:
-        tags += list(map(lambda x: x.attrs['content'].lower(), meta_property_tags))
-    except Exception as e:
-        tags += []
+# Function that returns true if some of the website head texts 'tags' (title, description and keywords) contains some of the strings 'meta_strings'.
+def website_contains(tags, meta_strings):
     for string in meta_strings:
         for tag in tags:
             if(isinstance(tag, str) and string in tag):
@@ -76,60 +62,117 @@ def merge_categories(categories):
         return categories
 
 
-# Function that receives a website and tries to categorize it.
-def detect_categories(website, url, strings):
+# Function that receives a website and its head texts 'tags', and tries to categorize it.
+def detect_categories(website, tags, strings):
+    categories = []
+    for cat,cat_strings in strings.items():
+        meta_strings = cat_strings['meta_strings']
+        domain_strings = cat_strings['domain_strings']
+        if any(string in website for string in domain_strings) or website_contains(tags, meta_strings):
+            categories.append(cat)
+    # Return the merged categories.
+    return merge_categories(categories)
+
+
+# Returns the semaphore that limits the concurrent downloads of the URL host.
+def host_semaphore(url):
+    host = urlsplit(url).hostname or url
+    with host_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.Semaphore(args.per_host)
+        return host_semaphores[host]
+
+
+# Function that downloads the website head with the shared HTTP session. A single download checks that the website is online and gets the texts used to categorize it.
+#   Returns None if the website is offline.
+def fetch_website(website):
+    url = 'https://'+website
     try:
-        # 1. Process the website.
-        page_data = requests.get(url, timeout=3.05)
-        soup = BeautifulSoup(page_data.content, 'html.parser')
-        if soup == "error":
-            raise Exception('Error')
-        # 2. Detect categories.
-        categories = []
-        for cat,cat_strings in strings.items():
-            meta_strings = cat_strings['meta_strings']
-            domain_strings = cat_strings['domain_strings']
-            if any(string in website for string in domain_strings) or website_contains(soup, meta_strings):
-                categories.append(cat)
-        # 3. Return the merged categories.
-        return merge_categories(categories)
+        semaphore = host_semaphore(url)
+        with timer.phase(website, 'host_wait'):
+            semaphore.acquire()
+        try:
+            with timer.phase(website, 'fetch_head'):
+                head, downloaded = fetch_head(url, session)
+        finally:
+            semaphore.release()
+        return head.tags()
     except Exception as e:
-        print(e)
-        return []
+        return None
+
+
+# Script arguments.
+parser = argparse.ArgumentParser(description='Categorizes the original sample websites based on their metadata.')
+parser.add_argument('--workers', type=int, default=1, help='Number of websites downloaded at the same time.')
+parser.add_argument('--per-host', type=int, default=2, help='Maximum number of simultaneous downloads from the same host.')
+parser.add_argument('--trace', default='website-categorizer-timings.jsonl', help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+parser.add_argument('--resume', action='store_true', help='Resume an interrupted run: the websites already on the journal are skipped (see crawl_journal.py).')
+args = parser.parse_args()
 
+# Time of each phase (waiting for a host download slot, head download and categorization) of each website.
+timer = PhaseTimer(args.trace, append=args.resume)
 
 # Obtain the websites list and "website-categorizer" strings.
 websites = read_websites()['websites']
 strings = read_strings()['strings']['website-categorizer']
 
-# Categorize websites.
-categorizer_dict = {}
-offline_websites = []
-uncategorized_websites = []
+# Shared HTTP session (keep-alive connection pool) for all the downloads.
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=max(args.workers, 10), pool_maxsize=args.per_host)
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+host_semaphores = {}
+host_lock = threading.Lock()
+
+# Journal of the categorized websites (on the resume mode, the websites already on it are skipped).
+journal = CrawlJournal('website-categorizer-journal.jsonl', args.resume)
+pending = journal.pending(websites)
+if args.resume:
+    print('Resuming: ',len(journal),'websites already processed.')
+
+# Categorize websites. The heads are downloaded concurrently, but the results are processed in the original sample order.
 total = len(websites)
-current = 1
-for website in websites:
-    url = 'https://'+website
-    if is_online(url):
-        website_categories = detect_categories(website, url, strings)
-        if len(website_categories) > 0:
-            print('[SUCCESS] - Website',website,'(',current,'/',total,'): ',website_categories)
+current = total-len(pending)+1
+reachability = {}
+start = time.time()
+with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    for website, tags in zip(pending, executor.map(fetch_website, pending)):
+        url = 'https://'+website
+        online = tags is not None
+        reachability[url] = online
+        if online:
+            with timer.phase(website, 'categorize'):
+                website_categories = detect_categories(website, tags, strings)
+            if len(website_categories) > 0:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): ',website_categories)
+                journal.append(website, 'ok', website_categories)
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): Cannot parse categories automatically.')
+                journal.append(website, 'warn', website_categories)
         else:
-            print('[WARN] - Website',website,'(',current,'/',total,'): Cannot parse categories automatically.')
-            uncategorized_websites.append(website)
-        categorizer_dict[website] = website_categories
-    else:
-        print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
-        offline_websites.append(website)
-    current += 1
-
-# Store the result json file.
-with open("categorized_websites.json", 'w') as outfile:
-    json.dump(categorizer_dict, outfile)
+            print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
+            journal.append(website, 'offline')
+        current += 1
+elapsed = time.time() - start
+session.close()
+
+# Share the reachability results with the other crawl scripts.
+record_results(reachability)
+
+# Compile the result json file from the journal.
+journal.compile("categorized_websites.json")
+journal.close()
+offline_websites = journal.websites('offline')
+uncategorized_websites = journal.websites('warn')
 
 # Print messages.
 ok = total-len(uncategorized_websites)
 print('\nCategorized',ok,'of',total,'websites. Success ratio:',ok*100/total,'%')
 print('Offline websites detected (',len(offline_websites),'): ',offline_websites)
 print('Unable to categorize websites (',len(uncategorized_websites),'): ', uncategorized_websites)
-print('Generated categorization file: "categorized_websites.json"')
\ No newline at end of file
+print('Generated categorization file: "categorized_websites.json"')
+
+# Store the phase timings summary (p50/p95/p99 of each phase and slowest websites).
+timer.print_summary(timer.save_summary())
+timer.close()
+print('Processed',len(pending),'websites in',elapsed,'seconds (',len(pending)/elapsed if elapsed > 0 else 0,'websites/second ).')
\ No newline at end of file
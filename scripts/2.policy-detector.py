@@ -1,6 +1,8 @@
 # gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
 # Author: ©David Martínez. 
 # policy-detector.py: It searches text patterns on the original sample websites in order to locate their privacy policy and the cookie policy. It generates the file "policy_detected.json" with the results.
+#     Each processed website is appended to the "policy-detector-results/journal.jsonl" journal (see crawl_journal.py), so an interrupted run can be resumed ('--resume').
+#     With '--queue', several workers (on several machines) share the websites of a work queue (see work_queue.py).
 # TFM algorithm implementation: detector de polítiques.
 
 
@@ -8,26 +10,20 @@
 import os
 import shutil
 import json
-import requests
 import time
-import string
+import argparse
 from pathlib import Path
-from requests.exceptions import ConnectionError
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from reachability import probe_websites
+from browser_pool import BrowserPool, DEFAULT_MAX_PAGES
+from page_readiness import PageReadiness, DEFAULT_MAX_WAIT, DEFAULT_CLICK_WAIT
+from keyword_scanner import KeywordScanner
+from phase_timer import PhaseTimer, WEBSITE_PHASE
+from screenshot_store import ScreenshotStore, variants_available
+from crawl_journal import CrawlJournal
+from work_queue import start_worker, DEFAULT_BATCH, DEFAULT_LEASE
 
 # Functions.
 
-# Checks if an URL exists.
-def is_online(url):
-    try:
-        requests.get(url, timeout = 10)
-    except:
-        return False
-    else:
-        return True
-
-
 # Parses and returns the original sample JSON.
 def read_websites():
     try:
@@ -48,68 +44,55 @@ def read_strings():
         print(e)
 
 
-# Function that populates strings.
-def populate_strings(keywords):
-    keywords_upper = [x.upper() for x in keywords]
-    keywords_cap = [x.capitalize() for x in keywords]
-    keywords_cap_every = [string.capwords(x) for x in keywords]
-    return keywords + keywords_upper + keywords_cap + keywords_cap_every
-
-
-def make_expression(strings):
-    strings = populate_strings(strings)
-    conditions1 = " or ".join(["contains(text(), '%s')" % keyword for keyword in strings])
-    conditions2 = " or ".join(["contains(@aria-label,'%s')" % keyword for keyword in strings])
-    conditions3 = " or ".join(["contains(@title,'%s')" % keyword for keyword in strings])
-    return "//*[(%s or %s or %s)]" % (conditions1,conditions2,conditions3)
-
-
-# Function that opens the website and searches for the policy.
-def detect_policy(url, website, strings, expression, name):
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--start-maximized')
-    driver = webdriver.Chrome(options=chrome_options,executable_path='chromium.chromedriver')
-    driver.set_page_load_timeout(10)
-    driver.set_window_size(1920, 1080)
+# Function that opens the website and searches for the policy (keywords 'group' of the 'scanner'). The browser is taken from the drivers 'pool',
+#   and 'readiness' waits for the pages. The screenshots are written by the screenshots 'store'. The 'timer' records the time of each phase.
+def detect_policy(url, website, strings, group, name, pool, readiness, scanner, store, timer):
     privacy_object = {}
-    try:
-        driver.get(url)
-        time.sleep(2)
-        expression2 = make_expression(strings["close_popups_strings"])
-        elements = driver.find_elements_by_xpath(expression2)
-        for element in elements:
-            try:
-                element.click()
-            except:
-                pass
-        time.sleep(2)
-        driver.save_screenshot("./policy-detector-results/"+website+"/mainpage.png")
-        elements = driver.find_elements_by_xpath(expression)
-        for element in elements:
-            try:
-                time.sleep(0.2)
-                driver.execute_script("window.scroll(0, %s)" % (element.location['y']))
-                time.sleep(2)
-                element.click()
-                time.sleep(0.2)
-                driver.switch_to.window(driver.window_handles[-1])
-                time.sleep(0.2)
-                body = driver.find_element_by_tag_name('body')
-                privacy_object["status"] = 0
-                privacy_object["text"] = body.text
-                privacy_object["url"] = driver.current_url
-                driver.save_screenshot("./policy-detector-results/"+website+"/"+name+"_policy.png")
-                if any(string in privacy_object["text"] for string in strings['old_policies_strings']):
-                    privacy_object["old"] = True
-                else:
-                    privacy_object["old"] = False
-            except Exception as e:
-                pass
-        driver.delete_all_cookies()
-        driver.quit()
-    except Exception as e:
-        driver.quit()
+    with pool.browser(website) as driver:
+        try:
+            with timer.phase(website, 'page_load'):
+                driver.get(url)
+            readiness.page_ready(driver, website)
+            candidates = scanner.scan(driver, website, ['close_popups', group])
+            closed = False
+            for element in candidates['close_popups']:
+                try:
+                    with timer.phase(website, 'click'):
+                        element.click()
+                    closed = True
+                except:
+                    pass
+            readiness.dom_quiet(driver, website)
+            with timer.phase(website, 'screenshot'):
+                store.capture(driver, "./policy-detector-results/"+website+"/mainpage.png", website)
+            # Closing popups changes the page, so scan it again.
+            if closed:
+                candidates = scanner.scan(driver, website, [group])
+            # Candidates are ranked (best first): the first one whose click opens a window or changes the URL is kept. A click without those effects
+            #   (e.g. it only opens a modal) is kept until a later candidate replaces it.
+            for element in candidates[group]:
+                try:
+                    driver.execute_script("window.scroll(0, %s)" % (element.location['y']))
+                    readiness.dom_quiet(driver, website)
+                    effect = readiness.click(driver, website, element)
+                    driver.switch_to.window(effect if isinstance(effect, str) else driver.window_handles[-1])
+                    readiness.page_ready(driver, website)
+                    body = driver.find_element_by_tag_name('body')
+                    privacy_object["status"] = 0
+                    privacy_object["text"] = body.text
+                    privacy_object["url"] = driver.current_url
+                    with timer.phase(website, 'screenshot'):
+                        store.capture(driver, "./policy-detector-results/"+website+"/"+name+"_policy.png", website)
+                    if any(string in privacy_object["text"] for string in strings['old_policies_strings']):
+                        privacy_object["old"] = True
+                    else:
+                        privacy_object["old"] = False
+                    if effect:
+                        break
+                except Exception as e:
+                    pass
+        except Exception as e:
+            pass
 
     if "status" not in privacy_object:
         privacy_object["status"] = 1
@@ -117,47 +100,123 @@ def detect_policy(url, website, strings, expression, name):
     return privacy_object
 
 
+# Script arguments.
+parser = argparse.ArgumentParser(description='Detects the privacy policy and the cookie policy of the original sample websites.')
+parser.add_argument('--recycle-after', type=int, default=DEFAULT_MAX_PAGES, help='Number of pages visited by a browser before it is restarted.')
+parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT, help='Maximum seconds waiting for a page to be ready.')
+parser.add_argument('--click-wait', type=float, default=DEFAULT_CLICK_WAIT, help='Maximum seconds waiting for the effect of a click (new window, page change or DOM change).')
+parser.add_argument('--trace', default='./policy-detector-results/timings.jsonl', help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+parser.add_argument('--screenshot-variants', type=int, nargs='+', default=[], help='Widths (pixels) of the downscaled WebP variants of each screenshot (see screenshot_store.py), it needs the pillow library.')
+parser.add_argument('--resume', action='store_true', help='Resume an interrupted run: the results are kept and the websites already on the journal are skipped (see crawl_journal.py).')
+parser.add_argument('--queue', default=None, help='Sharded mode: SQLite work queue file shared by several workers (see work_queue.py). The results are written to the worker folder.')
+parser.add_argument('--worker', default=None, help='Sharded mode: name of the worker (host name and process id by default).')
+parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='Sharded mode: number of websites claimed at once.')
+parser.add_argument('--lease', type=int, default=DEFAULT_LEASE, help='Sharded mode: seconds before the websites claimed by a dead worker are returned to the queue.')
+args = parser.parse_args()
+if args.screenshot_variants and not variants_available():
+    parser.error('the screenshot variants need the pillow library (pip3 install pillow)')
+
 # Main code.
 websites = read_websites()['websites']
 strings = read_strings()['strings']['policy-detector']
-expression_policy = make_expression(strings['privacy_policy_detect'])
-expression_cookie_policy = make_expression(strings['cookie_policy_detect'])
 
-# Create output directory.
+# Sharded mode: the websites are claimed from the work queue and the results are written to the worker folder.
+queue = start_worker(args.queue, args.worker, websites, args.lease) if args.queue else None
+
+# Create output directory (kept on the resume mode).
 dirpath = Path('policy-detector-results')
-if dirpath.exists() and dirpath.is_dir():
+if dirpath.exists() and dirpath.is_dir() and not args.resume:
     shutil.rmtree(dirpath)
 
-os.mkdir('policy-detector-results')
-
-policies_dict = {}
-offline_websites = []
-total = len(websites)
-current = 1
-for website in websites:
-    url = 'https://'+website
-    if is_online(url):
-        os.mkdir('policy-detector-results/'+website)
-        website_value = {}
-        website_value['privacy_policy'] = detect_policy(url, website, strings, expression_policy, "privacy")
-        if website_value['privacy_policy']['status'] == 0:
-            print('[SUCCESS] - Website',website,'(',current,'/',total,'): Has privacy policy.')
-        else:
-            print('[WARN] - Website',website,'(',current,'/',total,'): No privacy policy detected.')
-        website_value['cookie_policy'] = detect_policy(url, website, strings, expression_cookie_policy, "cookie")
-        if website_value['cookie_policy']['status'] == 0:
-            print('[SUCCESS] - Website',website,'(',current,'/',total,'): Has independent cookie policy.')
+os.makedirs('policy-detector-results', exist_ok=True)
+
+# Journal of the processed websites (on the resume mode, the websites already on it are skipped).
+journal = CrawlJournal('./policy-detector-results/journal.jsonl', args.resume)
+pending = journal.pending(websites)
+if args.resume:
+    print('Resuming: ',len(journal),'websites already processed.')
+
+# Time of each phase (reachability probe, browser launch, page load, waits, keyword scans, clicks, screenshots) of each website.
+timer = PhaseTimer(args.trace, append=args.resume)
+# Keyword groups searched on the pages (all of them in a single pass of the DOM).
+scanner = KeywordScanner({
+    'close_popups': (strings['close_popups_strings'], []),
+    'privacy': (strings['privacy_policy_detect'], []),
+    'cookie': (strings['cookie_policy_detect'], [])
+}, timer)
+# Screenshots are written by a background thread to a content-addressed store (identical screenshots are stored once).
+store = ScreenshotStore('./policy-detector-results/screenshots', args.screenshot_variants, timer)
+# Browsers are reused across websites (their cookies, storage and windows are cleaned between pages).
+pool = BrowserPool(max_pages=args.recycle_after, timer=timer)
+# Pages are ready when they are loaded, the network is idle and the DOM is stable (instead of fixed sleeps).
+readiness = PageReadiness(max_wait=args.max_wait, click_wait=args.click_wait, timer=timer)
+
+# Progress of the crawl (on the sharded mode, over the websites claimed by this worker so far).
+total = len(websites) if queue is None else 0
+current = total-len(pending)+1 if queue is None else 1
+
+# Journals a processed website once its screenshots are on disk (and, on the sharded mode, completes it on the work queue).
+def finish(website, status, result=None):
+    journal.append(website, status, result)
+    if queue is not None:
+        queue.complete(website, status)
+
+# On the sharded mode, the websites are processed in the claimed batches. The reachability of all the websites of a batch is checked at once
+#   (shared cache with the other crawl scripts).
+for batch in queue.batches(args.batch) if queue is not None else [pending]:
+    if queue is not None:
+        total += len(batch)
+    online_websites = probe_websites(['https://'+website for website in batch], timer=timer)
+    for website in batch:
+        url = 'https://'+website
+        if online_websites[url]:
+            os.makedirs('policy-detector-results/'+website, exist_ok=True)
+            website_value = {}
+            start = time.perf_counter()
+            website_value['privacy_policy'] = detect_policy(url, website, strings, 'privacy', "privacy", pool, readiness, scanner, store, timer)
+            if website_value['privacy_policy']['status'] == 0:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): Has privacy policy.')
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): No privacy policy detected.')
+            website_value['cookie_policy'] = detect_policy(url, website, strings, 'cookie', "cookie", pool, readiness, scanner, store, timer)
+            if website_value['cookie_policy']['status'] == 0:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): Has independent cookie policy.')
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): No independent cookie policy detected.')
+            timer.record(website, WEBSITE_PHASE, time.perf_counter() - start)
+            store.then(finish, website, 'ok', website_value)
         else:
-            print('[WARN] - Website',website,'(',current,'/',total,'): No independent cookie policy detected.')
-        policies_dict[website] = website_value
-    else:
-        print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
-        offline_websites.append(website)
-    current += 1
-
-# Store the result json file.
-with open("policy_detected.json", 'w') as outfile:
-    json.dump(policies_dict, outfile)
+            print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
+            store.then(finish, website, 'offline')
+        current += 1
+
+pool.close()
+store.close()
+
+# Compile the result json file from the journal.
+journal.compile("policy_detected.json")
+journal.close()
+if queue is not None:
+    queue.close()
+    queue.print_status()
+offline_websites = journal.websites('offline')
+
+# Store the wait times of each website.
+readiness.save("./policy-detector-results/wait-times.json")
+wait_totals = readiness.totals()
+if len(wait_totals) > 0:
+    print('\nMean wait time for each website:',sum(wait_totals.values())/len(wait_totals),'seconds (see "policy-detector-results/wait-times.json")')
+
+# Store the keyword scan times of each website.
+scanner.save("./policy-detector-results/scan-times.json")
+print('Mean keyword scan time for each page:',scanner.mean_scan_ms(),'ms (see "policy-detector-results/scan-times.json")')
+
+# Screenshots storage (unique images and written bytes).
+store.print_stats()
+
+# Store the phase timings summary (p50/p95/p99 of each phase and slowest websites).
+timer.print_summary(timer.save_summary())
+timer.close()
 
 print('\nOffline websites detected (',len(offline_websites),'): ',offline_websites)
 print('Generated policies file: "policy_detected.json"')
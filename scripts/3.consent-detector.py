@@ -1,6 +1,8 @@
 # gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
 # Author: ©David Martínez. 
 # consent-detector.py: It opens all the original sample websites and performs screenshots showing the user consent requirement forms. It generates the folder "consent-detector-results" with the screenshots results.
+#     Each processed website is appended to the "consent-detector-results/journal.jsonl" journal (see crawl_journal.py), so an interrupted run can be resumed ('--resume').
+#     With '--queue', several workers (on several machines) share the websites of a work queue (see work_queue.py).
 # TFM algorithm implementation: detector de consentiment.
 
 
@@ -8,26 +10,19 @@
 import os
 import shutil
 import json
-import requests
-import time
-import string
+import argparse
 from pathlib import Path
-from requests.exceptions import ConnectionError
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from reachability import probe_websites
+from browser_pool import BrowserPool, DEFAULT_MAX_PAGES
+from page_readiness import PageReadiness, DEFAULT_MAX_WAIT, DEFAULT_CLICK_WAIT
+from keyword_scanner import KeywordScanner
+from phase_timer import PhaseTimer, WEBSITE_PHASE
+from screenshot_store import ScreenshotStore, variants_available
+from crawl_journal import CrawlJournal
+from work_queue import start_worker, DEFAULT_BATCH, DEFAULT_LEASE
 
 # Functions.
 
-# Checks if an URL exists.
-def is_online(url):
-    try:
-        requests.get(url, timeout=10)
-    except:
-        return False
-    else:
-        return True
-
-
 # Parses and returns the original sample JSON.
 def read_websites():
     try:
@@ -48,57 +43,39 @@ def read_strings():
         print(e)
 
 
-# Function that populates strings.
-def populate_strings(keywords):
-    keywords_upper = [x.upper() for x in keywords]
-    keywords_cap = [x.capitalize() for x in keywords]
-    keywords_cap_every = [string.capwords(x) for x in keywords]
-    return keywords + keywords_upper + keywords_cap + keywords_cap_every
-
-
-def make_expression(strings,strings_no):
-    strings = populate_strings(strings)
-    strings_no = populate_strings(strings_no)
-    conditions1 = " or ".join(["contains(text(), '%s')" % keyword for keyword in strings])
-    conditions2 = " or ".join(["contains(@aria-label,'%s')" % keyword for keyword in strings])
-    conditions3 = " or ".join(["contains(@title,'%s')" % keyword for keyword in strings])
-    conditionsNo = " and not".join(["(contains(text(), '%s'))" % keyword for keyword in strings_no])
-    return "//*[(%s or %s or %s) and not %s]" % (conditions1,conditions2,conditions3,conditionsNo)
-
-
-# Function that opens the website and searches for the CMP first and second layers. It performs screenshots.
-def detect_consent(url, website, expression):
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--start-maximized')
-    driver = webdriver.Chrome(options=chrome_options,executable_path='chromium.chromedriver')
-    driver.set_page_load_timeout(10)
-    driver.set_window_size(1920, 1080)
+# Function that opens the website and searches for the CMP first and second layers. It performs screenshots (written by the screenshots 'store').
+#   The browser is taken from the drivers 'pool', and 'readiness' waits for the pages. The personalize buttons are searched with the keywords 'scanner'.
+#   The 'timer' records the time of each phase.
+def detect_consent(url, website, scanner, pool, readiness, store, timer):
     first_ok = False
     second_ok = False
-    try:
-        driver.get(url)
-        time.sleep(2)
-        driver.save_screenshot("./consent-detector-results/"+website+"/first-level.png")
-        first_ok = True
-        elements = driver.find_elements_by_xpath(expression)
-        for element in elements:
-            try:
-                time.sleep(0.2)
-                driver.execute_script("window.scroll(0, %s)" % (element.location['y']))
-                time.sleep(2)
-                element.click()
-                time.sleep(0.2)
-                driver.switch_to.window(driver.window_handles[-1])
-                time.sleep(0.2)
-                driver.save_screenshot("./consent-detector-results/"+website+"/second-level.png")
-                second_ok = True
-            except Exception as e:
-                pass
-        driver.delete_all_cookies()
-        driver.quit()
-    except Exception as e:
-        driver.quit()
+    with pool.browser(website) as driver:
+        try:
+            with timer.phase(website, 'page_load'):
+                driver.get(url)
+            readiness.page_ready(driver, website)
+            with timer.phase(website, 'screenshot'):
+                store.capture(driver, "./consent-detector-results/"+website+"/first-level.png", website)
+            first_ok = True
+            candidates = scanner.scan(driver, website)
+            # Candidates are ranked (best first): the first one whose click opens a window or changes the URL is kept. A click without those effects
+            #   (e.g. it only opens a modal) is kept until a later candidate replaces it.
+            for element in candidates['personalize']:
+                try:
+                    driver.execute_script("window.scroll(0, %s)" % (element.location['y']))
+                    readiness.dom_quiet(driver, website)
+                    effect = readiness.click(driver, website, element)
+                    driver.switch_to.window(effect if isinstance(effect, str) else driver.window_handles[-1])
+                    readiness.page_ready(driver, website)
+                    with timer.phase(website, 'screenshot'):
+                        store.capture(driver, "./consent-detector-results/"+website+"/second-level.png", website)
+                    second_ok = True
+                    if effect:
+                        break
+                except Exception as e:
+                    pass
+        except Exception as e:
+            pass
 
     if first_ok and second_ok:
         return True
@@ -106,34 +83,111 @@ def detect_consent(url, website, expression):
         return False
 
 
+# Script arguments.
+parser = argparse.ArgumentParser(description='Performs screenshots of the user consent forms (first and second layer) of the original sample websites.')
+parser.add_argument('--recycle-after', type=int, default=DEFAULT_MAX_PAGES, help='Number of pages visited by a browser before it is restarted.')
+parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT, help='Maximum seconds waiting for a page to be ready.')
+parser.add_argument('--click-wait', type=float, default=DEFAULT_CLICK_WAIT, help='Maximum seconds waiting for the effect of a click (new window, page change or DOM change).')
+parser.add_argument('--trace', default='./consent-detector-results/timings.jsonl', help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+parser.add_argument('--screenshot-variants', type=int, nargs='+', default=[], help='Widths (pixels) of the downscaled WebP variants of each screenshot (see screenshot_store.py), it needs the pillow library.')
+parser.add_argument('--resume', action='store_true', help='Resume an interrupted run: the results are kept and the websites already on the journal are skipped (see crawl_journal.py).')
+parser.add_argument('--queue', default=None, help='Sharded mode: SQLite work queue file shared by several workers (see work_queue.py). The results are written to the worker folder.')
+parser.add_argument('--worker', default=None, help='Sharded mode: name of the worker (host name and process id by default).')
+parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='Sharded mode: number of websites claimed at once.')
+parser.add_argument('--lease', type=int, default=DEFAULT_LEASE, help='Sharded mode: seconds before the websites claimed by a dead worker are returned to the queue.')
+args = parser.parse_args()
+if args.screenshot_variants and not variants_available():
+    parser.error('the screenshot variants need the pillow library (pip3 install pillow)')
+
 # Main code.
 websites = read_websites()['websites']
 strings = read_strings()['strings']['consent-detector']
-expression = make_expression(strings['personalize_strings'],strings['no_personalize_strings'])
 
-# Create output directory.
+# Sharded mode: the websites are claimed from the work queue and the results are written to the worker folder.
+queue = start_worker(args.queue, args.worker, websites, args.lease) if args.queue else None
+
+# Create output directory (kept on the resume mode).
 dirpath = Path('consent-detector-results')
-if dirpath.exists() and dirpath.is_dir():
+if dirpath.exists() and dirpath.is_dir() and not args.resume:
     shutil.rmtree(dirpath)
 
-os.mkdir('consent-detector-results')
-
-offline_websites = []
-total = len(websites)
-current = 1
-for website in websites:
-    url = 'https://'+website
-    os.mkdir('consent-detector-results/'+website)
-    if is_online(url):
-        ok = detect_consent(url, website, expression)
-        if ok:
-            print('[SUCCESS] - Website',website,'(',current,'/',total,'): CMP screenshots performed.')
+os.makedirs('consent-detector-results', exist_ok=True)
+
+# Journal of the processed websites (on the resume mode, the websites already on it are skipped).
+journal = CrawlJournal('./consent-detector-results/journal.jsonl', args.resume)
+pending = journal.pending(websites)
+if args.resume:
+    print('Resuming: ',len(journal),'websites already processed.')
+
+# Time of each phase (reachability probe, browser launch, page load, waits, keyword scans, clicks, screenshots) of each website.
+timer = PhaseTimer(args.trace, append=args.resume)
+# Keyword groups searched on the pages (personalize buttons that are not close buttons).
+scanner = KeywordScanner({
+    'personalize': (strings['personalize_strings'], strings['no_personalize_strings'])
+}, timer)
+# Screenshots are written by a background thread to a content-addressed store (identical screenshots are stored once).
+store = ScreenshotStore('./consent-detector-results/screenshots', args.screenshot_variants, timer)
+# Browsers are reused across websites (their cookies, storage and windows are cleaned between pages).
+pool = BrowserPool(max_pages=args.recycle_after, timer=timer)
+# Pages are ready when they are loaded, the network is idle and the DOM is stable (instead of fixed sleeps).
+readiness = PageReadiness(max_wait=args.max_wait, click_wait=args.click_wait, timer=timer)
+
+# Progress of the crawl (on the sharded mode, over the websites claimed by this worker so far).
+total = len(websites) if queue is None else 0
+current = total-len(pending)+1 if queue is None else 1
+
+# Journals a processed website once its screenshots are on disk (and, on the sharded mode, completes it on the work queue).
+def finish(website, status, result=None):
+    journal.append(website, status, result)
+    if queue is not None:
+        queue.complete(website, status)
+
+# On the sharded mode, the websites are processed in the claimed batches. The reachability of all the websites of a batch is checked at once
+#   (shared cache with the other crawl scripts).
+for batch in queue.batches(args.batch) if queue is not None else [pending]:
+    if queue is not None:
+        total += len(batch)
+    online_websites = probe_websites(['https://'+website for website in batch], timer=timer)
+    for website in batch:
+        url = 'https://'+website
+        os.makedirs('consent-detector-results/'+website, exist_ok=True)
+        if online_websites[url]:
+            with timer.phase(website, WEBSITE_PHASE):
+                ok = detect_consent(url, website, scanner, pool, readiness, store, timer)
+            if ok:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): CMP screenshots performed.')
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): Problem performing screenshots.')
+            store.then(finish, website, 'ok' if ok else 'warn')
         else:
-            print('[WARN] - Website',website,'(',current,'/',total,'): Problem performing screenshots.')
-    else:
-        print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
-        offline_websites.append(website)
-    current += 1
+            print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
+            store.then(finish, website, 'offline')
+        current += 1
+
+pool.close()
+store.close()
+journal.close()
+if queue is not None:
+    queue.close()
+    queue.print_status()
+offline_websites = journal.websites('offline')
+
+# Store the wait times of each website.
+readiness.save("./consent-detector-results/wait-times.json")
+wait_totals = readiness.totals()
+if len(wait_totals) > 0:
+    print('\nMean wait time for each website:',sum(wait_totals.values())/len(wait_totals),'seconds (see "consent-detector-results/wait-times.json")')
+
+# Store the keyword scan times of each website.
+scanner.save("./consent-detector-results/scan-times.json")
+print('Mean keyword scan time for each page:',scanner.mean_scan_ms(),'ms (see "consent-detector-results/scan-times.json")')
+
+# Screenshots storage (unique images and written bytes).
+store.print_stats()
+
+# Store the phase timings summary (p50/p95/p99 of each phase and slowest websites).
+timer.print_summary(timer.save_summary())
+timer.close()
 
 print('\nOffline websites detected (',len(offline_websites),'): ',offline_websites)
 print('Screenshots available in folder: "consent-detector-results"')
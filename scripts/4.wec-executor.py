@@ -1,6 +1,9 @@
 # gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
 # Author: ©David Martínez. 
 # wec-executor.py: Simple script that automates the WEC execution for the original website sample and organize the results. All inspections will be saved on "wec-evidences" folder, ready to be used on the cookies-detector.py and web-beacons-detector.py scripts.
+#     The WEC screenshots are moved to the "wec-screenshots" content-addressed store (see screenshot_store.py), identical screenshots are stored once and linked from the website folders.
+#     Each processed website is appended to the "wec-evidences/journal.jsonl" journal (see crawl_journal.py), so an interrupted run can be resumed ('--resume').
+#     With '--queue', several workers (on several machines) share the websites of a work queue (see work_queue.py).
 
 # IMPORTANT: 'website-evidence-collector' must to be installed in your computer.
 #   More information: https://github.com/EU-EDPS/website-evidence-collector
@@ -9,8 +12,16 @@
 import os
 import shutil
 import json
+import argparse
 import subprocess
+import threading
+from queue import Queue
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from phase_timer import PhaseTimer, WEBSITE_PHASE
+from screenshot_store import ScreenshotStore, variants_available
+from crawl_journal import CrawlJournal
+from work_queue import start_worker, DEFAULT_BATCH, DEFAULT_LEASE
 
 # Functions.
 
@@ -24,73 +35,163 @@ def read_websites():
         print(e)
 
 
-# Main code.
-websites = read_websites()['websites']
-
-# Create a directory to store evidence (inspection).
-dirpath = Path('wec-evidences')
-if dirpath.exists() and dirpath.is_dir():
-    shutil.rmtree(dirpath)
-else:
-    os.mkdir('wec-evidences')
-
-# Loop through all websites and run the WEC.
-error = []
-total = len(websites)
-current = 1
-for website in websites:
-
-    # Run the WEC.
-    url = 'https://'+website
-
+# Runs the WEC for the URL writing its results on the 'output' folder. Returns true if the inspection file was generated.
+#   The WEC execution time is recorded as the 'wec_https' or 'wec_http' phase of the website.
+def run_wec(url, website, output, timeout):
     try:
-        subprocess.check_output(
-            "website-evidence-collector -q --overwrite "+url+" -- --ignore-certificate-errors",
-            shell=True,
-            timeout = 20
-        )
+        with timer.phase(website, 'wec_'+url.split('://', 1)[0]):
+            subprocess.check_output(
+                ["website-evidence-collector", "-q", "--overwrite", "--output", output, url, "--", "--ignore-certificate-errors"],
+                stderr=subprocess.STDOUT,
+                timeout=timeout
+            )
     except:
-        # Do nothing. If error, ('./output/inspection.json' file will be missing).
+        # Do nothing. If error, (the inspection file will be missing).
         pass
+    return os.path.isfile(output+'/inspection.json')
+
+
+# Moves the WEC results of the 'output' scratch folder to "wec-evidences/<website>".
+#   The files are first moved to a staging folder next to the scratch folder (on "wec-scratch", the same file system, outside the inspections folder)
+#   that is then renamed, so the website folder appears complete or not at all.
+#   Then the screenshots are handed to the screenshots store, that replaces them with links to the stored images.
+def store_evidences(output, website):
+    staging = output+'.staging'
+    if os.path.isdir(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    os.rename(output+'/inspection.json', staging+'/inspection.json')
+    if os.path.isfile(output+'/screenshot-top.png'):
+        os.rename(output+'/screenshot-top.png', staging+'/screenshot-top.png')
+    if os.path.isfile(output+'/screenshot-bottom.png'):
+        os.rename(output+'/screenshot-bottom.png', staging+'/screenshot-bottom.png')
+    # A resumed run may find the folder of a website that was stored but not journaled.
+    if os.path.isdir('wec-evidences/'+website):
+        shutil.rmtree('wec-evidences/'+website)
+    os.rename(staging, 'wec-evidences/'+website)
+    for name in ['screenshot-top.png', 'screenshot-bottom.png']:
+        if os.path.isfile('wec-evidences/'+website+'/'+name):
+            store.add_file('wec-evidences/'+website+'/'+name, website)
+
+
+# Inspects a website with the WEC using the worker 'output' scratch folder. First it tries with HTTPS and if there is no inspection, with HTTP.
+def inspect_website(website, output, timeout):
+    ok = run_wec('https://'+website, website, output, timeout)
+    if not ok:
+        ok = run_wec('http://'+website, website, output, timeout)
+    if ok:
+        with timer.phase(website, 'store_evidences'):
+            store_evidences(output, website)
+    # Remove the output folder (if exist).
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+    return ok
+
+
+# Script arguments.
+parser = argparse.ArgumentParser(description='Runs the WEC for the original sample websites.')
+parser.add_argument('--workers', type=int, default=1, help='Number of websites inspected at the same time (each worker uses its own output folder).')
+parser.add_argument('--timeout', type=int, default=20, help='Seconds to wait for each WEC execution.')
+parser.add_argument('--trace', default='wec-executor-timings.jsonl', help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+parser.add_argument('--screenshot-variants', type=int, nargs='+', default=[], help='Widths (pixels) of the downscaled WebP variants of each screenshot (see screenshot_store.py), it needs the pillow library.')
+parser.add_argument('--resume', action='store_true', help='Resume an interrupted run: the inspections are kept and the websites already on the journal are skipped (see crawl_journal.py).')
+parser.add_argument('--queue', default=None, help='Sharded mode: SQLite work queue file shared by several workers (see work_queue.py). The results are written to the worker folder.')
+parser.add_argument('--worker', default=None, help='Sharded mode: name of the worker (host name and process id by default).')
+parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='Sharded mode: number of websites claimed at once.')
+parser.add_argument('--lease', type=int, default=DEFAULT_LEASE, help='Sharded mode: seconds before the websites claimed by a dead worker are returned to the queue.')
+args = parser.parse_args()
+if args.screenshot_variants and not variants_available():
+    parser.error('the screenshot variants need the pillow library (pip3 install pillow)')
+
+# Main code.
+websites = read_websites()['websites']
 
-    # Check if inspection file exists, if not try with HTTP.
-    ok = True
-    if not os.path.isfile('./output/inspection.json'):
-        # Run the WEC.
-        url = 'http://'+website
+# Sharded mode: the websites are claimed from the work queue and the results are written to the worker folder.
+queue = start_worker(args.queue, args.worker, websites, args.lease) if args.queue else None
 
-        try:
-            subprocess.check_output(
-                "website-evidence-collector -q --overwrite "+url+" -- --ignore-certificate-errors",
-                shell=True,
-                timeout = 20
-            )
-        except:
-            # Do nothing. If error, ('./output/inspection.json' file will be missing).
-            pass
+# Time of each phase (WEC executions and evidences storage) of each website.
+timer = PhaseTimer(args.trace, append=args.resume)
 
-        # Check if inspection file exists, if not show error.
-        if not os.path.isfile('./output/inspection.json'):
+# Create a directory to store evidence (inspection), kept on the resume mode.
+dirpath = Path('wec-evidences')
+if dirpath.exists() and dirpath.is_dir() and not args.resume:
+    shutil.rmtree(dirpath)
+os.makedirs('wec-evidences', exist_ok=True)
+# Screenshots store (outside "wec-evidences", where every folder is a website inspection; the inspections are staged on "wec-scratch").
+dirpath = Path('wec-screenshots')
+if dirpath.exists() and dirpath.is_dir() and not args.resume:
+    shutil.rmtree(dirpath)
+store = ScreenshotStore('wec-screenshots', args.screenshot_variants, timer)
+
+# Journal of the processed websites (on the resume mode, the websites already on it are skipped).
+journal = CrawlJournal('wec-evidences/journal.jsonl', args.resume)
+pending = journal.pending(websites)
+if args.resume:
+    print('Resuming: ',len(journal),'websites already processed.')
+
+# Scratch output folders, one for each worker (the WEC always writes the same file names).
+scratch = Queue()
+for n in range(args.workers):
+    scratch.put('wec-scratch/worker-'+str(n))
+
+# Journals a processed website once its screenshots are on disk (and, on the sharded mode, completes it on the work queue).
+def finish(website, status):
+    journal.append(website, status)
+    if queue is not None:
+        queue.complete(website, status)
+
+# Loop through all websites and run the WEC. The progress is counted over the websites claimed by this worker so far on the sharded mode.
+total = len(websites) if queue is None else 0
+current = total-len(pending)+1 if queue is None else 1
+lock = threading.Lock()
+
+# Inspects a website with a free scratch folder and prints the result.
+def process_website(website):
+    global current
+    output = scratch.get()
+    try:
+        with timer.phase(website, WEBSITE_PHASE):
+            ok = inspect_website(website, output, args.timeout)
+    except Exception as e:
+        # E.g. the evidences can not be stored (full disk or permissions): the website is reported as an error and the run goes on.
+        print('[ERROR] - Website',website,': Problem storing the WEC inspection:',e)
+        ok = False
+    finally:
+        scratch.put(output)
+    with lock:
+        if ok:
+            print('[SUCCESS] - Website',website,'(',current,'/',total,'): WEC inspection performed.')
+        else:
             print('  - Cannot inspect webpage: '+website)
             print('[ERROR] - Website',website,'(',current,'/',total,'): Error while inspecting.')
-            error.append(website)
-            ok = False
-    
-    if ok:
-        # All ok, now create a subfolder inside 'wec-evidences' with the site and copy the 'inspection.json' file and the top and bottom screenshots.
-        os.makedirs('wec-evidences/'+website)
-        os.rename("./output/inspection.json", "./wec-evidences/"+website+'/inspection.json')
-        if os.path.isfile('./output/screenshot-top.png'):
-            os.rename("./output/screenshot-top.png", "./wec-evidences/"+website+'/screenshot-top.png')
-        if os.path.isfile('./output/screenshot-bottom.png'):
-            os.rename("./output/screenshot-bottom.png", "./wec-evidences/"+website+'/screenshot-bottom.png')
-        print('[SUCCESS] - Website',website,'(',current,'/',total,'): WEC inspection performed.')
-    current += 1
-
-    # Remove the output folder (if exist).
-    if os.path.isdir('./output'):
-        shutil.rmtree('./output')
+        current += 1
+    store.then(finish, website, 'ok' if ok else 'error')
+
+# On the sharded mode, the websites are processed in the claimed batches.
+with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    for batch in queue.batches(args.batch) if queue is not None else [pending]:
+        if queue is not None:
+            total += len(batch)
+        list(executor.map(process_website, batch))
+
+if os.path.isdir('wec-scratch'):
+    shutil.rmtree('wec-scratch')
+store.close()
+journal.close()
+if queue is not None:
+    queue.close()
+    queue.print_status()
+
+# Keep the uninspected websites in the original sample order.
+failed = set(journal.websites('error'))
+error = [website for website in websites if website in failed]
+
+# Screenshots storage (unique images and written bytes).
+store.print_stats()
+
+# Store the phase timings summary (p50/p95/p99 of each phase and slowest websites).
+timer.print_summary(timer.save_summary())
+timer.close()
 
 print('\nUninspected websites (',len(error),'): ',error)
 print('All inspections available in folder: "wec-evidences"')
-
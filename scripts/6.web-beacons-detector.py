@@ -1,183 +1,87 @@
 # gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
 # Author: ©David Martínez. 
-# web-beacons-detector.py: This script takes the WEC execution results and locate the used web beacons. It stores the results on the "beacons-detector-results" folder and shows on terminal lots of processed data information. The results contain JSON files with web beacons information and also the automatic generation of 3 diagrams, including web beacons frequency histogram, the top 10 of websites with more web beacons, and the top 10 of tracking web beacon domains.
+# web-beacons-detector.py: This script takes the WEC execution results and locate the used web beacons, and the web beacons loaded from known fingerprinting scripts (dataset of the assets). It stores the results on the "beacons-detector-results" folder and shows on terminal lots of processed data information. The results contain JSON files with web beacons information and also the automatic generation of 3 diagrams, including web beacons frequency histogram, the top 10 of websites with more web beacons, and the top 10 of tracking web beacon domains.
 # TFM algorithm implementation: detector de web beacons.
 
 # IMPORTANT: This script needs to be executed after the WEC inspection 'wec-executor.py', so it's necessary to have an output folder named 'wec-evidences' with the generated inspections.
 
 # Dependencies.
-import os
-import shutil
 import json
-import statistics
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from pathlib import Path
-
-# Define the color palette for diagrams.
-colors=[
-    "#88CCEE",
-    "#CC6677",
-    "#DDCC77",
-    "#117733",
-    "#AA4499",
-    "#44AA99",
-    "#999933",
-    "#882255",
-    "#661100",
-    "#6699CC",
-    "#888888"
-]
-
-# Functions.
-
-# Function that draws a beacons histogram diagram.
-def draw_beacons_histogram(number_of_beacons):
-    plt.hist(number_of_beacons,color=colors[0])
-    fig = plt.gcf()
-    fig.set_size_inches(12, 10)
-    plt.xlabel("Web beacons",fontsize=20)
-    plt.ylabel("Websites",fontsize=20)
-    plt.axvline(n_mean, color='k', linestyle='dashed', linewidth=1)
-    plt.savefig('./beacons-detector-results/diagram-beacons-histogram.pdf', format="PDF", bbox_inches='tight')
-    plt.clf()
-
-# Function that draws the top 10 websites with more beacons diagram.
-def draw_top10_beacons_websites(beacons_dict):
-    top_pages = {}
-    for website,beacons in beacons_dict.items():
-        top_pages[website] = len(beacons)
-
-    # Create a data frame
-    df = pd.DataFrame ({
-            'Group': top_pages.keys(),
-            'Value': top_pages.values()
-    })
-
-    # Sort the table
-    df = df.sort_values(by=['Value'],ascending=False)
-    df = df.head(10)
-
-    sns.set_style("whitegrid")
-    plt.rcParams['axes.axisbelow'] = True
-    plt.barh(y=df.Group, width=df.Value, align="center",color=colors)
-
-    # Add title
-    plt.xlabel("Web beacons",fontsize='xx-large')
-    plt.yticks(fontsize='x-large')
-    plt.gca().invert_yaxis()
-
-    fig = plt.gcf()
-    fig.set_size_inches(12, 6)
-    plt.savefig('./beacons-detector-results/diagram-top10-website-beacons.pdf', format="PDF", bbox_inches='tight')
-    plt.clf()
-
-
-# Function that draws the top 10 tracking domains diagram.
-def draw_top10_tracking_domains(beacons_parties):
-    thirdParty_domains = {}
-    for c_parties in beacons_parties.values():
-        for c_party in c_parties['thirdParty']:
-            if c_party in thirdParty_domains:
-                thirdParty_domains[c_party] += 1
-            else:
-                thirdParty_domains[c_party] = 1
-
-    # Create a data frame
-    df = pd.DataFrame ({
-            'Group': thirdParty_domains.keys(),
-            'Value': thirdParty_domains.values()
-    })
-
-    # Sort the table
-    df = df.sort_values(by=['Value'],ascending=False)
-    df = df.head(10)
-
-    sns.set_style("whitegrid")
-    plt.rcParams['axes.axisbelow'] = True
-    plt.barh(y=df.Group, width=df.Value, align="center",color=colors)
-
-    # Add title
-    plt.xlabel("Websites",fontsize='xx-large')
-    plt.yticks(fontsize='x-large')
-    plt.gca().invert_yaxis()
-
-    fig = plt.gcf()
-    fig.set_size_inches(12, 6)
-    plt.savefig('./beacons-detector-results/diagram-top10-tracking-domains.pdf', format="PDF", bbox_inches='tight')
-    plt.clf()
-
+import argparse
+import columnar_export
+from evidence_manifest import EvidenceManifest
+from evidence_stats import beacon_table
+from phase_timer import PhaseTimer
+from diagrams import render, beacon_diagrams, DEFAULT_PROCESSES
+from evidence_analysis import EvidenceAnalysis, BeaconAnalyzer, HostAnalyzer, FingerprintAnalyzer, load_fingerprint_index, BEACONS_RESULTS, DOMAIN_BEACONS_RESULTS, BEACON_FINGERPRINTING_RESULTS
+
+# Script arguments.
+parser = argparse.ArgumentParser(description='Detects the web beacons on the WEC inspections.')
+parser.add_argument('--incremental', action='store_true', help='Only analyze the websites whose inspection changed since the last run, merging them into the stored results (see evidence_manifest.py).')
+parser.add_argument('--columnar', action='store_true', help='Also store the results as Parquet tables (see columnar_export.py), it needs the pyarrow library.')
+parser.add_argument('--from-analysis', action='store_true', help='Reuse the web beacon results generated by the shared evidence analysis stage (evidence_analysis.py) instead of analyzing the inspections.')
+parser.add_argument('--no-diagrams', action='store_true', help='Analysis only: do not render the diagrams (they can be rendered later with diagrams.py).')
+parser.add_argument('--diagram-processes', type=int, default=DEFAULT_PROCESSES, help='Number of worker processes rendering the diagrams.')
+parser.add_argument('--trace', default='web-beacons-detector-timings.jsonl', help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+args = parser.parse_args()
+if args.columnar and not columnar_export.available():
+    parser.error('the columnar output mode needs the pyarrow library (pip3 install pyarrow)')
 
 # Main code: Web beacon analysis.
 #  - For each WEC inspected website, get the list of beacons.
 #  - For each WEC inspected website, get the list of third-party beacon domains.
-
-# Dictionary where to store the beacons for each website.
-beacons_dict = {}
-beacons_parties = {}
-
-# Iterate through each website inspection and load its data.
-for subdir, dirs, files in os.walk('./wec-evidences'):
-    for dire in dirs:
-        with open(subdir+'/'+dire+'/inspection.json') as f:
-           data = json.load(f)
-
-        # Iterate through beacons and get interesting information.
-        beacons = []
-        for beacon in data['beacons']:
-            beacon_obj = {
-                'listName': beacon['listName'],
-                'url': beacon['url']
-            }
-            beacons.append(beacon_obj)
-        beacons_dict[dire] = beacons
-
-        # List of first party and three party beacons.
-        parties = {
-            'firstParty': data['hosts']['beacons']['firstParty'],
-            'thirdParty': data['hosts']['beacons']['thirdParty'],
-        }
-        beacons_parties[dire] = parties
-
-# Create output directory.
-dirpath = Path('beacons-detector-results')
-if dirpath.exists() and dirpath.is_dir():
-    shutil.rmtree(dirpath)
-
-os.mkdir('beacons-detector-results')
-
-# Store the results to json files.
-with open("./beacons-detector-results/beacons-results.json", 'w') as outfile:
-    json.dump(beacons_dict, outfile)
-with open("./beacons-detector-results/domain-beacons-results.json", 'w') as outfile:
-    json.dump(beacons_parties, outfile)
+#  - For each WEC inspected website, get the list of web beacons that are known fingerprinting scripts.
+
+# Time of each phase (inspection parsing, filter matching...) of each website.
+timer = PhaseTimer(args.trace)
+
+if args.from_analysis:
+    # Results of the shared evidence analysis stage.
+    with open(BEACONS_RESULTS) as f:
+        beacons_dict = json.load(f)
+    with open(DOMAIN_BEACONS_RESULTS) as f:
+        beacons_parties = json.load(f)
+    with open(BEACON_FINGERPRINTING_RESULTS) as f:
+        fingerprinting_dict = json.load(f)
+else:
+    # Read each website inspection and analyze its beacons and beacon hosts. The results are stored on the "beacons-detector-results" folder.
+    analysis = EvidenceAnalysis(EvidenceManifest() if args.incremental else None, timer)
+    beacons = analysis.register(BeaconAnalyzer())
+    hosts = analysis.register(HostAnalyzer(['beacons']))
+    fingerprinting = analysis.register(FingerprintAnalyzer(load_fingerprint_index(), ['beacons']))
+    analysis.run()
+    with timer.phase(None, 'store'):
+        analysis.store(args.columnar)
+
+    # Dictionaries with the beacons, the first and third-party beacon domains and the fingerprinting scripts for each website.
+    beacons_dict = beacons.beacons_dict
+    beacons_parties = hosts.parties['beacons']
+    fingerprinting_dict = fingerprinting.findings['beacons']
 
 print('\nNumber of WEC inspected websites:',len(beacons_dict.keys()))
 
-# Frequency histogram data.
-number_of_beacons = []
-max_beacon_website = ""
-max_track = 0
-for website,beacons in beacons_dict.items():
-    number_of_beacons.append(len(beacons))
-    if(len(beacons) > max_track):
-        max_track = len(beacons)
-        max_beacon_website = website
-
-n_mean = sum(number_of_beacons) / len(number_of_beacons)
-print('Mean of web beacons for each website:',n_mean)
-print('std web beacons for each website:',statistics.stdev(number_of_beacons))
-print('Website with more web beacons (',max_track,'):',max_beacon_website)
-
-# Draw beacons frequency histogram.
-draw_beacons_histogram(number_of_beacons)
-print('\n - Generated beacons histogram: "diagram-beacons-histogram.pdf"')
-
-# Draw beacons top10 websites.
-draw_top10_beacons_websites(beacons_dict)
-print(' - Generated top10 beacons websites: "diagram-top10-website-beacons.pdf"')
-
-# Draw tracking domains top10.
-draw_top10_tracking_domains(beacons_parties)
-print(' - Generated top10 tracking domains: "diagram-top10-tracking-domains.pdf"')
+# Compute all the statistics in one pass (the value of each website is its number of web beacons).
+with timer.phase(None, 'statistics'):
+    summary = beacon_table(beacons_dict, beacons_parties).summary()
+
+print('Mean of web beacons for each website:',summary['mean'])
+print('std web beacons for each website:',summary['std'])
+print('Website with more web beacons (',summary['max_value'],'):',summary['max_site'])
+print()
+
+fingerprinting_websites = sum(1 for findings in fingerprinting_dict.values() if findings)
+print('Number of websites with web beacons of known fingerprinting scripts:',fingerprinting_websites)
+print('Percentage of websites with web beacons of known fingerprinting scripts:',fingerprinting_websites*100/len(fingerprinting_dict) if fingerprinting_dict else 0.0)
+
+# Render the diagrams in parallel (see diagrams.py), unless only the analysis is requested.
+if args.no_diagrams:
+    print('\n - Diagrams not generated (render them with "python3 diagrams.py --only beacons")')
+else:
+    with timer.phase(None, 'diagrams'):
+        render(beacon_diagrams(summary), args.diagram_processes)
+    print('\n - Generated beacons histogram: "diagram-beacons-histogram.pdf"')
+    print(' - Generated top10 beacons websites: "diagram-top10-website-beacons.pdf"')
+    print(' - Generated top10 tracking domains: "diagram-top10-tracking-domains.pdf"')
+
+timer.print_summary(timer.save_summary())
+timer.close()
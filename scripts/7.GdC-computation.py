@@ -1,69 +1,111 @@
 # gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
-# Author: ©David Martínez. 
-# GdC-computation.py: This script takes the results of both theoretical and practical analysis in order to compute the GdC value. It does not generate output files, it prints to the console the sets A, B, Ao, and Bo and also the GdC value.
+# Author: ©David Martínez.
+# GdC-computation.py: This script takes the results of both theoretical and practical analysis in order to compute the GdC value. It does not generate output files (only the phase timings trace, see phase_timer.py), it prints to the console the sets A, B, Ao, and Bo and also the GdC value.
+#     The results are reduced to a compact per-website summary (see gdc_engine.py), so the GdC can also be computed for each category of the categorization ('--categories'),
+#     for each TLD ('--by-tld') and for bootstrap resamples ('--bootstrap'). The breakdowns can be stored as a JSON file ('--output').
 
 #  IMPORTANT: It needs, in the same directory of this script, the file "theoretical_analysis.json" (manually created from the evaluation of the "policy-detector" and "consent-detector" scripts output), the subdirectory "cookies-detector-results" with the results of the "cookies-detector" script, and the subdirectory "beacons-detector-results" with the results of the "web-beacons-detector" script.
 
 import json
+import time
+import argparse
+from gdc_engine import GdCTable, DEFAULT_RESAMPLES
+from phase_timer import PhaseTimer
+
+# Script arguments.
+parser = argparse.ArgumentParser(description='Computes the GdC value from the theoretical and practical analysis results.')
+parser.add_argument('--columnar', action='store_true', help='Read the sites Parquet tables of the detectors (see columnar_export.py) instead of their result JSON files.')
+parser.add_argument('--summary', default=None, help='Load the per-website summary stored with --save-summary instead of reading the result files.')
+parser.add_argument('--save-summary', default=None, help='Store the per-website summary (numpy .npz file) to reuse it on later runs.')
+parser.add_argument('--categories', nargs='?', const='./categorized_websites.json', default=None, help='Compute the GdC of each category of the categorization file (see website-categorizer.py).')
+parser.add_argument('--by-tld', action='store_true', help='Compute the GdC of each top-level domain.')
+parser.add_argument('--bootstrap', type=int, nargs='?', const=DEFAULT_RESAMPLES, default=0, help='Compute the GdC of bootstrap resamples of the websites (number of resamples).')
+parser.add_argument('--seed', type=int, default=None, help='Random seed of the bootstrap resamples.')
+parser.add_argument('--output', default=None, help='Store the GdC and its breakdowns as a JSON file.')
+parser.add_argument('--trace', default='GdC-computation-timings.jsonl', help='JSONL file where the time of each phase is recorded (see phase_timer.py).')
+args = parser.parse_args()
+
+# Time of each phase (loading the results, GdC computation and breakdowns).
+timer = PhaseTimer(args.trace)
 
 try:
-    # First open all necessary files.
-    with open('./theoretical_analysis.json') as f:
-        theoretical_analysis = json.load(f)
-    with open('./cookies-detector-results/cookie-results.json') as f:
-        cookie_results = json.load(f)
-    with open('./beacons-detector-results/beacons-results.json') as f:
-        beacons_results = json.load(f)
+    # First open all necessary files and build the per-website summary (consent class, tracking cookies and web beacons of each website).
+    start = time.perf_counter()
+    if args.summary:
+        table = GdCTable.load(args.summary)
+    else:
+        with open('./theoretical_analysis.json') as f:
+            theoretical_analysis = json.load(f)
+        if args.columnar:
+            table = GdCTable.from_tables(theoretical_analysis, './cookies-detector-results/sites.parquet', './beacons-detector-results/sites.parquet')
+        else:
+            with open('./cookies-detector-results/cookie-results.json') as f:
+                cookie_results = json.load(f)
+            with open('./beacons-detector-results/beacons-results.json') as f:
+                beacons_results = json.load(f)
+            table = GdCTable.from_results(theoretical_analysis, cookie_results, beacons_results)
+    if args.save_summary:
+        table.save(args.save_summary)
+    categorized = None
+    if args.categories:
+        with open(args.categories) as f:
+            categorized = json.load(f)
+    timer.record(None, 'load', time.perf_counter() - start)
+except Exception as e:
+    print(e)
+    print('[ERROR] - Some input files are missing. Please read the documentation.')
+    raise SystemExit(1)
 
-    # Next generate the A and B sets from the 'theoretical_analysis'.
-    A = set()
-    B = set()
-    for website, analysis in theoretical_analysis.items():
-        # Some analyzed websites in the theoretical analysis may not be in the practical analysis (WEC cannot be executed).
-        if website in cookie_results.keys() and website in beacons_results.keys():
-            if analysis['consent_type'] == "none":
-                A.add(website)
-            elif analysis['consent_type'] not in ['no_option','confirm']:
-                if not analysis['has_cookies_wall'] and not analysis['default_active']:
-                    B.add(website)
+# Generate the A, B, Ao and Bo sets and compute the GdC value.
+with timer.phase(None, 'gdc'):
+    sets = table.sets()
+    result = table.gdc()
 
-    # Now generate the Ao and Bo sets from the 'cookie_results' and 'beacons_results'.
-    Ao = set()
-    for website in A:
-        beacons = beacons_results[website]
-        tracking_cookies = any(cookie['tracking'] for cookie in cookie_results[website])
-        if not tracking_cookies and len(beacons) == 0:
-            Ao.add(website)
-    Bo = set()
-    for website in B:
-        beacons = beacons_results[website]
-        tracking_cookies = any(cookie['tracking'] for cookie in cookie_results[website])
-        if not tracking_cookies and len(beacons) == 0:
-            Bo.add(website)
+# Print the results.
+print('*************************')
+print('A :=',set(sets['A']))
+print('*************************')
+print('B :=',set(sets['B']))
+print('*************************')
+print('Ao :=',set(sets['Ao']))
+print('*************************')
+print('Bo :=',set(sets['Bo']))
+print('*************************\n')
 
-    # Finally compute the GdC value.
-    gdc = (len(Ao.union(Bo))/len(A.union(B)))
-        
-    # Print the results.
-    print('*************************')
-    print('A :=',A)
-    print('*************************')
-    print('B :=',B)
-    print('*************************')
-    print('Ao :=',Ao)
-    print('*************************')
-    print('Bo :=',Bo)
-    print('*************************\n')
+print('*************************')
+print('|A| :=',result['A'])
+print('|B| :=',result['B'])
+print('|Ao| :=',result['Ao'])
+print('|Bo| :=',result['Bo'])
+print('*************************')
+print('GdC :=',result['gdc'])
+print('*************************\n')
 
-    print('*************************')
-    print('|A| :=',len(A))
-    print('|B| :=',len(B))
-    print('|Ao| :=',len(Ao))
-    print('|Bo| :=',len(Bo))
-    print('*************************')
-    print('GdC :=',gdc)
-    print('*************************\n')
+# Breakdowns of the GdC value.
+output = {'gdc': result}
+if categorized is not None:
+    with timer.phase(None, 'gdc_categories'):
+        output['categories'] = table.by_category(categorized)
+    print('GdC by category:')
+    for category, counts in sorted(output['categories'].items(), key=lambda item: item[1]['A'] + item[1]['B'], reverse=True):
+        print(' -',category,': GdC :=',counts['gdc'],'( |A ∪ B| :=',counts['A'] + counts['B'],')')
+    print()
+if args.by_tld:
+    with timer.phase(None, 'gdc_tlds'):
+        output['tlds'] = table.by_tld()
+    print('GdC by TLD:')
+    for tld, counts in sorted(output['tlds'].items(), key=lambda item: item[1]['A'] + item[1]['B'], reverse=True):
+        print(' - .'+tld,': GdC :=',counts['gdc'],'( |A ∪ B| :=',counts['A'] + counts['B'],')')
+    print()
+if args.bootstrap:
+    with timer.phase(None, 'gdc_bootstrap'):
+        output['bootstrap'] = table.bootstrap_summary(args.bootstrap, seed=args.seed)
+    print('Bootstrap GdC (',args.bootstrap,'resamples ): mean',output['bootstrap']['mean'],'- std',output['bootstrap']['std'],'- 95% interval',output['bootstrap']['interval'])
+    print()
+if args.output:
+    with open(args.output, 'w') as outfile:
+        json.dump(output, outfile)
+    print('Generated GdC breakdowns file:',args.output)
 
-except Exception as e:
-    print(e)
-    print('[ERROR] - Some input files are missing. Please read the documentation.')
\ No newline at end of file
+timer.print_summary(timer.save_summary())
+timer.close()
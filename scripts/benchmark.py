@@ -0,0 +1,313 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# benchmark.py: Benchmark suite of the offline analysis stages, driven by the shipped evidence corpus (results/3.wec-evidences and results/3.theoretical_analysis.json).
+#     It times each stage and reports its throughput (websites/s and URLs/s) and the peak RSS of the process after it:
+#       - parse: reading the used fields of the real WEC inspections (see evidence_reader.py).
+#       - should_block: the compiled filter engine on each different cookie URL of the corpus, without verdict cache (see filter_engine.py).
+#       - cookies: tracking cookies classification, as the cookies-detector (with the verdict cache, see evidence_analysis.py).
+#       - beacons, hosts, fingerprinting: web beacons extraction, first/third-party hosts extraction and known fingerprinting scripts detection.
+#       - aggregation: statistics of both detectors (see evidence_stats.py).
+#       - gdc: GdC value and its breakdowns by category, by TLD and with bootstrap resamples (see gdc_engine.py).
+#     With '--sites' greater than the corpus, a synthetic corpus is generated: each extra website is a copy of a random real website (so the cookie, web
+#     beacon and consent distributions are the real ones) renamed to a new domain, so its first-party URLs are new and its third-party URLs are shared.
+#     The synthetic websites are generated in memory while they are analyzed (the generation is not timed), and the parse stage always reads the real files.
+#     The results are stored as a JSON file ('--output'), and can be compared with a previous run ('--baseline') to detect regressions.
+
+# Dependencies.
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+from evidence_reader import load_evidence, EVIDENCE_FIELDS
+from evidence_analysis import CookieAnalyzer, BeaconAnalyzer, HostAnalyzer, FingerprintAnalyzer, load_filter_engine, load_fingerprint_index
+from evidence_stats import cookie_table, beacon_table
+from gdc_engine import GdCTable
+from verdict_cache import VerdictCache
+
+# Default corpus files and output file.
+EVIDENCES_DIR = '../results/3.wec-evidences'
+THEORETICAL_ANALYSIS = '../results/3.theoretical_analysis.json'
+CATEGORIZED = '../results/1.categorized.json'
+OUTPUT_FILE = 'benchmark-results.json'
+
+# Version of the results format.
+RESULTS_VERSION = 1
+
+# Default tolerated slowdown of a stage throughput against the baseline (20%), number of runs of each stage (the fastest one is recorded), and
+#   minimum duration (seconds) of a stage to be checked for regressions (shorter stages are dominated by the scheduler noise). Bootstrap resamples of the gdc stage.
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_REPEAT = 3
+MIN_STAGE_SECONDS = 0.05
+GDC_RESAMPLES = 1000
+
+# Functions.
+
+# Returns the peak resident set size of the process, in MB.
+def peak_rss():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage/(1024*1024) if sys.platform == 'darwin' else usage/1024
+
+
+# Returns the current git commit of the repository (None if it is not available).
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# Returns the list of (website, inspection file) of the corpus, sorted by website.
+def corpus_inspections(path):
+    return [(website, os.path.join(path, website, 'inspection.json')) for website in sorted(os.listdir(path)) if os.path.isfile(os.path.join(path, website, 'inspection.json'))]
+
+
+# Returns the URLs checked by the cookies classification of an inspection (script files of the cookie stacks and cookie domains).
+def cookie_urls(data):
+    urls = 0
+    for cookie in data['cookies']:
+        if 'log' in cookie and 'stack' in cookie['log']:
+            urls += len(set(item['fileName'] for item in cookie['log']['stack'] if 'fileName' in item))
+        urls += 1
+    return urls
+
+
+# Synthetic corpus generator. The real websites are generated first (unchanged), then each extra website is a copy of a random real website (seeded)
+#   renamed to a new domain: every occurrence of the original domain on its evidences is replaced (e.g. 'google.es' -> 's1000-google.es'), keeping its TLD.
+class SyntheticCorpus:
+
+    def __init__(self, templates, sites, seed=0):
+        self.templates = templates
+        self.sites = sites
+        self.seed = seed
+        self.encoded = {website: json.dumps(data) for website, data in templates.items()}
+        self.patterns = {website: re.compile(r'(?<![\w-])'+re.escape(website)+r'(?![\w-])') for website in templates}
+
+    # Returns the (website, template website) pairs of the corpus.
+    def names(self):
+        real = list(self.templates)
+        rng = random.Random(self.seed)
+        for i in range(self.sites):
+            if i < len(real):
+                yield real[i], real[i]
+            else:
+                template = rng.choice(real)
+                yield 's'+str(i)+'-'+template, template
+
+    # Yields the (website, inspection data) pairs of the corpus.
+    def __iter__(self):
+        for website, template in self.names():
+            if website == template:
+                yield website, self.templates[template]
+            else:
+                yield website, json.loads(self.patterns[template].sub(website, self.encoded[template]))
+
+    # Returns a copy of a dict with the real websites as keys (e.g. the theoretical analysis) extended with the synthetic websites (the value of their template).
+    def extend(self, data):
+        return {website: data[template] for website, template in self.names() if template in data}
+
+
+# Calls 'function' 'repeat' times. Returns the time (seconds) of the fastest call, the least disturbed by the scheduler and other processes,
+#   and the value returned by the last call.
+def best_time(function, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, value
+
+
+# Returns the record of a stage.
+def stage_record(seconds, sites, urls=None):
+    record = {
+        'seconds': seconds,
+        'sites': sites,
+        'sites_per_sec': sites/seconds if seconds else None,
+        'peak_rss_mb': peak_rss()
+    }
+    if urls is not None:
+        record['urls'] = urls
+        record['urls_per_sec'] = urls/seconds if seconds else None
+    return record
+
+
+# Parse stage: reads the used fields of each real inspection ('rounds' times). Returns the stage record and the parsed inspections of the last round.
+def bench_parse(inspections, rounds=1, repeat=DEFAULT_REPEAT):
+    parsed = {}
+    size = sum(os.path.getsize(inspection) for website, inspection in inspections)
+
+    def parse():
+        for i in range(rounds):
+            for website, inspection in inspections:
+                parsed[website] = load_evidence(inspection, EVIDENCE_FIELDS)
+
+    seconds, _ = best_time(parse, repeat)
+    record = stage_record(seconds, len(inspections)*rounds)
+    record['mb_per_sec'] = size*rounds/(1024*1024)/seconds if seconds else None
+    return record, parsed
+
+
+# should_block stage: the compiled filter engine on each different cookie URL of the corpus (no verdict cache).
+def bench_should_block(filter_engine, templates, repeat=DEFAULT_REPEAT):
+    urls = {}
+    for data in templates.values():
+        for cookie in data['cookies']:
+            if 'log' in cookie and 'stack' in cookie['log']:
+                for item in cookie['log']['stack']:
+                    if 'fileName' in item:
+                        urls[item['fileName']] = True
+            urls[cookie['domain']] = True
+    seconds, blocked = best_time(lambda: sum(1 for url in urls if filter_engine.should_block(url)), repeat)
+    record = stage_record(seconds, len(templates), len(urls))
+    record['blocked'] = blocked
+    return record
+
+
+# Analysis stages: each website of the corpus is passed to the analyzers, timing each one ('repeat' runs with new analyzers, the fastest run of
+#   each analyzer is recorded). Returns the stage records and the analyzers of the last run.
+def bench_analysis(corpus, filter_engine, fingerprint_index, repeat=DEFAULT_REPEAT):
+    best = {}
+    for i in range(repeat):
+        analyzers = {
+            'cookies': CookieAnalyzer(filter_engine, VerdictCache(filter_engine.fingerprint)),
+            'beacons': BeaconAnalyzer(),
+            'hosts': HostAnalyzer(),
+            'fingerprinting': FingerprintAnalyzer(fingerprint_index)
+        }
+        seconds = {name: 0.0 for name in analyzers}
+        sites = 0
+        urls = {'cookies': 0, 'beacons': 0, 'fingerprinting': 0}
+        for website, data in corpus:
+            sites += 1
+            urls['cookies'] += cookie_urls(data)
+            urls['beacons'] += len(data['beacons'])
+            urls['fingerprinting'] += sum(len(analyzers['fingerprinting'].urls(kind, data)) for kind in ('cookies', 'beacons'))
+            for name, analyzer in analyzers.items():
+                start = time.perf_counter()
+                analyzer.analyze(website, data)
+                seconds[name] += time.perf_counter() - start
+        best = {name: min(seconds[name], best.get(name, seconds[name])) for name in analyzers}
+    seconds = best
+    records = {name: stage_record(seconds[name], sites, urls.get(name)) for name in analyzers}
+    records['cookies']['verdict_cache'] = analyzers['cookies'].verdict_cache.stats()
+    return records, analyzers
+
+
+# Aggregation stage: the statistics of both detectors.
+def bench_aggregation(analyzers, repeat=DEFAULT_REPEAT):
+
+    def aggregate():
+        cookie_table(analyzers['cookies'].cookie_dict, analyzers['hosts'].parties['cookies']).summary()
+        beacon_table(analyzers['beacons'].beacons_dict, analyzers['hosts'].parties['beacons']).summary()
+
+    seconds, _ = best_time(aggregate, repeat)
+    return stage_record(seconds, len(analyzers['cookies'].cookie_dict))
+
+
+# GdC stage: the per-website summary, the GdC value and its breakdowns (by category, by TLD and bootstrap resamples).
+def bench_gdc(analyzers, theoretical_analysis, categorized, repeat=DEFAULT_REPEAT):
+
+    def gdc():
+        table = GdCTable.from_results(theoretical_analysis, analyzers['cookies'].cookie_dict, analyzers['beacons'].beacons_dict)
+        result = table.gdc()
+        categories = table.by_category(categorized)
+        tlds = table.by_tld()
+        table.bootstrap_summary(GDC_RESAMPLES, seed=0)
+        return table, result, categories, tlds
+
+    seconds, (table, result, categories, tlds) = best_time(gdc, repeat)
+    record = stage_record(seconds, len(table.sites))
+    record['gdc'] = result['gdc']
+    record['breakdowns'] = len(categories) + len(tlds) + 1
+    return record
+
+
+# Returns the regressions of the results against a baseline: stages whose websites/s throughput is more than 'tolerance' lower.
+#   Stages shorter than 'min_seconds' (on the results or on the baseline) are not checked.
+def regressions(results, baseline, tolerance=DEFAULT_TOLERANCE, min_seconds=MIN_STAGE_SECONDS):
+    found = []
+    for name, record in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or not base.get('sites_per_sec') or not record.get('sites_per_sec'):
+            continue
+        if record['seconds'] < min_seconds or base['seconds'] < min_seconds:
+            continue
+        ratio = record['sites_per_sec']/base['sites_per_sec']
+        if ratio < 1 - tolerance:
+            found.append({'stage': name, 'sites_per_sec': record['sites_per_sec'], 'baseline_sites_per_sec': base['sites_per_sec'], 'ratio': ratio})
+    return found
+
+
+# Main code: run all the stages and store the results.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the offline analysis stages on the shipped evidence corpus (optionally scaled with synthetic websites).')
+    parser.add_argument('--evidences', default=EVIDENCES_DIR, help='Folder of the WEC inspections of the corpus.')
+    parser.add_argument('--theoretical-analysis', default=THEORETICAL_ANALYSIS, help='Theoretical analysis of the corpus websites.')
+    parser.add_argument('--categorized', default=CATEGORIZED, help='Categorization of the corpus websites.')
+    parser.add_argument('--sites', type=int, default=None, help='Number of websites of the analyzed corpus (extra websites are synthetic copies of the real ones). Default: the real corpus.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic corpus.')
+    parser.add_argument('--parse-rounds', type=int, default=1, help='Number of times the real inspections are parsed on the parse stage.')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='JSON file where the results are stored.')
+    parser.add_argument('--baseline', default=None, help='Results of a previous run: exit with an error if a stage is slower (see --tolerance).')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Tolerated throughput slowdown of a stage against the baseline (fraction).')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Number of runs of each stage (the fastest one is recorded).')
+    parser.add_argument('--min-seconds', type=float, default=MIN_STAGE_SECONDS, help='Stages shorter than this (seconds) are not checked for regressions.')
+    args = parser.parse_args()
+
+    inspections = corpus_inspections(args.evidences)
+    with open(args.theoretical_analysis) as f:
+        theoretical_analysis = json.load(f)
+    with open(args.categorized) as f:
+        categorized = json.load(f)
+    filter_engine = load_filter_engine()
+    fingerprint_index = load_fingerprint_index()
+
+    stages = {}
+    stages['parse'], templates = bench_parse(inspections, args.parse_rounds, args.repeat)
+    stages['should_block'] = bench_should_block(filter_engine, templates, args.repeat)
+    corpus = SyntheticCorpus(templates, args.sites if args.sites is not None else len(templates), args.seed)
+    analysis_stages, analyzers = bench_analysis(corpus, filter_engine, fingerprint_index, args.repeat)
+    stages.update(analysis_stages)
+    stages['aggregation'] = bench_aggregation(analyzers, args.repeat)
+    stages['gdc'] = bench_gdc(analyzers, corpus.extend(theoretical_analysis), corpus.extend(categorized), args.repeat)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'real_sites': len(templates), 'sites': corpus.sites, 'seed': args.seed},
+        'stages': stages,
+        'repeat': args.repeat,
+        'peak_rss_mb': peak_rss()
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('corpus') != results['corpus']:
+            print('[WARN] - The baseline was run on another corpus',baseline.get('corpus'),', regressions not checked')
+        else:
+            results['regressions'] = regressions(results, baseline, args.tolerance, args.min_seconds)
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=2)
+
+    print('Corpus:',corpus.sites,'websites (',len(templates),'real )')
+    for name, record in stages.items():
+        line = ' - '+name+': '+format(record['seconds'], '.3f')+' s, '+format(record['sites_per_sec'] or 0, '.1f')+' websites/s'
+        if 'urls_per_sec' in record:
+            line += ', '+format(record['urls_per_sec'] or 0, '.1f')+' URLs/s'
+        print(line+', peak RSS '+format(record['peak_rss_mb'], '.1f')+' MB')
+    print('Generated benchmark results file:',args.output)
+    if results.get('regressions'):
+        for regression in results['regressions']:
+            print('[ERROR] - Regression on stage',regression['stage'],':',format(regression['sites_per_sec'], '.1f'),'websites/s (baseline',format(regression['baseline_sites_per_sec'], '.1f'),')')
+        sys.exit(1)
@@ -0,0 +1,142 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# browser_pool.py: Pool of Chrome drivers shared by the selenium scripts (policy-detector and consent-detector). Starting a browser is a large part of the time
+#     spent on each website, so the drivers are kept alive across websites. Between uses the cookies, storage and extra windows are removed, so every website
+#     is still visited as with a new browser. Drivers are recycled after a number of pages or when they crash.
+
+# Dependencies.
+import time
+from queue import Queue, Empty
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+# Default number of pages visited by a driver before it is recycled.
+DEFAULT_MAX_PAGES = 50
+
+# Functions.
+
+# Creates a new headless Chrome driver (same configuration used by the selenium scripts).
+def new_driver():
+    chrome_options = Options()
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--start-maximized')
+    driver = webdriver.Chrome(options=chrome_options,executable_path='chromium.chromedriver')
+    driver.set_page_load_timeout(10)
+    driver.set_window_size(1920, 1080)
+    return driver
+
+
+# Closes a driver ignoring errors (the browser may have crashed).
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+# Returns true if the driver still answers.
+def is_alive(driver):
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
+
+
+# Removes the website state of a driver: extra windows, cookies, storage of the visited origins and cache.
+#   It raises an exception if the driver does not answer (crashed browser).
+def reset_driver(driver):
+    handles = driver.window_handles
+    origins = set()
+    for handle in reversed(handles):
+        driver.switch_to.window(handle)
+        try:
+            origin = driver.execute_script('return window.location.origin;')
+            if origin and origin != 'null':
+                origins.add(origin)
+            driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        except Exception:
+            pass
+        if handle != handles[0]:
+            driver.close()
+    driver.switch_to.window(handles[0])
+    driver.get('about:blank')
+    try:
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+        for origin in origins:
+            driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+    except Exception:
+        # Drivers without the DevTools protocol: only the cookies of the current page can be removed.
+        driver.delete_all_cookies()
+
+
+# Pool of reusable drivers.
+#   'size' is the maximum number of idle drivers kept alive and 'max_pages' the number of uses of a driver before it is recycled.
+#   With a 'timer' (see phase_timer.py), the browser launches and resets are recorded for each website.
+class BrowserPool:
+
+    def __init__(self, size=1, max_pages=DEFAULT_MAX_PAGES, factory=new_driver, timer=None):
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = factory
+        self.timer = timer
+        self.idle = Queue()
+        self.pages = {}
+        self.created = 0
+        self.recycled = 0
+
+    # Returns an idle driver, or a new one if there is no idle driver.
+    def acquire(self, website=None):
+        try:
+            driver = self.idle.get_nowait()
+        except Empty:
+            start = time.perf_counter()
+            driver = self.factory()
+            if self.timer is not None:
+                self.timer.record(website, 'browser_launch', time.perf_counter() - start)
+            self.created += 1
+        self.pages[id(driver)] = self.pages.get(id(driver), 0) + 1
+        return driver
+
+    # Returns a driver to the pool after cleaning its state. Crashed or used up drivers are closed (a new one will be created when needed).
+    def release(self, driver, crashed=False, website=None):
+        used_up = self.pages.get(id(driver), 0) >= self.max_pages
+        if not crashed and not used_up:
+            start = time.perf_counter()
+            try:
+                reset_driver(driver)
+            except Exception:
+                crashed = True
+            if self.timer is not None:
+                self.timer.record(website, 'browser_reset', time.perf_counter() - start)
+        if crashed or used_up or self.idle.qsize() >= self.size:
+            self.pages.pop(id(driver), None)
+            self.recycled += 1
+            quit_driver(driver)
+        else:
+            self.idle.put(driver)
+
+    # Context manager that acquires a driver and releases it when done ('website' is the website visited with it, for the timer).
+    @contextmanager
+    def browser(self, website=None):
+        driver = self.acquire(website)
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, crashed=not is_alive(driver), website=website)
+            raise
+        else:
+            self.release(driver, website=website)
+
+    # Closes all the idle drivers.
+    def close(self):
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except Empty:
+                break
+            self.pages.pop(id(driver), None)
+            quit_driver(driver)
+
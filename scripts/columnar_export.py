@@ -0,0 +1,122 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# columnar_export.py: Columnar (Apache Parquet) export of the evidence analysis results (see evidence_analysis.py). The nested result JSON files are flattened
+#     into tables with one row for each cookie, web beacon or host, so the consumers can read only the columns they need and filter rows while reading
+#     (predicate pushdown) instead of parsing the whole JSON files. It needs the 'pyarrow' library (optional, only used on the columnar output mode).
+#     Tables:
+#       - cookies: site, name, domain, expires, expiresDays (null if the cookie does not have it), tracking, files.
+#       - beacons: site, listName, url.
+#       - fingerprinting: site, url, match ('url' or 'normalized'), scripts, websites (known fingerprinting scripts, see fingerprint_index.py).
+#       - hosts: site, kind ('cookies' or 'beacons'), party ('firstParty' or 'thirdParty'), domain.
+#       - sites: site and number of cookies and tracking cookies (or web beacons) of every analyzed website, including the ones without any row on the other tables.
+
+# Dependencies.
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Compression codec of the Parquet files.
+COMPRESSION = 'zstd'
+
+# Functions.
+
+# Returns true if the columnar output mode can be used (the 'pyarrow' library is installed).
+def available():
+    return pa is not None
+
+
+# Returns the tables of the cookies results (cookie-results.json data): the cookies table and the sites table.
+def cookie_tables(cookie_dict):
+    columns = {'site': [], 'name': [], 'domain': [], 'expires': [], 'expiresDays': [], 'tracking': [], 'files': []}
+    sites = {'site': [], 'cookies': [], 'tracking': []}
+    for website, cookies in cookie_dict.items():
+        for cookie in cookies:
+            columns['site'].append(website)
+            columns['name'].append(cookie['name'])
+            columns['domain'].append(cookie['domain'])
+            columns['expires'].append(cookie['expires'])
+            columns['expiresDays'].append(cookie.get('expiresDays'))
+            columns['tracking'].append(cookie['tracking'])
+            columns['files'].append(cookie['files'])
+        sites['site'].append(website)
+        sites['cookies'].append(len(cookies))
+        sites['tracking'].append(sum(1 for cookie in cookies if cookie['tracking']))
+    cookies_table = pa.table(columns, schema=pa.schema([
+        ('site', pa.string()),
+        ('name', pa.string()),
+        ('domain', pa.string()),
+        ('expires', pa.float64()),
+        ('expiresDays', pa.float64()),
+        ('tracking', pa.bool_()),
+        ('files', pa.list_(pa.string()))
+    ]))
+    sites_table = pa.table(sites, schema=pa.schema([('site', pa.string()), ('cookies', pa.int32()), ('tracking', pa.int32())]))
+    return cookies_table, sites_table
+
+
+# Returns the tables of the web beacons results (beacons-results.json data): the beacons table and the sites table.
+def beacon_tables(beacons_dict):
+    columns = {'site': [], 'listName': [], 'url': []}
+    sites = {'site': [], 'beacons': []}
+    for website, beacons in beacons_dict.items():
+        for beacon in beacons:
+            columns['site'].append(website)
+            columns['listName'].append(beacon['listName'])
+            columns['url'].append(beacon['url'])
+        sites['site'].append(website)
+        sites['beacons'].append(len(beacons))
+    beacons_table = pa.table(columns, schema=pa.schema([('site', pa.string()), ('listName', pa.string()), ('url', pa.string())]))
+    sites_table = pa.table(sites, schema=pa.schema([('site', pa.string()), ('beacons', pa.int32())]))
+    return beacons_table, sites_table
+
+
+# Returns the fingerprinting table from the findings of a kind of evidence (fingerprinting-results.json data).
+def fingerprinting_table(findings):
+    columns = {'site': [], 'url': [], 'match': [], 'scripts': [], 'websites': []}
+    for website, website_findings in findings.items():
+        for finding in website_findings:
+            columns['site'].append(website)
+            columns['url'].append(finding['url'])
+            columns['match'].append(finding['match'])
+            columns['scripts'].append(finding['scripts'])
+            columns['websites'].append(finding['websites'])
+    return pa.table(columns, schema=pa.schema([
+        ('site', pa.string()),
+        ('url', pa.string()),
+        ('match', pa.string()),
+        ('scripts', pa.list_(pa.string())),
+        ('websites', pa.int32())
+    ]))
+
+
+# Returns the hosts table of a kind of evidence ('cookies' or 'beacons') from its domain results (domain-cookie-results.json or domain-beacons-results.json data).
+def hosts_table(parties, kind):
+    columns = {'site': [], 'kind': [], 'party': [], 'domain': []}
+    for website, website_parties in parties.items():
+        for party in ('firstParty', 'thirdParty'):
+            for domain in website_parties[party]:
+                columns['site'].append(website)
+                columns['kind'].append(kind)
+                columns['party'].append(party)
+                columns['domain'].append(domain)
+    return pa.table(columns, schema=pa.schema([('site', pa.string()), ('kind', pa.string()), ('party', pa.string()), ('domain', pa.string())]))
+
+
+# Stores a table as a Parquet file. It is written to a temporary file and renamed, so a reader never gets a partial file.
+def write_table(path, table):
+    tmp_path = path+'.'+str(os.getpid())+'.tmp'
+    pq.write_table(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+
+
+# Reads a Parquet table (or a list of them with the same schema), only with the given columns and the rows matching the filters
+#   (e.g. [('tracking', '=', True)], see 'pyarrow.parquet.read_table').
+def read_table(paths, columns=None, filters=None):
+    if isinstance(paths, list):
+        return pa.concat_tables([pq.read_table(path, columns=columns, filters=filters) for path in paths])
+    return pq.read_table(paths, columns=columns, filters=filters)
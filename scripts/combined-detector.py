@@ -0,0 +1,347 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# combined-detector.py: It performs the work of the consent-detector and the policy-detector scripts with a single crawl session for each website. The homepage is loaded once:
+#     the CMP first layer screenshot is taken, the page is scanned once for all the keyword groups and the privacy and cookie policy links are opened in new tabs (the homepage
+#     stays loaded on its tab). Then the popups are closed for the main page screenshot and the policies without a link (e.g. buttons) are searched by clicking them on the
+#     homepage tab, as the policy-detector does (if a click does not open a new window, the homepage is loaded again with 'driver.get'). The CMP second layer is opened last:
+#     if the homepage was changed by the previous clicks (closing the popups usually accepts the CMP), the website cookies and storage are cleaned and the homepage is loaded
+#     again, so the second layer is searched on the same state as the first layer. It generates the same outputs as both scripts: the folders "consent-detector-results" and
+#     "policy-detector-results" (screenshots, journals, see crawl_journal.py) and the file "policy_detected.json", with one homepage load for each website instead of three
+#     (two or three when the homepage has to be loaded again).
+#     With '--queue', several workers (on several machines) share the websites of a work queue (see work_queue.py), merge their results with the "consent" and "policy" stages.
+# TFM algorithm implementation: detector de consentiment i detector de polítiques.
+
+
+# Dependencies.
+import os
+import shutil
+import json
+import time
+import argparse
+from pathlib import Path
+from reachability import probe_websites
+from browser_pool import BrowserPool, reset_driver, DEFAULT_MAX_PAGES
+from page_readiness import PageReadiness, DEFAULT_MAX_WAIT, DEFAULT_CLICK_WAIT
+from keyword_scanner import KeywordScanner
+from phase_timer import PhaseTimer, WEBSITE_PHASE
+from screenshot_store import ScreenshotStore, variants_available
+from crawl_journal import CrawlJournal
+from work_queue import start_worker, DEFAULT_BATCH, DEFAULT_LEASE
+
+# Policies searched on each website: keyword group of the scanner and name of the policy (screenshot '<name>_policy.png' and result key '<name>_policy').
+POLICIES = ['privacy', 'cookie']
+
+# JavaScript that returns the URL of the link of each candidate element (the element or its closest ancestor link), null if it is not a link.
+LINKS_JS = "return arguments[0].map(function(el) { var a = el.closest ? el.closest('a[href]') : null; return a ? a.href : null; });"
+
+# Functions.
+
+# Parses and returns the original sample JSON.
+def read_websites():
+    try:
+        with open('../original_sample.json') as f:
+            data = json.load(f)
+        return data
+    except Exception as e:
+        print(e)
+
+
+# Parses and returns the strings JSON.
+def read_strings():
+    try:
+        with open('../assets/strings.json') as f:
+            data = json.load(f)
+        return data
+    except Exception as e:
+        print(e)
+
+
+# Returns the HTTP(S) URLs of the links of the candidate elements (ranked order, without repetitions).
+def candidate_links(driver, elements):
+    links = []
+    for link in driver.execute_script(LINKS_JS, elements) if elements else []:
+        if link and link.startswith(('http://', 'https://')) and link not in links:
+            links.append(link)
+    return links
+
+
+# Reads the policy of the current page (text and URL) and performs its screenshot. Returns the policy object of the policy-detector results.
+def read_policy(driver, website, name, strings, store, timer):
+    privacy_object = {}
+    body = driver.find_element_by_tag_name('body')
+    privacy_object["status"] = 0
+    privacy_object["text"] = body.text
+    privacy_object["url"] = driver.current_url
+    with timer.phase(website, 'screenshot'):
+        store.capture(driver, "./policy-detector-results/"+website+"/"+name+"_policy.png", website)
+    if any(string in privacy_object["text"] for string in strings['old_policies_strings']):
+        privacy_object["old"] = True
+    else:
+        privacy_object["old"] = False
+    return privacy_object
+
+
+# Opens the policy link in a new tab, reads the policy and closes the tab (the homepage stays loaded on its tab).
+def read_policy_tab(driver, website, link, name, strings, readiness, store, timer):
+    main = driver.current_window_handle
+    handles = set(driver.window_handles)
+    driver.execute_script('window.open(arguments[0], "_blank");', link)
+    handle = [handle for handle in driver.window_handles if handle not in handles][0]
+    driver.switch_to.window(handle)
+    try:
+        with timer.phase(website, 'tab_load'):
+            readiness.page_ready(driver, website)
+        return read_policy(driver, website, name, strings, store, timer)
+    finally:
+        driver.close()
+        driver.switch_to.window(main)
+
+
+# Closes the windows opened by clicks or tabs and goes back to the homepage tab.
+def close_windows(driver, main):
+    for handle in driver.window_handles:
+        if handle != main:
+            driver.switch_to.window(handle)
+            driver.close()
+    driver.switch_to.window(main)
+
+
+# Loads the homepage again on the homepage tab (e.g. a click navigated away from it). With 'clean', the website cookies and storage are removed before
+#   (see browser_pool.py), so the page is loaded as on the first visit (e.g. with the CMP that was accepted by closing the popups).
+def reload_homepage(driver, website, homepage, readiness, timer, clean=False):
+    if clean:
+        reset_driver(driver)
+    with timer.phase(website, 'page_reload'):
+        driver.get(homepage)
+    readiness.page_ready(driver, website)
+
+
+# Function that opens the website once and performs the consent and policy detection (see the header). The browser is taken from the drivers 'pool', 'readiness'
+#   waits for the pages, the keywords are searched with the 'scanner' and the screenshots are written by the 'consent_store' and 'policy_store' screenshots stores.
+#   The 'timer' records the time of each phase. Returns the consent result (true if both CMP layers were found) and the policy-detector result of the website.
+def detect_website(url, website, strings, scanner, pool, readiness, consent_store, policy_store, timer):
+    first_ok = False
+    second_ok = False
+    policies = {name: {} for name in POLICIES}
+    with pool.browser(website) as driver:
+        try:
+            with timer.phase(website, 'page_load'):
+                driver.get(url)
+            readiness.page_ready(driver, website)
+            main = driver.current_window_handle
+            homepage = driver.current_url
+            with timer.phase(website, 'screenshot'):
+                consent_store.capture(driver, "./consent-detector-results/"+website+"/first-level.png", website)
+            first_ok = True
+            candidates = scanner.scan(driver, website, ['personalize'] + POLICIES)
+            # Policies: the first link that loads is kept (candidates are ranked, best first).
+            for name in POLICIES:
+                for link in candidate_links(driver, candidates[name]):
+                    try:
+                        policies[name] = read_policy_tab(driver, website, link, name, strings['policy-detector'], readiness, policy_store, timer)
+                        break
+                    except Exception as e:
+                        close_windows(driver, main)
+            # Main page without popups.
+            changed = False
+            for element in scanner.scan(driver, website, ['close_popups'])['close_popups']:
+                try:
+                    with timer.phase(website, 'click'):
+                        element.click()
+                    changed = True
+                except:
+                    pass
+            readiness.dom_quiet(driver, website)
+            with timer.phase(website, 'screenshot'):
+                policy_store.capture(driver, "./policy-detector-results/"+website+"/mainpage.png", website)
+            # Policies without a link: click the candidates on the homepage tab. The first click that opens a window or changes the URL is kept.
+            reloaded = False
+            for name in POLICIES:
+                if policies[name]:
+                    continue
+                elements = scanner.scan(driver, website, [name])[name]
+                tried = 0
+                while tried < len(elements):
+                    element = elements[tried]
+                    tried += 1
+                    try:
+                        driver.execute_script("window.scroll(0, %s)" % (element.location['y']))
+                        readiness.dom_quiet(driver, website)
+                        effect = readiness.click(driver, website, element)
+                        driver.switch_to.window(effect if isinstance(effect, str) else driver.window_handles[-1])
+                        readiness.page_ready(driver, website)
+                        policies[name] = read_policy(driver, website, name, strings['policy-detector'], policy_store, timer)
+                        if effect:
+                            break
+                    except Exception as e:
+                        pass
+                    finally:
+                        close_windows(driver, main)
+                        # The reload makes the candidates stale: they are scanned again (same ranking, the tried ones are skipped).
+                        if driver.current_url != homepage:
+                            reload_homepage(driver, website, homepage, readiness, timer)
+                            reloaded = True
+                            elements = scanner.scan(driver, website, [name])[name]
+            # CMP second layer (last, it changes the page): the first personalize button that opens a window or changes the URL is kept. If the homepage
+            #   was changed, it is loaded again without the website state. After any reload, the personalize buttons are scanned again.
+            if changed or driver.current_url != homepage:
+                reload_homepage(driver, website, homepage, readiness, timer, clean=True)
+                reloaded = True
+            if reloaded:
+                main = driver.current_window_handle
+                candidates = scanner.scan(driver, website, ['personalize'])
+            for element in candidates['personalize']:
+                try:
+                    driver.execute_script("window.scroll(0, %s)" % (element.location['y']))
+                    readiness.dom_quiet(driver, website)
+                    effect = readiness.click(driver, website, element)
+                    driver.switch_to.window(effect if isinstance(effect, str) else driver.window_handles[-1])
+                    readiness.page_ready(driver, website)
+                    with timer.phase(website, 'screenshot'):
+                        consent_store.capture(driver, "./consent-detector-results/"+website+"/second-level.png", website)
+                    second_ok = True
+                    if effect:
+                        break
+                except Exception as e:
+                    pass
+        except Exception as e:
+            pass
+
+    website_value = {}
+    for name in POLICIES:
+        if "status" not in policies[name]:
+            policies[name]["status"] = 1
+        website_value[name+'_policy'] = policies[name]
+    return first_ok and second_ok, website_value
+
+
+# Script arguments.
+parser = argparse.ArgumentParser(description='Detects the user consent forms (first and second layer), the privacy policy and the cookie policy of the original sample websites loading each homepage once.')
+parser.add_argument('--recycle-after', type=int, default=DEFAULT_MAX_PAGES, help='Number of pages visited by a browser before it is restarted.')
+parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT, help='Maximum seconds waiting for a page to be ready.')
+parser.add_argument('--click-wait', type=float, default=DEFAULT_CLICK_WAIT, help='Maximum seconds waiting for the effect of a click (new window, page change or DOM change).')
+parser.add_argument('--trace', default='combined-detector-timings.jsonl', help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+parser.add_argument('--screenshot-variants', type=int, nargs='+', default=[], help='Widths (pixels) of the downscaled WebP variants of each screenshot (see screenshot_store.py), it needs the pillow library.')
+parser.add_argument('--resume', action='store_true', help='Resume an interrupted run: the results are kept and the websites already on both journals are skipped (see crawl_journal.py).')
+parser.add_argument('--queue', default=None, help='Sharded mode: SQLite work queue file shared by several workers (see work_queue.py). The results are written to the worker folder.')
+parser.add_argument('--worker', default=None, help='Sharded mode: name of the worker (host name and process id by default).')
+parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='Sharded mode: number of websites claimed at once.')
+parser.add_argument('--lease', type=int, default=DEFAULT_LEASE, help='Sharded mode: seconds before the websites claimed by a dead worker are returned to the queue.')
+args = parser.parse_args()
+if args.screenshot_variants and not variants_available():
+    parser.error('the screenshot variants need the pillow library (pip3 install pillow)')
+
+# Main code.
+websites = read_websites()['websites']
+strings = read_strings()['strings']
+
+# Sharded mode: the websites are claimed from the work queue and the results are written to the worker folder.
+queue = start_worker(args.queue, args.worker, websites, args.lease) if args.queue else None
+
+# Create output directories (kept on the resume mode).
+for directory in ['consent-detector-results', 'policy-detector-results']:
+    dirpath = Path(directory)
+    if dirpath.exists() and dirpath.is_dir() and not args.resume:
+        shutil.rmtree(dirpath)
+    os.makedirs(directory, exist_ok=True)
+
+# Journals of the processed websites, the same ones of the consent-detector and policy-detector scripts (on the resume mode, the websites already on both are skipped).
+consent_journal = CrawlJournal('./consent-detector-results/journal.jsonl', args.resume)
+policy_journal = CrawlJournal('./policy-detector-results/journal.jsonl', args.resume)
+pending = [website for website in websites if website not in consent_journal or website not in policy_journal]
+if args.resume:
+    print('Resuming: ',len(websites)-len(pending),'websites already processed.')
+
+# Time of each phase (reachability probe, browser launch, page and tab loads, waits, keyword scans, clicks, screenshots) of each website.
+timer = PhaseTimer(args.trace, append=args.resume)
+# Keyword groups searched on the pages (all of them in a single pass of the DOM).
+scanner = KeywordScanner({
+    'personalize': (strings['consent-detector']['personalize_strings'], strings['consent-detector']['no_personalize_strings']),
+    'close_popups': (strings['policy-detector']['close_popups_strings'], []),
+    'privacy': (strings['policy-detector']['privacy_policy_detect'], []),
+    'cookie': (strings['policy-detector']['cookie_policy_detect'], [])
+}, timer)
+# Screenshots are written by background threads to the content-addressed stores of both results folders (identical screenshots are stored once).
+consent_store = ScreenshotStore('./consent-detector-results/screenshots', args.screenshot_variants, timer)
+policy_store = ScreenshotStore('./policy-detector-results/screenshots', args.screenshot_variants, timer)
+# Browsers are reused across websites (their cookies, storage and windows are cleaned between pages).
+pool = BrowserPool(max_pages=args.recycle_after, timer=timer)
+# Pages are ready when they are loaded, the network is idle and the DOM is stable (instead of fixed sleeps).
+readiness = PageReadiness(max_wait=args.max_wait, click_wait=args.click_wait, timer=timer)
+
+# Progress of the crawl (on the sharded mode, over the websites claimed by this worker so far).
+total = len(websites) if queue is None else 0
+current = total-len(pending)+1 if queue is None else 1
+
+# Journals a processed website (and, on the sharded mode, completes it on the work queue). It is called once the screenshots of both stores are on disk.
+def finish(website, consent_status, policy_status, website_value=None):
+    consent_journal.append(website, consent_status)
+    policy_journal.append(website, policy_status, website_value)
+    if queue is not None:
+        queue.complete(website, policy_status)
+
+# On the sharded mode, the websites are processed in the claimed batches. The reachability of all the websites of a batch is checked at once
+#   (shared cache with the other crawl scripts).
+for batch in queue.batches(args.batch) if queue is not None else [pending]:
+    if queue is not None:
+        total += len(batch)
+    online_websites = probe_websites(['https://'+website for website in batch], timer=timer)
+    for website in batch:
+        url = 'https://'+website
+        os.makedirs('consent-detector-results/'+website, exist_ok=True)
+        if online_websites[url]:
+            os.makedirs('policy-detector-results/'+website, exist_ok=True)
+            with timer.phase(website, WEBSITE_PHASE):
+                ok, website_value = detect_website(url, website, strings, scanner, pool, readiness, consent_store, policy_store, timer)
+            if ok:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): CMP screenshots performed.')
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): Problem performing screenshots.')
+            if website_value['privacy_policy']['status'] == 0:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): Has privacy policy.')
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): No privacy policy detected.')
+            if website_value['cookie_policy']['status'] == 0:
+                print('[SUCCESS] - Website',website,'(',current,'/',total,'): Has independent cookie policy.')
+            else:
+                print('[WARN] - Website',website,'(',current,'/',total,'): No independent cookie policy detected.')
+            # The policy store call runs after the consent screenshots are written, and 'finish' after the policy screenshots are written.
+            consent_store.then(policy_store.then, finish, website, 'ok' if ok else 'warn', 'ok', website_value)
+        else:
+            print('[ERROR] - Website',website,'(',current,'/',total,'): Impossible to establish a connection.')
+            consent_store.then(policy_store.then, finish, website, 'offline', 'offline')
+        current += 1
+
+pool.close()
+consent_store.close()
+policy_store.close()
+consent_journal.close()
+if queue is not None:
+    queue.close()
+    queue.print_status()
+
+# Compile the result json file from the journal.
+policy_journal.compile("policy_detected.json")
+policy_journal.close()
+offline_websites = policy_journal.websites('offline')
+
+# Store the wait times and the keyword scan times of each website (on both results folders).
+for directory in ['consent-detector-results', 'policy-detector-results']:
+    readiness.save("./"+directory+"/wait-times.json")
+    scanner.save("./"+directory+"/scan-times.json")
+wait_totals = readiness.totals()
+if len(wait_totals) > 0:
+    print('\nMean wait time for each website:',sum(wait_totals.values())/len(wait_totals),'seconds (see "policy-detector-results/wait-times.json")')
+print('Mean keyword scan time for each page:',scanner.mean_scan_ms(),'ms (see "policy-detector-results/scan-times.json")')
+
+# Screenshots storage (unique images and written bytes).
+consent_store.print_stats()
+policy_store.print_stats()
+
+# Store the phase timings summary (p50/p95/p99 of each phase and slowest websites).
+timer.print_summary(timer.save_summary())
+timer.close()
+
+print('\nOffline websites detected (',len(offline_websites),'): ',offline_websites)
+print('Screenshots available in folders: "consent-detector-results" and "policy-detector-results"')
+print('Generated policies file: "policy_detected.json"')
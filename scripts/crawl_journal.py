@@ -0,0 +1,100 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# crawl_journal.py: Append-only journal of the crawl scripts (website-categorizer, policy-detector, consent-detector and wec-executor). Each website is
+#     written to the journal (JSONL file, one line for each website) as soon as it is processed, and the line is flushed to disk (fsync), so a crashed or
+#     interrupted crawl keeps all the completed websites. With the resume mode ('--resume' argument of the scripts) the journal is kept and the websites
+#     already on it are skipped. The result JSON files are compiled from the journal reading it line by line (the results are not kept in memory).
+#     Each line has the website, its status (e.g. 'ok', 'warn', 'offline' or 'error') and, for the scripts with a result JSON file, its result.
+
+# Dependencies.
+import os
+import json
+import threading
+
+# Functions.
+
+# Journal of the processed websites on the 'path' JSONL file. Without 'resume', the journal is created again.
+#   On the resume mode, the existing lines are read: only the status of each website is kept in memory. An incomplete last line (the crawl was killed
+#   while writing it) is removed, and that website will be processed again.
+class CrawlJournal:
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.status = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if resume and os.path.isfile(path):
+            self.status = self.read()
+        self.file = open(path, 'a' if resume else 'w')
+
+    # Reads the status of each website of the journal, truncating it after the last complete line.
+    def read(self):
+        status = {}
+        valid = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                status[entry['site']] = entry['status']
+                valid += len(line)
+        if valid < os.path.getsize(self.path):
+            print('[WARN] - Incomplete journal line removed from "'+self.path+'"')
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid)
+        return status
+
+    # Returns true if the website is on the journal.
+    def __contains__(self, website):
+        return website in self.status
+
+    # Returns the number of websites on the journal.
+    def __len__(self):
+        return len(self.status)
+
+    # Returns the websites of the list that are not on the journal yet (keeping their order).
+    def pending(self, websites):
+        return [website for website in websites if website not in self.status]
+
+    # Returns the websites of the journal with the given status (journal order).
+    def websites(self, status):
+        return [website for website, website_status in self.status.items() if website_status == status]
+
+    # Appends a processed website with its status and result (None if the script has no result file). The line is on disk when it returns.
+    def append(self, website, status, result=None):
+        entry = {'site': website, 'status': status}
+        if result is not None:
+            entry['result'] = result
+        line = json.dumps(entry)+'\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.status[website] = status
+
+    # Compiles the result JSON file (the websites as keys and their results as values, journal order) reading the journal line by line.
+    #   Websites without result are not included. The file is written to a temporary file and renamed, so a reader never gets a partial file.
+    def compile(self, output):
+        with self.lock:
+            self.file.flush()
+        tmp_path = output+'.tmp'
+        written = set()
+        with open(self.path) as f, open(tmp_path, 'w') as outfile:
+            outfile.write('{')
+            for line in f:
+                entry = json.loads(line)
+                if 'result' not in entry or entry['site'] in written:
+                    continue
+                outfile.write((', ' if written else '')+json.dumps(entry['site'])+': '+json.dumps(entry['result']))
+                written.add(entry['site'])
+            outfile.write('}')
+        os.replace(tmp_path, output)
+        return len(written)
+
+    # Closes the journal file.
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
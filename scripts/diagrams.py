@@ -0,0 +1,146 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# diagrams.py: Diagram rendering stage of the cookies-detector and web-beacons-detector scripts. The diagrams are drawn from the statistics summary
+#     (see evidence_stats.py) of the saved results, each one on its own figure (no shared 'pyplot' state), so the independent diagrams are rendered in parallel
+#     worker processes. The plotting libraries are only imported by the processes that draw. Executed as a script ('python3 diagrams.py'), it renders the diagrams
+#     of the results stored on the "cookies-detector-results" and "beacons-detector-results" folders (e.g. after running the detectors with '--no-diagrams').
+
+# Dependencies.
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from evidence_stats import cookie_table, beacon_table
+
+# Result folders and files of the detectors (see evidence_analysis.py).
+COOKIES_DIR = './cookies-detector-results'
+BEACONS_DIR = './beacons-detector-results'
+RESULT_FILES = {
+    'cookies': (COOKIES_DIR+'/cookie-results.json', COOKIES_DIR+'/domain-cookie-results.json'),
+    'beacons': (BEACONS_DIR+'/beacons-results.json', BEACONS_DIR+'/domain-beacons-results.json')
+}
+
+# Default number of worker processes (one for each diagram of a detector).
+DEFAULT_PROCESSES = 4
+
+# Define the color palette for diagrams.
+colors=[
+    "#88CCEE",
+    "#CC6677",
+    "#DDCC77",
+    "#117733",
+    "#AA4499",
+    "#44AA99",
+    "#999933",
+    "#882255",
+    "#661100",
+    "#6699CC",
+    "#888888"
+]
+
+# Functions.
+
+# Returns a new figure (not managed by 'pyplot') with the style of the diagrams. The plotting libraries are imported here, only when drawing.
+def new_figure(width, height):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    return Figure(figsize=(width, height))
+
+
+# Function that draws a horizontal bar diagram: 'bars' is a list of (label, value) pairs, drawn from top to bottom.
+def draw_bars(path, bars, xlabel, width, height, xlabel_size='xx-large'):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    with sns.axes_style("whitegrid"), plt.rc_context({'axes.axisbelow': True}):
+        fig = new_figure(width, height)
+        ax = fig.add_subplot()
+        ax.barh(y=[label for label, value in bars], width=[value for label, value in bars], align="center",color=colors)
+
+        # Add title
+        ax.set_xlabel(xlabel,fontsize=xlabel_size)
+        ax.tick_params(axis='y', labelsize='x-large')
+        ax.invert_yaxis()
+
+        fig.savefig(path, format="PDF", bbox_inches='tight')
+    return path
+
+
+# Function that draws a frequency histogram diagram from the precomputed histogram bins, with a dashed line on the mean ('style' is an optional seaborn style).
+def draw_histogram(path, histogram, mean, xlabel, style=None):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    with sns.axes_style(style), plt.rc_context({'axes.axisbelow': True}):
+        fig = new_figure(12, 10)
+        ax = fig.add_subplot()
+        ax.hist(histogram['edges'][:-1], bins=histogram['edges'], weights=histogram['counts'], color=colors[0])
+        ax.set_xlabel(xlabel,fontsize=20)
+        ax.set_ylabel("Websites",fontsize=20)
+        ax.axvline(mean, color='k', linestyle='dashed', linewidth=1)
+        fig.savefig(path, format="PDF", bbox_inches='tight')
+    return path
+
+
+# Returns the diagrams of the cookies-detector results, as a list of (function, arguments) drawing tasks:
+#   cookie types, tracking cookies histogram, top 10 websites with more tracking cookies and top 10 tracking domains.
+def cookie_diagrams(summary):
+    # To analyze the websites that use cookies and what types (sorted).
+    consent_results = {
+        'Tracking cookies': summary['with_value'],
+        'Third-party cookies': summary['with_third_party'],
+        'Cookies': summary['with_hosts'],
+        'Without cookies': summary['without_hosts']
+    }
+    groups = sorted(consent_results.items(), key=lambda item: item[1], reverse=True)
+    return [
+        (draw_bars, (COOKIES_DIR+'/diagram-cookie-types.pdf', groups, "Websites", 12, 2, 'x-large')),
+        (draw_histogram, (COOKIES_DIR+'/diagram-tracking-cookies-histogram.pdf', summary['histogram'], summary['mean'], "Tracking cookies", "whitegrid")),
+        (draw_bars, (COOKIES_DIR+'/diagram-top10-website-tracking-cookies.pdf', summary['top_sites'], "Tracking cookies", 12, 6)),
+        (draw_bars, (COOKIES_DIR+'/diagram-top10-tracking-domains.pdf', summary['top_domains'], "Websites", 12, 6))
+    ]
+
+
+# Returns the diagrams of the web-beacons-detector results, as a list of (function, arguments) drawing tasks:
+#   web beacons histogram, top 10 websites with more web beacons and top 10 tracking domains.
+def beacon_diagrams(summary):
+    return [
+        (draw_histogram, (BEACONS_DIR+'/diagram-beacons-histogram.pdf', summary['histogram'], summary['mean'], "Web beacons")),
+        (draw_bars, (BEACONS_DIR+'/diagram-top10-website-beacons.pdf', summary['top_sites'], "Web beacons", 12, 6)),
+        (draw_bars, (BEACONS_DIR+'/diagram-top10-tracking-domains.pdf', summary['top_domains'], "Websites", 12, 6))
+    ]
+
+
+# Returns the statistics summary of the saved results of a detector ('cookies' or 'beacons').
+def load_summary(kind):
+    results_file, domains_file = RESULT_FILES[kind]
+    with open(results_file) as f:
+        results = json.load(f)
+    with open(domains_file) as f:
+        parties = json.load(f)
+    table = cookie_table(results, parties) if kind == 'cookies' else beacon_table(results, parties)
+    return table.summary()
+
+
+# Draws the diagrams (list of drawing tasks), each one on a worker process (on this process if 'processes' is 1).
+#   Returns the list of generated files.
+def render(tasks, processes=DEFAULT_PROCESSES):
+    if processes <= 1 or len(tasks) <= 1:
+        return [function(*arguments) for function, arguments in tasks]
+    with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as executor:
+        futures = [executor.submit(function, *arguments) for function, arguments in tasks]
+        return [future.result() for future in futures]
+
+
+# Main code: render the diagrams of the saved results (when executed as a script).
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Renders the diagrams of the cookies-detector and web-beacons-detector saved results.')
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES, help='Number of worker processes drawing the diagrams.')
+    parser.add_argument('--only', choices=['cookies', 'beacons'], default=None, help='Only render the diagrams of one detector.')
+    args = parser.parse_args()
+
+    tasks = []
+    if args.only != 'beacons':
+        tasks += cookie_diagrams(load_summary('cookies'))
+    if args.only != 'cookies':
+        tasks += beacon_diagrams(load_summary('beacons'))
+    for path in render(tasks, args.processes):
+        print(' - Generated:',path)
@@ -0,0 +1,537 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# evidence_analysis.py: Shared evidence analysis stage of the cookies-detector and web-beacons-detector scripts. The WEC inspections are walked and read
+#     only once, and every inspection is passed to the registered analyzers (cookie classification, web beacon extraction, first/third-party hosts extraction,
+#     known fingerprinting scripts detection).
+#     Each analyzer stores its own result files. Executed as a script ('python3 evidence_analysis.py'), it runs all the analyzers in a single pass and generates
+#     the result JSON files of both detectors, that can then be reused with their '--from-analysis' argument.
+#     With several processes, the websites are split across a pool of forked worker processes (they inherit the compiled filter engine without parsing
+#     the rules again) and their results are merged in the original walk order, so the results are identical to the single process ones.
+#     With an evidence manifest (incremental mode, see evidence_manifest.py), only the websites whose inspection changed are analyzed again (or all of them
+#     for an analyzer whose inputs changed, e.g. a filter list), and they are merged into the stored results.
+#     On the columnar output mode, the results are also stored as flat Parquet tables (see columnar_export.py).
+#     With a timer (see phase_timer.py), the inspection parsing ('parse') and each analyzer (its name, e.g. 'cookies' for the filter matching) are timed for each website.
+
+# IMPORTANT: It's necessary to have an output folder named 'wec-evidences' with the generated inspections (see 'wec-executor.py').
+
+# Dependencies.
+import os
+import json
+import shutil
+import argparse
+import multiprocessing
+from pathlib import Path
+from contextlib import nullcontext
+from evidence_reader import load_evidence
+from evidence_manifest import EvidenceManifest, MANIFEST_FILE
+import columnar_export
+from filter_engine import FilterEngine
+from fingerprint_index import FingerprintIndex
+from verdict_cache import VerdictCache, DEFAULT_MAX_SIZE
+from phase_timer import PhaseTimer
+
+# Inspections folder, and result folders and files of the detectors.
+EVIDENCES_DIR = './wec-evidences'
+COOKIES_DIR = './cookies-detector-results'
+BEACONS_DIR = './beacons-detector-results'
+COOKIE_RESULTS = COOKIES_DIR+'/cookie-results.json'
+DOMAIN_COOKIE_RESULTS = COOKIES_DIR+'/domain-cookie-results.json'
+BEACONS_RESULTS = BEACONS_DIR+'/beacons-results.json'
+DOMAIN_BEACONS_RESULTS = BEACONS_DIR+'/domain-beacons-results.json'
+COOKIES_TABLE = COOKIES_DIR+'/cookies.parquet'
+COOKIE_SITES_TABLE = COOKIES_DIR+'/sites.parquet'
+COOKIE_HOSTS_TABLE = COOKIES_DIR+'/hosts.parquet'
+BEACONS_TABLE = BEACONS_DIR+'/beacons.parquet'
+BEACON_SITES_TABLE = BEACONS_DIR+'/sites.parquet'
+BEACON_HOSTS_TABLE = BEACONS_DIR+'/hosts.parquet'
+COOKIE_FINGERPRINTING_RESULTS = COOKIES_DIR+'/fingerprinting-results.json'
+BEACON_FINGERPRINTING_RESULTS = BEACONS_DIR+'/fingerprinting-results.json'
+COOKIE_FINGERPRINTING_TABLE = COOKIES_DIR+'/fingerprinting.parquet'
+BEACON_FINGERPRINTING_TABLE = BEACONS_DIR+'/fingerprinting.parquet'
+
+# Default phase trace file of the script.
+TRACE_FILE = 'evidence-analysis-timings.jsonl'
+
+# The 3 protection filter rule sets used to detect tracking cookies, and the rule options of the checked URLs.
+FILTER_LISTS = [
+    ('easylist', '../assets/easylist.txt'),
+    ('easyprivacy', '../assets/easyprivacy.txt'),
+    ('fanboy-annoyance', '../assets/fanboy-annoyance.txt')
+]
+FILTER_OPTIONS = {'third-party': True, 'script': True}
+
+# Dataset of known fingerprinting scripts (see fingerprint_index.py).
+FINGERPRINTING_DATASET = '../assets/fingerprinting_domains.json'
+
+# Version of the results of the analyzers. Increase it when the results of an analyzer change (invalidates the incremental results).
+ANALYZER_VERSION = 1
+
+# Maximum number of websites sent to a worker process at once.
+MAX_CHUNK_SIZE = 16
+
+# Analysis inherited by the forked worker processes (see 'EvidenceAnalysis.run_parallel').
+forked_analysis = None
+
+# Functions.
+
+# Loads the 3 protection filter rule sets as a single compiled engine.
+#   The compiled engine is cached on the "filters-cache" folder, it is only rebuilt when some filter list changes.
+def load_filter_engine():
+    return FilterEngine.load(FILTER_LISTS, FILTER_OPTIONS)
+
+
+# Loads the hashed index of the known fingerprinting scripts.
+#   The built index is cached on the "filters-cache" folder, it is only rebuilt when the dataset changes.
+def load_fingerprint_index():
+    return FingerprintIndex.load(FINGERPRINTING_DATASET)
+
+
+# Returns the cookie information used by the analysis: name, domain, expiration and the script files that set it (without the tracking verdict).
+def cookie_info(cookie):
+    cookie_obj = {
+        'name': cookie['name'],
+        'domain': cookie['domain'],
+        'expires': cookie['expires']
+    }
+    if cookie_obj['expires'] != -1 and 'expiresDays' in cookie:
+        cookie_obj['expiresDays'] = cookie['expiresDays']
+    files = []
+    if 'log' in cookie and 'stack' in cookie['log']:
+        for item in cookie['log']['stack']:
+            if 'fileName' in item and item['fileName'] not in files:
+                files.append(item['fileName'])
+    cookie_obj['files'] = files
+    return cookie_obj
+
+
+# Parses and returns a JSON result file.
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Stores a JSON result file.
+def store_json(path, data):
+    with open(path, 'w') as outfile:
+        json.dump(data, outfile)
+
+
+# Process pool mode: prepares the analyzers of a new worker process. The results inherited from the main process (e.g. restored results) are discarded,
+#   so each worker only returns the results of its own websites (and phase times).
+def init_worker():
+    for analyzer in forked_analysis.analyzers:
+        analyzer.start_worker()
+        analyzer.partial()
+    if forked_analysis.timer is not None:
+        forked_analysis.timer.detach()
+
+
+# Process pool mode: analyzes a chunk of websites on a worker process with the given analyzers (indexes).
+#   Returns the partial results of each analyzer and the phase time records of the chunk.
+def analyze_chunk(chunk):
+    inspections, active = chunk
+    forked_analysis.analyze(inspections, active)
+    records = forked_analysis.timer.drain() if forked_analysis.timer is not None else []
+    return [forked_analysis.analyzers[i].partial() for i in active], records
+
+
+# Base class of the analyzers. Each analyzer declares the inspection fields it needs ('fields'), processes the inspection of each website ('analyze')
+#   and returns its result files ('outputs': dict with the file paths as keys and the JSON data, with the websites as keys, as values).
+#   On the process pool mode, the results of each worker are returned and cleared by 'partial', and added to the main process analyzer by 'merge'.
+#   On the incremental mode, the stored results are loaded by 'restore' if the analyzer 'version' (its inputs) did not change.
+#   On the columnar output mode, 'tables' returns the result tables (dict with the file paths as keys and the tables as values).
+#   The base class only has the defaults of the optional methods: each analyzer implements 'analyze' and the methods of the modes it supports.
+class Analyzer:
+
+    name = None
+    fields = ()
+
+    def outputs(self):
+        return {}
+
+    def tables(self):
+        return {}
+
+    def version(self):
+        return ANALYZER_VERSION
+
+    # Called once on each worker process, before analyzing its first website.
+    def start_worker(self):
+        pass
+
+
+# Cookies of each website with their tracking verdict, according to the protection filters (compiled 'filter_engine' and its 'verdict_cache').
+class CookieAnalyzer(Analyzer):
+
+    name = 'cookies'
+    fields = ('cookies',)
+
+    def __init__(self, filter_engine, verdict_cache):
+        self.filter_engine = filter_engine
+        self.verdict_cache = verdict_cache
+        self.cookie_dict = {}
+        self.new_verdicts = None
+
+    # Workers must not use the SQLite connection of the main process: they read the verdicts with their own connection and
+    #   return the new ones, that are stored by the main process.
+    def start_worker(self):
+        self.main_cache = self.verdict_cache
+        self.verdict_cache = VerdictCache(self.main_cache.fingerprint, self.main_cache.max_size, self.main_cache.path, read_only=True)
+        self.new_verdicts = {}
+
+    # Function that returns true if the URL should be blocked for tracking behaviors.
+    def classify(self, url):
+        verdict = self.filter_engine.should_block(url)
+        if self.new_verdicts is not None:
+            self.new_verdicts[url] = verdict
+        return verdict
+
+    def should_block(self, url):
+        return self.verdict_cache.lookup(url, self.classify)
+
+    # Checks if the cookie is a tracking cookie according to the blocking filters.
+    def is_tracking(self, cookie):
+        for file in cookie['files']:
+            if self.should_block(file):
+                return True
+        return self.should_block(cookie['domain'])
+
+    def analyze(self, website, data):
+        cookies = []
+        for cookie in data['cookies']:
+            cookie_obj = cookie_info(cookie)
+            cookie_obj['tracking'] = self.is_tracking(cookie_obj)
+            cookies.append(cookie_obj)
+        self.cookie_dict[website] = cookies
+
+    def outputs(self):
+        return {COOKIE_RESULTS: self.cookie_dict}
+
+    def tables(self):
+        cookies_table, sites_table = columnar_export.cookie_tables(self.cookie_dict)
+        return {COOKIES_TABLE: cookies_table, COOKIE_SITES_TABLE: sites_table}
+
+    # The verdicts depend on the content of each filter list.
+    def version(self):
+        return {'analyzer': ANALYZER_VERSION, 'filter_lists': dict(self.filter_engine.list_hashes), 'fingerprint': self.filter_engine.fingerprint}
+
+    def restore(self, outputs):
+        self.cookie_dict = outputs[COOKIE_RESULTS]
+
+    def partial(self):
+        partial = {'cookies': self.cookie_dict, 'verdicts': self.new_verdicts, 'stats': self.verdict_cache.stats()}
+        self.cookie_dict = {}
+        self.new_verdicts = {}
+        self.verdict_cache.reset_stats()
+        return partial
+
+    def merge(self, partial):
+        self.cookie_dict.update(partial['cookies'])
+        self.verdict_cache.merge(partial['verdicts'], partial['stats'])
+
+
+# Web beacons of each website.
+class BeaconAnalyzer(Analyzer):
+
+    name = 'beacons'
+    fields = ('beacons',)
+
+    def __init__(self):
+        self.beacons_dict = {}
+
+    def analyze(self, website, data):
+        beacons = []
+        for beacon in data['beacons']:
+            beacon_obj = {
+                'listName': beacon['listName'],
+                'url': beacon['url']
+            }
+            beacons.append(beacon_obj)
+        self.beacons_dict[website] = beacons
+
+    def outputs(self):
+        return {BEACONS_RESULTS: self.beacons_dict}
+
+    def tables(self):
+        beacons_table, sites_table = columnar_export.beacon_tables(self.beacons_dict)
+        return {BEACONS_TABLE: beacons_table, BEACON_SITES_TABLE: sites_table}
+
+    def restore(self, outputs):
+        self.beacons_dict = outputs[BEACONS_RESULTS]
+
+    def partial(self):
+        partial = self.beacons_dict
+        self.beacons_dict = {}
+        return partial
+
+    def merge(self, partial):
+        self.beacons_dict.update(partial)
+
+
+# First-party and third-party hosts of each website for the given kinds of evidence ('cookies' and/or 'beacons').
+class HostAnalyzer(Analyzer):
+
+    fields = ('hosts',)
+    result_files = {'cookies': DOMAIN_COOKIE_RESULTS, 'beacons': DOMAIN_BEACONS_RESULTS}
+    table_files = {'cookies': COOKIE_HOSTS_TABLE, 'beacons': BEACON_HOSTS_TABLE}
+
+    def __init__(self, kinds=('cookies', 'beacons')):
+        self.name = 'hosts-'+'-'.join(kinds)
+        self.parties = {kind: {} for kind in kinds}
+
+    def analyze(self, website, data):
+        for kind, parties in self.parties.items():
+            parties[website] = {
+                'firstParty': data['hosts'][kind]['firstParty'],
+                'thirdParty': data['hosts'][kind]['thirdParty'],
+            }
+
+    def outputs(self):
+        return {self.result_files[kind]: parties for kind, parties in self.parties.items()}
+
+    def tables(self):
+        return {self.table_files[kind]: columnar_export.hosts_table(parties, kind) for kind, parties in self.parties.items()}
+
+    def restore(self, outputs):
+        self.parties = {kind: outputs[self.result_files[kind]] for kind in self.parties}
+
+    def partial(self):
+        partial = self.parties
+        self.parties = {kind: {} for kind in partial}
+        return partial
+
+    def merge(self, partial):
+        for kind, parties in partial.items():
+            self.parties[kind].update(parties)
+
+
+# Known fingerprinting scripts (according to the hashed 'index' of the dataset) of each website for the given kinds of evidence:
+#   the script URLs of the cookie stacks ('cookies') and the web beacon URLs ('beacons'). Each finding has the URL, the match type
+#   ('url' or 'normalized'), the content hashes of the matched scripts and the number of websites of the dataset that loaded them.
+class FingerprintAnalyzer(Analyzer):
+
+    result_files = {'cookies': COOKIE_FINGERPRINTING_RESULTS, 'beacons': BEACON_FINGERPRINTING_RESULTS}
+    table_files = {'cookies': COOKIE_FINGERPRINTING_TABLE, 'beacons': BEACON_FINGERPRINTING_TABLE}
+
+    def __init__(self, index, kinds=('cookies', 'beacons')):
+        self.index = index
+        self.name = 'fingerprinting-'+'-'.join(kinds)
+        self.fields = tuple(kinds)
+        self.findings = {kind: {} for kind in kinds}
+
+    # Returns the URLs checked for a kind of evidence (each one once, in order of appearance).
+    def urls(self, kind, data):
+        urls = {}
+        if kind == 'cookies':
+            for cookie in data['cookies']:
+                if 'log' in cookie and 'stack' in cookie['log']:
+                    for item in cookie['log']['stack']:
+                        if 'fileName' in item:
+                            urls[item['fileName']] = True
+        else:
+            for beacon in data['beacons']:
+                urls[beacon['url']] = True
+        return urls
+
+    def analyze(self, website, data):
+        for kind, findings in self.findings.items():
+            website_findings = []
+            for url in self.urls(kind, data):
+                match = self.index.lookup(url)
+                if match is not None:
+                    website_findings.append({'url': url, **match})
+            findings[website] = website_findings
+
+    def outputs(self):
+        return {self.result_files[kind]: findings for kind, findings in self.findings.items()}
+
+    def tables(self):
+        return {self.table_files[kind]: columnar_export.fingerprinting_table(findings) for kind, findings in self.findings.items()}
+
+    # The findings depend on the content of the dataset.
+    def version(self):
+        return {'analyzer': ANALYZER_VERSION, 'dataset': self.index.fingerprint}
+
+    def restore(self, outputs):
+        self.findings = {kind: outputs[self.result_files[kind]] for kind in self.findings}
+
+    def partial(self):
+        partial = self.findings
+        self.findings = {kind: {} for kind in partial}
+        return partial
+
+    def merge(self, partial):
+        for kind, findings in partial.items():
+            self.findings[kind].update(findings)
+
+
+# Single pass over the WEC inspections feeding all the registered analyzers. With a 'manifest' (EvidenceManifest), the analysis is incremental.
+#   With a 'timer' (PhaseTimer), the phases of each website are timed.
+class EvidenceAnalysis:
+
+    def __init__(self, manifest=None, timer=None):
+        self.analyzers = []
+        self.manifest = manifest
+        self.timer = timer
+        self.websites = 0
+        self.analyzed = 0
+
+    # Registers an analyzer. Returns the analyzer.
+    def register(self, analyzer):
+        self.analyzers.append(analyzer)
+        return analyzer
+
+    # Returns the inspection fields needed by the analyzers.
+    def fields(self, analyzers):
+        fields = []
+        for analyzer in analyzers:
+            for field in analyzer.fields:
+                if field not in fields:
+                    fields.append(field)
+        return fields
+
+    # Returns the list of (website, inspection file) of the inspections folder, in walk order. Hidden folders (e.g. temporary folders) are skipped.
+    def inspections(self, path):
+        inspections = []
+        for subdir, dirs, files in os.walk(path):
+            dirs[:] = [dire for dire in dirs if not dire.startswith('.')]
+            for dire in dirs:
+                inspections.append((dire, subdir+'/'+dire+'/inspection.json'))
+        return inspections
+
+    # Reads each website inspection once (only the needed fields) and passes it to the analyzers (indexes of 'active', all the analyzers if None).
+    def analyze(self, inspections, active=None):
+        analyzers = self.analyzers if active is None else [self.analyzers[i] for i in active]
+        fields = self.fields(analyzers)
+        phase = self.timer.phase if self.timer is not None else lambda website, name: nullcontext()
+        for website, inspection in inspections:
+            with phase(website, 'parse'):
+                data = load_evidence(inspection, fields)
+            for analyzer in analyzers:
+                with phase(website, analyzer.name):
+                    analyzer.analyze(website, data)
+
+    # Incremental mode: restores the stored results of the analyzers whose inputs did not change.
+    #   Returns a list with the analyzer indexes needed by each website (the ones whose results are missing or were computed from another inspection).
+    def plan(self, inspections):
+        hashes = self.manifest.inspection_hashes(inspections)
+        pending = [[] for website, inspection in inspections]
+        for i, analyzer in enumerate(self.analyzers):
+            analyzed = self.manifest.analyzed(analyzer.name, analyzer.version())
+            paths = list(analyzer.outputs())
+            if analyzed is not None and all(os.path.exists(path) for path in paths):
+                analyzer.restore({path: load_json(path) for path in paths})
+            else:
+                analyzed = {}
+            for j, (website, inspection) in enumerate(inspections):
+                if analyzed.get(website) != hashes[website]:
+                    pending[j].append(i)
+            self.manifest.update(analyzer.name, analyzer.version(), hashes)
+        return pending
+
+    # Analyzes all the inspections of the folder, using a pool of 'processes' worker processes if it is greater than 1.
+    #   On the incremental mode, each website is only analyzed by the analyzers whose results are outdated.
+    def run(self, path=EVIDENCES_DIR, processes=1):
+        inspections = self.inspections(path)
+        if self.manifest is not None:
+            pending = self.plan(inspections)
+        else:
+            pending = [list(range(len(self.analyzers))) for inspection in inspections]
+        # Group the websites that need the same analyzers.
+        groups = {}
+        for inspection, active in zip(inspections, pending):
+            if active:
+                groups.setdefault(tuple(active), []).append(inspection)
+        if processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            print('[WARN] - Process pool mode needs fork (not available on this platform), analyzing on a single process')
+            processes = 1
+        for active, group in groups.items():
+            if processes > 1 and len(group) > 1:
+                self.run_parallel(group, list(active), processes)
+            else:
+                self.analyze(group, list(active))
+        if self.manifest is not None:
+            self.sort_results(inspections)
+        self.websites += len(inspections)
+        self.analyzed += sum(1 for active in pending if active)
+
+    # Sorts the results of all the analyzers in walk order, removing the websites without inspection (merged results may be out of order).
+    def sort_results(self, inspections):
+        for analyzer in self.analyzers:
+            for data in analyzer.outputs().values():
+                results = {website: data[website] for website, inspection in inspections if website in data}
+                data.clear()
+                data.update(results)
+
+    # Splits the websites in chunks analyzed by forked worker processes. The workers inherit the analyzers (and the compiled filter engine) copy-on-write,
+    #   and the partial results are merged in chunk order, so the merged results have the same order as on a single process.
+    def run_parallel(self, inspections, active, processes):
+        global forked_analysis
+        chunk_size = max(1, min(MAX_CHUNK_SIZE, len(inspections) // (processes*4)))
+        chunks = [(inspections[i:i+chunk_size], active) for i in range(0, len(inspections), chunk_size)]
+        forked_analysis = self
+        try:
+            with multiprocessing.get_context('fork').Pool(processes, initializer=init_worker) as pool:
+                for partials, records in pool.imap(analyze_chunk, chunks):
+                    for i, partial in zip(active, partials):
+                        self.analyzers[i].merge(partial)
+                    if self.timer is not None:
+                        self.timer.extend(records)
+        finally:
+            forked_analysis = None
+
+    # Stores the result files of all the analyzers (and their Parquet tables if 'columnar'). The output folders are created again (removing the previous results).
+    def store(self, columnar=False):
+        outputs = {}
+        for analyzer in self.analyzers:
+            outputs.update(analyzer.outputs())
+        folders = list(dict.fromkeys(os.path.dirname(path) for path in outputs))
+        for folder in folders:
+            dirpath = Path(folder)
+            if dirpath.exists() and dirpath.is_dir():
+                shutil.rmtree(dirpath)
+            os.mkdir(folder)
+        for path, data in outputs.items():
+            store_json(path, data)
+        if columnar:
+            for analyzer in self.analyzers:
+                for path, table in analyzer.tables().items():
+                    columnar_export.write_table(path, table)
+        if self.manifest is not None:
+            self.manifest.save()
+
+
+# Main code: all the analyzers in a single pass (when executed as a script).
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyzes the WEC inspections once, generating the cookies, web beacons and fingerprinting detector results.')
+    parser.add_argument('--verdict-cache', default=None, help='SQLite file where the filter verdicts of each URL are persisted across runs.')
+    parser.add_argument('--verdict-cache-size', type=int, default=DEFAULT_MAX_SIZE, help='Maximum number of URL verdicts kept in memory.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of worker processes analyzing the websites.')
+    parser.add_argument('--incremental', action='store_true', help='Only analyze the websites whose inspection (or analyzer inputs) changed since the last run, merging them into the stored results.')
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help='Evidence manifest file of the incremental mode.')
+    parser.add_argument('--columnar', action='store_true', help='Also store the results as Parquet tables (cookies, beacons, hosts and sites), it needs the pyarrow library.')
+    parser.add_argument('--trace', default=TRACE_FILE, help='JSONL file where the time of each phase of each website is recorded (see phase_timer.py).')
+    args = parser.parse_args()
+    if args.columnar and not columnar_export.available():
+        parser.error('the columnar output mode needs the pyarrow library (pip3 install pyarrow)')
+
+    filter_engine = load_filter_engine()
+    verdict_cache = VerdictCache(filter_engine.fingerprint, args.verdict_cache_size, args.verdict_cache)
+
+    timer = PhaseTimer(args.trace)
+    analysis = EvidenceAnalysis(EvidenceManifest(args.manifest) if args.incremental else None, timer)
+    analysis.register(CookieAnalyzer(filter_engine, verdict_cache))
+    analysis.register(BeaconAnalyzer())
+    analysis.register(HostAnalyzer())
+    analysis.register(FingerprintAnalyzer(load_fingerprint_index()))
+    analysis.run(processes=args.processes)
+    verdict_cache.close()
+    with timer.phase(None, 'store'):
+        analysis.store(args.columnar)
+
+    print('Number of WEC inspected websites:',analysis.websites,'( analyzed:',analysis.analyzed,')')
+    cache_stats = verdict_cache.stats()
+    print('Filter verdict cache: lookups',cache_stats['lookups'],'- hits',cache_stats['hits'],'- disk hits',cache_stats['disk_hits'],'- misses',cache_stats['misses'],'- evictions',cache_stats['evictions'],'- hit ratio',cache_stats['hit_ratio'])
+    print('Generated:',COOKIE_RESULTS,DOMAIN_COOKIE_RESULTS,COOKIE_FINGERPRINTING_RESULTS,BEACONS_RESULTS,DOMAIN_BEACONS_RESULTS,BEACON_FINGERPRINTING_RESULTS)
+    timer.print_summary(timer.save_summary())
+    timer.close()
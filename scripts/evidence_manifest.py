@@ -0,0 +1,74 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# evidence_manifest.py: Content manifest of the incremental evidence analysis (see evidence_analysis.py). It records the content hash of each WEC 'inspection.json'
+#     and, for each analyzer, the version of its inputs (e.g. the content hash of each filter list) and the inspection hashes its stored results were computed from.
+#     Later runs only recompute the websites whose inspection changed (or all of them for an analyzer whose inputs changed) and merge them into the stored results.
+
+# Dependencies.
+import os
+import json
+import hashlib
+
+# Default manifest file (stored on the folder where the analysis is executed, next to the result folders).
+MANIFEST_FILE = 'evidence-manifest.json'
+
+# Functions.
+
+# Returns the SHA-256 content hash of a file (read by chunks).
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Manifest of the analyzed inspections.
+class EvidenceManifest:
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self.files = {}
+        self.analyzers = {}
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.files = data['files']
+            self.analyzers = data['analyzers']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print('[WARN] - Invalid evidence manifest',path,':',e)
+
+    # Returns a dict with the websites as keys and the content hash of their inspection as values.
+    #   Files with the same size and modification time as on the previous run are not hashed again.
+    def inspection_hashes(self, inspections):
+        hashes = {}
+        files = {}
+        for website, inspection in inspections:
+            stat = os.stat(inspection)
+            entry = self.files.get(website)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+                entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash(inspection)}
+            files[website] = entry
+            hashes[website] = entry['hash']
+        self.files = files
+        return hashes
+
+    # Returns the inspection hashes used by the stored results of an analyzer (None if there are no results or they were computed with other inputs).
+    def analyzed(self, name, version):
+        record = self.analyzers.get(name)
+        if record is None or record['version'] != version:
+            return None
+        return record['inspections']
+
+    # Records the inputs of the results of an analyzer.
+    def update(self, name, version, hashes):
+        self.analyzers[name] = {'version': version, 'inspections': dict(hashes)}
+
+    # Stores the manifest. It is written to a temporary file and renamed, so a reader never gets a partial file.
+    def save(self):
+        tmp_path = self.path+'.'+str(os.getpid())+'.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump({'files': self.files, 'analyzers': self.analyzers}, outfile)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,118 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# evidence_reader.py: Selective reader of the WEC 'inspection.json' files used by the analysis scripts (cookies-detector and web-beacons-detector).
+#     The analysis only needs a few top-level fields ('cookies', 'beacons', 'hosts'), but the inspections also contain links, browsing history, local storage...
+#     The file is memory mapped and its top-level object is scanned without decoding it: only the wanted values are decoded, so memory and parse time
+#     depend on the size of the used fields, not on the size of the file.
+
+# Dependencies.
+import re
+import json
+import mmap
+
+# Fields of the inspections used by the analysis scripts.
+EVIDENCE_FIELDS = ('cookies', 'beacons', 'hosts')
+
+# WEC writes the inspections indented with 2 spaces, so a line starting with 2 spaces and a quote is always a top-level key
+#   (nested keys are indented deeper and JSON strings cannot contain new lines).
+INDENTED_START = b'{\n  "'
+INDENTED_KEY_RE = re.compile(rb'\n  "((?:[^"\\\n]|\\.)*)": ')
+
+# Byte patterns of the generic JSON scanner (any other layout).
+WHITESPACE_RE = re.compile(rb'[ \t\n\r]*')
+KEY_RE = re.compile(rb'"((?:[^"\\]|\\.)*)"[ \t\n\r]*:[ \t\n\r]*', re.DOTALL)
+STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Skips everything (including whole strings) until the next bracket out of a string.
+NEXT_BRACKET_RE = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*([\[\]{}])', re.DOTALL)
+SCALAR_RE = re.compile(rb'[^,}\] \t\n\r]+')
+
+# Functions.
+
+# Returns the position after the end of the JSON value that starts at 'pos', without decoding it.
+def skip_value(buffer, pos):
+    first = buffer[pos:pos+1]
+    if first == b'"':
+        match = STRING_RE.match(buffer, pos)
+    elif first == b'{' or first == b'[':
+        depth = 1
+        pos += 1
+        while depth > 0:
+            match = NEXT_BRACKET_RE.match(buffer, pos)
+            if match is None:
+                raise ValueError('Unterminated value at '+str(pos))
+            depth += 1 if match.group(1) in b'{[' else -1
+            pos = match.end()
+        return pos
+    else:
+        match = SCALAR_RE.match(buffer, pos)
+    if match is None:
+        raise ValueError('Expecting value at '+str(pos))
+    return match.end()
+
+
+# Returns a dict with the wanted top-level fields of a JSON object buffer (bytes or mmap) of any layout. Missing fields are not included.
+def read_fields(buffer, fields):
+    wanted = set(fields)
+    result = {}
+    pos = WHITESPACE_RE.match(buffer, 0).end()
+    if buffer[pos:pos+1] != b'{':
+        raise ValueError('Expecting a JSON object at '+str(pos))
+    pos = WHITESPACE_RE.match(buffer, pos+1).end()
+    if buffer[pos:pos+1] == b'}':
+        return result
+    while wanted:
+        match = KEY_RE.match(buffer, pos)
+        if match is None:
+            raise ValueError('Expecting property name at '+str(pos))
+        key = json.loads(b'"'+match.group(1)+b'"')
+        start = match.end()
+        end = skip_value(buffer, start)
+        if key in wanted:
+            result[key] = json.loads(buffer[start:end])
+            wanted.discard(key)
+        pos = WHITESPACE_RE.match(buffer, end).end()
+        separator = buffer[pos:pos+1]
+        if separator == b'}':
+            break
+        if separator != b',':
+            raise ValueError("Expecting ',' delimiter at "+str(pos))
+        pos = WHITESPACE_RE.match(buffer, pos+1).end()
+    return result
+
+
+# Same as 'read_fields' for buffers indented as the WEC inspections: the top-level keys are located with a single search, without scanning the values.
+def read_indented_fields(buffer, fields):
+    wanted = set(fields)
+    result = {}
+    keys = list(INDENTED_KEY_RE.finditer(buffer))
+    for i, match in enumerate(keys):
+        key = json.loads(b'"'+match.group(1)+b'"')
+        if key not in wanted:
+            continue
+        end = keys[i+1].start() if i+1 < len(keys) else buffer.rfind(b'}')
+        result[key] = json.loads(buffer[match.end():end].rstrip().rstrip(b','))
+        wanted.discard(key)
+        if not wanted:
+            break
+    return result
+
+
+# Loads only the wanted top-level fields of an inspection file (by default, the fields used by the analysis scripts).
+#   It raises 'ValueError' if the file is not a valid JSON object.
+def load_evidence(path, fields=EVIDENCE_FIELDS):
+    with open(path, 'rb') as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            raise ValueError('Empty inspection file: '+path)
+        try:
+            if buffer[:len(INDENTED_START)] == INDENTED_START:
+                try:
+                    return read_indented_fields(buffer, fields)
+                except ValueError:
+                    # Not the expected layout after all (e.g. a top-level string value with the same pattern): use the generic scanner.
+                    pass
+            return read_fields(buffer, fields)
+        finally:
+            buffer.close()
@@ -0,0 +1,109 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# evidence_stats.py: Vectorized aggregation engine of the detector statistics (cookies-detector and web-beacons-detector). The results are reduced to a table with
+#     one row for each website (the analyzed value, e.g. its number of tracking cookies or web beacons, and its first and third-party hosts), and every
+#     statistic is computed over its numpy arrays in one pass: website counts and percentages, mean and standard deviation, histogram bins, the website
+#     with the maximum value, the top websites and the top third-party domains. The terminal reports and the diagrams use the computed summary.
+
+# Dependencies.
+import statistics
+import numpy as np
+
+# Default number of histogram bins and of elements of the top tables.
+DEFAULT_BINS = 10
+DEFAULT_TOP = 10
+
+# Functions.
+
+# Returns the indexes that sort the values in descending order. Equal values keep the website (or domain) order, so the top tables are deterministic.
+def descending_order(values):
+    return np.argsort(-values, kind='stable')
+
+
+# Returns the sample standard deviation of the values (0 with less than two values), as 'statistics.stdev' so the printed values do not change.
+def sample_std(values):
+    if len(values) < 2:
+        return 0.0
+    return statistics.stdev(values.tolist())
+
+
+# Table with one row for each analyzed website.
+#   - sites: website names.
+#   - values: analyzed value of each website (e.g. number of tracking cookies).
+#   - first_party: number of first-party hosts of each website.
+#   - third_site, third_domain: one row for each third-party host, with the website index and the domain index (see 'domains').
+#   - domains: third-party domain names.
+class SiteTable:
+
+    def __init__(self, sites, values, first_party, third_site, third_domain, domains):
+        self.sites = list(sites)
+        self.values = np.asarray(values, dtype=np.int64)
+        self.first_party = np.asarray(first_party, dtype=np.int64)
+        self.third_site = np.asarray(third_site, dtype=np.int64)
+        self.third_domain = np.asarray(third_domain, dtype=np.int64)
+        self.domains = list(domains)
+
+    # Builds the table from the result dicts of a detector: 'values' has the websites as keys and their values as values, and
+    #   'parties' the first and third-party hosts of each website (e.g. domain-cookie-results.json data).
+    @classmethod
+    def from_results(cls, values, parties):
+        sites = list(values)
+        first_party = [len(parties[website]['firstParty']) for website in sites]
+        third_counts = [len(parties[website]['thirdParty']) for website in sites]
+        domain_index = {}
+        third_domain = [domain_index.setdefault(domain, len(domain_index)) for website in sites for domain in parties[website]['thirdParty']]
+        third_site = np.repeat(np.arange(len(sites)), third_counts)
+        return cls(sites, list(values.values()), first_party, third_site, third_domain, domain_index)
+
+    # Computes all the statistics of the table in one pass. Returns a dict with:
+    #   - websites, with_hosts, without_hosts, with_third_party, without_third_party, with_value, without_value (numbers of websites).
+    #   - percentages: percentage of websites with hosts, with third-party hosts and with value.
+    #   - values: value of each website, mean and std (sample standard deviation), histogram ('counts' and 'edges' of the bins).
+    #   - max_site, max_value: first website with the maximum value ('' and 0 if all the values are 0).
+    #   - top_sites: (website, value) pairs of the top websites. top_domains: (domain, number of websites) pairs of the top third-party domains.
+    def summary(self, top=DEFAULT_TOP, bins=DEFAULT_BINS):
+        websites = len(self.sites)
+        third_party = np.bincount(self.third_site, minlength=websites)
+        with_hosts = int(np.count_nonzero((self.first_party + third_party) > 0))
+        with_third_party = int(np.count_nonzero(third_party))
+        with_value = int(np.count_nonzero(self.values))
+        total = self.values.sum()
+        counts, edges = np.histogram(self.values, bins=bins) if websites else (np.zeros(0), np.zeros(0))
+        max_index = int(np.argmax(self.values)) if websites else 0
+        top_sites = descending_order(self.values)[:top]
+        domain_counts = np.bincount(self.third_domain, minlength=len(self.domains))
+        top_domains = descending_order(domain_counts)[:top]
+        return {
+            'websites': websites,
+            'with_hosts': with_hosts,
+            'without_hosts': websites - with_hosts,
+            'with_third_party': with_third_party,
+            'without_third_party': websites - with_third_party,
+            'with_value': with_value,
+            'without_value': websites - with_value,
+            'percentages': {
+                'with_hosts': with_hosts*100/websites if websites else 0.0,
+                'with_third_party': with_third_party*100/websites if websites else 0.0,
+                'with_value': with_value*100/websites if websites else 0.0
+            },
+            'values': self.values,
+            'mean': int(total)/websites if websites else 0.0,
+            'std': sample_std(self.values),
+            'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+            'max_site': self.sites[max_index] if websites and self.values[max_index] > 0 else '',
+            'max_value': int(self.values[max_index]) if websites else 0,
+            'top_sites': [(self.sites[i], int(self.values[i])) for i in top_sites],
+            'top_domains': [(self.domains[i], int(domain_counts[i])) for i in top_domains]
+        }
+
+
+# Returns the table of the cookies-detector results (cookie-results.json and domain-cookie-results.json data): the value of each website is its number of tracking cookies.
+def cookie_table(cookie_dict, cookie_parties):
+    tracking = {website: sum(1 for cookie in cookies if cookie['tracking']) for website, cookies in cookie_dict.items()}
+    return SiteTable.from_results(tracking, cookie_parties)
+
+
+# Returns the table of the web-beacons-detector results (beacons-results.json and domain-beacons-results.json data): the value of each website is its number of web beacons.
+def beacon_table(beacons_dict, beacons_parties):
+    beacons = {website: len(website_beacons) for website, website_beacons in beacons_dict.items()}
+    return SiteTable.from_results(beacons, beacons_parties)
@@ -0,0 +1,300 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# filter_engine.py: Compiled and indexed matcher for the protection filter lists (easylist, easyprivacy, fanboy-annoyance). It merges all the lists into a single
+#     engine that answers in one lookup, giving the same verdicts as asking one 'adblockparser.AdblockRules' object per list.
+#     Rules are indexed by hostname ('||domain^' rules) and by a literal token of their pattern, so each URL is only checked against a handful of candidate rules.
+#     Compiled engines are cached on disk (folder "filters-cache") keyed by the content hash of each list, so later runs and parallel workers skip the rules parsing.
+
+# Dependencies.
+import os
+import re
+import json
+import pickle
+import hashlib
+from adblockparser import AdblockRule
+
+# Version of the compiled engine format. Increase it when the index structure changes (invalidates the cached engines).
+ENGINE_VERSION = 1
+
+# Default folder where the compiled engines are cached.
+CACHE_DIR = 'filters-cache'
+
+# Options always used by the detectors when asking the filters (tracking scripts loaded from third-party origins).
+DEFAULT_OPTIONS = {'third-party': True, 'script': True}
+
+# Regular expressions used to index the rules and tokenize the URLs.
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+HOST_RULE_RE = re.compile(r'^\|\|([A-Za-z0-9.\-]+)\^$')
+HOST_CHARS_RE = re.compile(r'[\w\-.%]*')
+SCHEME_RE = re.compile(r'[^:/?#]+:')
+AUTHORITY_RE = re.compile(r'[^/?#]*')
+
+# Functions.
+
+# Parses and returns the rule lines of a filter list file (closing the file).
+def read_filter_list(path):
+    with open(path, 'r') as f:
+        return f.readlines()
+
+
+# Returns the SHA-256 content hash of a filter list.
+def list_hash(lines):
+    return hashlib.sha256(''.join(lines).encode('utf-8')).hexdigest()
+
+
+# Returns the fingerprint of a compiled engine: the content hash of each list, the asked options and the engine format version.
+def engine_fingerprint(list_hashes, options):
+    key = json.dumps([ENGINE_VERSION, sorted(options.items()), list_hashes])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+# Function that returns true if the rule is used by 'AdblockRules' when asked with the 'options' dict.
+#   - Comments, HTML rules and rules without pattern or options are discarded.
+#   - Rules requiring an option not present in 'options' (e.g. 'domain' or 'image') are never matched.
+#   - Rules whose options have a different value than the asked ones can never match.
+def rule_applies(rule, options):
+    if rule.is_comment or rule.is_html_rule:
+        return False
+    if not rule.regex and not rule.options:
+        return False
+    for name, value in rule.options.items():
+        if name == 'match-case':
+            continue
+        if name not in options or name == 'domain':
+            return False
+        if options[name] != value:
+            return False
+    return True
+
+
+# Function that returns the tokens of the rule pattern that must appear as complete alphanumeric words in every matched URL.
+#   A token is valid if both sides are delimited by a literal separator character, a '^' separator, or an anchor ('||', '|').
+def rule_tokens(rule_text):
+    text = rule_text.lower()
+    start = 0
+    end = len(text)
+    left_anchor = False
+    right_anchor = False
+    if text.startswith('||'):
+        start = 2
+        left_anchor = True
+    elif text.startswith('|'):
+        start = 1
+        left_anchor = True
+    if end > start and text.endswith('|'):
+        end -= 1
+        right_anchor = True
+    body = text[start:end]
+    # Inner '|' characters are rewritten by 'adblockparser' in a lossy way, so the rule cannot be indexed safely.
+    if not body or '|' in body:
+        return []
+    tokens = []
+    for match in TOKEN_RE.finditer(body):
+        before = body[match.start()-1] if match.start() > 0 else None
+        after = body[match.end()] if match.end() < len(body) else None
+        if before is None:
+            left_ok = left_anchor
+        else:
+            left_ok = before != '*' and not before.isalnum() and before.isascii()
+        if after is None:
+            right_ok = right_anchor
+        else:
+            right_ok = after != '*' and not after.isalnum() and after.isascii()
+        if left_ok and right_ok:
+            tokens.append(match.group())
+    return tokens
+
+
+# Function that returns the URL positions where a '||domain' rule may start matching (see 'AdblockRule.rule_to_regex').
+def host_anchor_starts(url):
+    starts = [0]
+    base = 0
+    scheme = SCHEME_RE.match(url)
+    if scheme:
+        base = scheme.end()
+        starts.append(base)
+    if url.startswith('//', base):
+        begin = base + 2
+        starts.append(begin)
+        authority = AUTHORITY_RE.match(url, begin).group()
+        position = authority.find('.')
+        while position != -1:
+            starts.append(begin + position + 1)
+            position = authority.find('.', position + 1)
+    return starts
+
+
+# Compiled rule: filter list bit, whitelist flag and the regular expression of the rule (compiled lazily).
+class CompiledRule:
+    __slots__ = ['mask', 'is_exception', 'regex', 'flags', 'regex_re']
+
+    def __init__(self, mask, is_exception, regex, flags):
+        self.mask = mask
+        self.is_exception = is_exception
+        self.regex = regex
+        self.flags = flags
+        self.regex_re = None
+
+    # The compiled regular expression is not stored in the cache (it is compiled again when needed).
+    def __getstate__(self):
+        return (self.mask, self.is_exception, self.regex, self.flags)
+
+    def __setstate__(self, state):
+        self.mask, self.is_exception, self.regex, self.flags = state
+        self.regex_re = None
+
+    def match(self, url):
+        if self.regex_re is None:
+            self.regex_re = re.compile(self.regex, self.flags)
+        return self.regex_re.search(url) is not None
+
+
+# Merged matcher for several filter lists.
+#   'lists' is a list of (name, rule lines) tuples. A URL is blocked if at least one list blacklists it without whitelisting it,
+#   exactly as asking 'AdblockRules(lines).should_block(url, options)' for each list one after another.
+class FilterEngine:
+
+    def __init__(self, lists, options=None):
+        self.options = dict(DEFAULT_OPTIONS if options is None else options)
+        self.names = [name for name, lines in lists]
+        self.list_hashes = [(name, list_hash(lines)) for name, lines in lists]
+        self.fingerprint = engine_fingerprint(self.list_hashes, self.options)
+        self.host_index = {}
+        self.token_index = {}
+        self.fallback = []
+        self.n_rules = 0
+
+        # 1. Parse the rules keeping only the ones that can match with the given options.
+        parsed = []
+        token_counts = {}
+        fallback = {}
+        for i, (name, lines) in enumerate(lists):
+            mask = 1 << i
+            for line in lines:
+                rule = AdblockRule(line)
+                if not rule_applies(rule, self.options):
+                    continue
+                is_regex = len(rule.rule_text) > 1 and rule.rule_text.startswith('/') and rule.rule_text.endswith('/')
+                tokens = rule_tokens(rule.rule_text) if not is_regex else []
+                for token in set(tokens):
+                    token_counts[token] = token_counts.get(token, 0) + 1
+                parsed.append((mask, rule, tokens))
+
+        # 2. Index every rule under its hostname, its least frequent token or the fallback list.
+        for mask, rule, tokens in parsed:
+            self.n_rules += 1
+            # Rules without options are matched case-insensitively by 'AdblockRules', rules with options are case-sensitive.
+            case_sensitive = bool(rule.options)
+            host = HOST_RULE_RE.match(rule.rule_text)
+            if host:
+                domain = host.group(1)
+                self.host_index.setdefault(domain.lower(), []).append(
+                    (mask, rule.is_exception, domain if case_sensitive else None))
+                continue
+            compiled = CompiledRule(mask, rule.is_exception, rule.regex, 0 if case_sensitive else re.IGNORECASE)
+            if tokens:
+                token = min(tokens, key=lambda t: (token_counts[t], -len(t)))
+                self.token_index.setdefault(token, []).append(compiled)
+            else:
+                fallback.setdefault((mask, rule.is_exception, compiled.flags), []).append(rule.regex)
+
+        # 3. Rules that cannot be indexed are combined into one regular expression per list (as 'AdblockRules' does).
+        for (mask, is_exception, flags), regexes in fallback.items():
+            self.fallback.append(CompiledRule(mask, is_exception, '|'.join(regexes), flags))
+
+    # Builds the engine reading the filter list files. 'paths' is a list of (name, path) tuples.
+    @classmethod
+    def from_files(cls, paths, options=None):
+        return cls([(name, read_filter_list(path)) for name, path in paths], options)
+
+    # Returns the engine for the filter list files, loading it from the compiled cache if the lists did not change.
+    #   If it is not cached yet (or the cache is invalid) the engine is built and stored in 'cache_dir'.
+    @classmethod
+    def load(cls, paths, options=None, cache_dir=CACHE_DIR):
+        lists = [(name, read_filter_list(path)) for name, path in paths]
+        fingerprint = engine_fingerprint(
+            [(name, list_hash(lines)) for name, lines in lists],
+            dict(DEFAULT_OPTIONS if options is None else options)
+        )
+        cache_path = os.path.join(cache_dir, fingerprint+'.pickle')
+        try:
+            with open(cache_path, 'rb') as f:
+                engine = pickle.load(f)
+            if engine.fingerprint == fingerprint:
+                return engine
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print('[WARN] - Invalid compiled filters cache',cache_path,':',e)
+        engine = cls(lists, options)
+        engine.save(cache_path)
+        return engine
+
+    # Stores the compiled engine. The file is written under a temporary name and then renamed, so parallel workers never read a partial cache.
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path+'.'+str(os.getpid())+'.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    # Returns the compiled rules that may match the URL (a superset of the real matches).
+    def candidates(self, url):
+        if not url.isascii():
+            # Unicode case folding may differ from 'str.lower', so check every indexed rule.
+            for rules in self.token_index.values():
+                yield from rules
+        else:
+            for token in set(TOKEN_RE.findall(url.lower())):
+                rules = self.token_index.get(token)
+                if rules:
+                    yield from rules
+        yield from self.fallback
+
+    # Returns the matched (blacklist, whitelist) bit masks of the hostname index.
+    def host_matches(self, url):
+        black = 0
+        white = 0
+        lower = url.lower() if url.isascii() else None
+        for start in host_anchor_starts(url):
+            end = HOST_CHARS_RE.match(url, start).end()
+            if end == start:
+                continue
+            if lower is not None:
+                key = lower[start:end]
+            else:
+                key = url[start:end].lower()
+            entries = self.host_index.get(key)
+            if not entries:
+                continue
+            for mask, is_exception, domain in entries:
+                if domain is not None and url[start:end] != domain:
+                    continue
+                if is_exception:
+                    white |= mask
+                else:
+                    black |= mask
+        return black, white
+
+    # Returns true if the URL should be blocked by any of the filter lists.
+    def should_block(self, url):
+        black, white = self.host_matches(url)
+        all_lists = (1 << len(self.names)) - 1
+        candidates = list(self.candidates(url))
+
+        # 1. Lists that blacklist the URL.
+        for rule in candidates:
+            if black == all_lists:
+                break
+            if not rule.is_exception and not rule.mask & black and rule.match(url):
+                black |= rule.mask
+        if not black & ~white:
+            return False
+
+        # 2. Lists that also whitelist the URL (only the ones that blacklist it matter).
+        for rule in candidates:
+            if not black & ~white:
+                return False
+            if rule.is_exception and rule.mask & black & ~white and rule.match(url):
+                white |= rule.mask
+        return bool(black & ~white)
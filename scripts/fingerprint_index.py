@@ -0,0 +1,141 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# fingerprint_index.py: Compact hashed index of the known browser fingerprinting scripts (assets/fingerprinting_domains.json). The dataset maps the content
+#     hash (MD5) of each fingerprinting script to the list of URLs it was loaded from ('script_url') and the websites that loaded it ('top_url').
+#     It is preprocessed into two dicts keyed by the 64-bit hash of the script URL and of its normalised URL (see 'normalize_url'), so each membership
+#     query is a single dict lookup. The records of inline scripts (the dataset stores the website URL as their 'script_url') are not indexed: a page URL
+#     is not a fingerprinting script, and indexing it would flag every website that loads that page. Built indexes are cached on disk (folder "filters-cache") keyed by the content hash of the dataset, so later runs
+#     load them in milliseconds instead of parsing the whole dataset.
+
+# Dependencies.
+import os
+import json
+import pickle
+import hashlib
+from urllib.parse import urlsplit
+
+# Version of the index format. Increase it when the index structure or the URL normalisation changes (invalidates the cached indexes).
+INDEX_VERSION = 2
+
+# Default dataset and folder where the built indexes are cached (the same as the compiled filter engines, see filter_engine.py).
+DATASET = '../assets/fingerprinting_domains.json'
+CACHE_DIR = 'filters-cache'
+
+# Functions.
+
+# Returns the normalised form of a script URL: without scheme, 'www.' prefix, default port and fragment, and with the hostname in lowercase.
+#   The same script is often loaded with several of these variants (e.g. 'http://' and 'https://'). The query is kept, since it often selects
+#   the served script (e.g. the container of a tag manager). Returns None if it is not an absolute URL.
+def normalize_url(url):
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None
+    if not parts.scheme or not host:
+        return None
+    if host.startswith('www.'):
+        host = host[4:]
+    if port is not None and port not in (80, 443):
+        host += ':'+str(port)
+    return host+(parts.path or '/')+('?'+parts.query if parts.query else '')
+
+
+# Returns true if the dataset record is an inline script: its 'script_url' is the website URL ('top_url') or a site root (path '/' without query).
+def inline_script(record):
+    script_url = normalize_url(record['script_url'])
+    return script_url is None or script_url == normalize_url(record['top_url']) or (script_url.endswith('/') and '/' not in script_url[:-1])
+
+
+# Returns the 64-bit key of a URL used by the index.
+def url_key(url):
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+
+
+# Returns the SHA-256 content hash of the dataset file.
+def dataset_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Index of the known fingerprinting scripts (inline scripts are skipped, see 'inline_script').
+#   - scripts: content hashes (MD5) of the scripts of the dataset.
+#   - urls, normalized: dicts with the URL keys (see 'url_key') as keys and (script indexes, number of websites) tuples as values.
+#     The number of websites is the number of different 'top_url' of the dataset that loaded the script from that URL.
+class FingerprintIndex:
+
+    def __init__(self, dataset, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.scripts = list(dataset)
+        urls = {}
+        normalized = {}
+        for i, script in enumerate(self.scripts):
+            for record in dataset[script]:
+                if inline_script(record):
+                    continue
+                for key, index in ((url_key(record['script_url']), urls), (self.normalized_key(record['script_url']), normalized)):
+                    if key is None:
+                        continue
+                    scripts, websites = index.setdefault(key, (set(), set()))
+                    scripts.add(i)
+                    websites.add(record['top_url'])
+        self.urls = {key: (tuple(sorted(scripts)), len(websites)) for key, (scripts, websites) in urls.items()}
+        self.normalized = {key: (tuple(sorted(scripts)), len(websites)) for key, (scripts, websites) in normalized.items()}
+
+    # Returns the key of the normalised URL (None if it can not be normalised).
+    @staticmethod
+    def normalized_key(url):
+        normalized = normalize_url(url)
+        return url_key(normalized) if normalized is not None else None
+
+    # Returns the index of the dataset file, loading it from the cache if the dataset did not change.
+    #   If it is not cached yet (or the cache is invalid) the index is built and stored in 'cache_dir'.
+    @classmethod
+    def load(cls, path=DATASET, cache_dir=CACHE_DIR):
+        fingerprint = hashlib.sha256((str(INDEX_VERSION)+':'+dataset_hash(path)).encode('utf-8')).hexdigest()
+        cache_path = os.path.join(cache_dir, 'fingerprinting-'+fingerprint+'.pickle')
+        try:
+            with open(cache_path, 'rb') as f:
+                index = pickle.load(f)
+            if index.fingerprint == fingerprint:
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print('[WARN] - Invalid fingerprinting index cache',cache_path,':',e)
+        with open(path) as f:
+            index = cls(json.load(f), fingerprint)
+        index.save(cache_path)
+        return index
+
+    # Stores the index. The file is written under a temporary name and then renamed, so parallel workers never read a partial cache.
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path+'.'+str(os.getpid())+'.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    # Returns the match of a script URL: a dict with the match type ('url' if the exact URL is known, 'normalized' if only its normalised URL is known),
+    #   the content hashes of the matched scripts and the number of websites of the dataset that loaded them. Returns None if the URL is not known.
+    def lookup(self, url):
+        entry = self.urls.get(url_key(url))
+        match = 'url'
+        if entry is None:
+            key = self.normalized_key(url)
+            entry = self.normalized.get(key) if key is not None else None
+            match = 'normalized'
+        if entry is None:
+            return None
+        scripts, websites = entry
+        return {'match': match, 'scripts': [self.scripts[i] for i in scripts], 'websites': websites}
+
+    def __contains__(self, url):
+        return self.lookup(url) is not None
+
+    def __len__(self):
+        return len(self.scripts)
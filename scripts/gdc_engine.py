@@ -0,0 +1,210 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# gdc_engine.py: GdC engine of the GdC-computation script. The theoretical analysis (consent class of each website) and the practical analysis (tracking
+#     cookies and web beacons of each website) are reduced once to a compact per-website summary: one byte of flags for each website. Then the GdC of any
+#     slice of websites (a boolean mask) is computed with a few vectorized counts, and the GdC of all the groups of a partition (e.g. each category of
+#     the categorization or each TLD) with one bincount, so hundreds of breakdowns (and bootstrap resamples) are computed almost instantly.
+#     GdC = |Ao ∪ Bo| / |A ∪ B|, where:
+#       - A: websites without any consent option ('consent_type' none).
+#       - B: websites with consent options that allow to reject the cookies (not 'no_option' or 'confirm'), without cookie wall and not active by default.
+#       - Ao, Bo: websites of A and B without tracking cookies and without web beacons.
+
+# Dependencies.
+import numpy as np
+
+# Flags of the per-website summary.
+FLAG_A = 1
+FLAG_B = 2
+FLAG_TRACKING = 4
+FLAG_BEACONS = 8
+
+# Default number of bootstrap resamples, and confidence level of the bootstrap intervals.
+DEFAULT_RESAMPLES = 1000
+CONFIDENCE = 0.95
+
+# Functions.
+
+# Returns the flags of a website from its theoretical analysis, its cookies (tracking verdicts) and its number of web beacons.
+def website_flags(analysis, tracking, beacons):
+    flags = 0
+    if analysis['consent_type'] == "none":
+        flags |= FLAG_A
+    elif analysis['consent_type'] not in ['no_option','confirm']:
+        if not analysis['has_cookies_wall'] and not analysis['default_active']:
+            flags |= FLAG_B
+    if tracking:
+        flags |= FLAG_TRACKING
+    if beacons:
+        flags |= FLAG_BEACONS
+    return flags
+
+
+# Returns the GdC of the counts (None if there are no websites on A ∪ B).
+def gdc_value(compliant, eligible):
+    return compliant/eligible if eligible else None
+
+
+# Returns the top-level domain of a website.
+def website_tld(website):
+    return website.rsplit('.', 1)[-1].lower()
+
+
+# Per-website summary of the GdC inputs. Only the websites present on both the theoretical and the practical analysis are included
+#   (WEC cannot be executed on some of them).
+#   - sites: website names (theoretical analysis order).
+#   - flags: uint8 array with the flags (FLAG_*) of each website.
+class GdCTable:
+
+    def __init__(self, sites, flags):
+        self.sites = list(sites)
+        self.flags = np.asarray(flags, dtype=np.uint8)
+        self.index = {website: i for i, website in enumerate(self.sites)}
+        self.in_a = (self.flags & FLAG_A) != 0
+        self.in_b = (self.flags & FLAG_B) != 0
+        self.eligible = self.in_a | self.in_b
+        self.compliant = self.eligible & ((self.flags & (FLAG_TRACKING | FLAG_BEACONS)) == 0)
+
+    # Builds the table from the theoretical analysis (theoretical_analysis.json data), the cookies-detector results (cookie-results.json data)
+    #   and the web-beacons-detector results (beacons-results.json data).
+    @classmethod
+    def from_results(cls, theoretical_analysis, cookie_results, beacons_results):
+        sites = []
+        flags = []
+        for website, analysis in theoretical_analysis.items():
+            if website in cookie_results and website in beacons_results:
+                sites.append(website)
+                flags.append(website_flags(analysis, any(cookie['tracking'] for cookie in cookie_results[website]), len(beacons_results[website])))
+        return cls(sites, flags)
+
+    # Builds the table from the theoretical analysis and the sites Parquet tables of the detectors (see columnar_export.py): only the 'tracking'
+    #   column of the cookies sites table and the 'beacons' column of the web beacons sites table are read.
+    @classmethod
+    def from_tables(cls, theoretical_analysis, cookie_sites_path, beacon_sites_path):
+        from columnar_export import read_table
+        cookies = read_table(cookie_sites_path, columns=['site', 'tracking']).to_pydict()
+        beacons = read_table(beacon_sites_path, columns=['site', 'beacons']).to_pydict()
+        tracking = dict(zip(cookies['site'], cookies['tracking']))
+        beacon_counts = dict(zip(beacons['site'], beacons['beacons']))
+        sites = []
+        flags = []
+        for website, analysis in theoretical_analysis.items():
+            if website in tracking and website in beacon_counts:
+                sites.append(website)
+                flags.append(website_flags(analysis, tracking[website], beacon_counts[website]))
+        return cls(sites, flags)
+
+    # Loads a table stored with 'save'.
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['sites'].tolist(), data['flags'])
+
+    # Stores the table as a compressed numpy file (website names and flags), so later runs skip reading the result files.
+    def save(self, path):
+        np.savez_compressed(path, sites=np.array(self.sites, dtype=str), flags=self.flags)
+
+    # Returns the boolean mask of the given websites (the ones that are not on the table are ignored).
+    def mask(self, websites):
+        mask = np.zeros(len(self.sites), dtype=bool)
+        mask[[self.index[website] for website in websites if website in self.index]] = True
+        return mask
+
+    # Returns the websites of a boolean mask.
+    def websites(self, mask):
+        return [self.sites[i] for i in np.flatnonzero(mask)]
+
+    # Returns the sets A, B, Ao and Bo (as lists of websites) of a slice of websites (boolean mask, all of them if None).
+    def sets(self, mask=None):
+        in_a = self.in_a if mask is None else self.in_a & mask
+        in_b = self.in_b if mask is None else self.in_b & mask
+        return {
+            'A': self.websites(in_a),
+            'B': self.websites(in_b),
+            'Ao': self.websites(in_a & self.compliant),
+            'Bo': self.websites(in_b & self.compliant)
+        }
+
+    # Returns the counts (websites, |A|, |B|, |Ao|, |Bo|) and the GdC of a slice of websites (boolean mask, all of them if None).
+    def gdc(self, mask=None):
+        in_a = self.in_a if mask is None else self.in_a & mask
+        in_b = self.in_b if mask is None else self.in_b & mask
+        a = int(np.count_nonzero(in_a))
+        b = int(np.count_nonzero(in_b))
+        ao = int(np.count_nonzero(in_a & self.compliant))
+        bo = int(np.count_nonzero(in_b & self.compliant))
+        return {
+            'websites': len(self.sites) if mask is None else int(np.count_nonzero(mask)),
+            'A': a, 'B': b, 'Ao': ao, 'Bo': bo,
+            'gdc': gdc_value(ao + bo, a + b)
+        }
+
+    # Returns the counts and the GdC of each group, from the (website index, group index) pairs of the membership ('site_index' and 'group_index' arrays).
+    #   A website may belong to several groups. All the groups are counted at once with weighted bincounts.
+    def group_gdc(self, site_index, group_index, groups):
+        site_index = np.asarray(site_index, dtype=np.int64)
+        group_index = np.asarray(group_index, dtype=np.int64)
+        n = len(groups)
+        websites = np.bincount(group_index, minlength=n)
+        a = np.bincount(group_index, weights=self.in_a[site_index], minlength=n).astype(np.int64)
+        b = np.bincount(group_index, weights=self.in_b[site_index], minlength=n).astype(np.int64)
+        ao = np.bincount(group_index, weights=(self.in_a & self.compliant)[site_index], minlength=n).astype(np.int64)
+        bo = np.bincount(group_index, weights=(self.in_b & self.compliant)[site_index], minlength=n).astype(np.int64)
+        return {
+            group: {
+                'websites': int(websites[i]), 'A': int(a[i]), 'B': int(b[i]), 'Ao': int(ao[i]), 'Bo': int(bo[i]),
+                'gdc': gdc_value(int(ao[i] + bo[i]), int(a[i] + b[i]))
+            }
+            for i, group in enumerate(groups)
+        }
+
+    # Returns the counts and the GdC of each category of the categorization (categorized_websites.json data: the websites as keys and their
+    #   list of categories as values). Websites without categories or that are not on the table are ignored.
+    def by_category(self, categorized):
+        categories = {}
+        site_index = []
+        group_index = []
+        for website, website_categories in categorized.items():
+            i = self.index.get(website)
+            if i is None:
+                continue
+            for category in dict.fromkeys(website_categories):
+                site_index.append(i)
+                group_index.append(categories.setdefault(category, len(categories)))
+        return self.group_gdc(site_index, group_index, list(categories))
+
+    # Returns the counts and the GdC of each top-level domain.
+    def by_tld(self):
+        tlds, group_index = np.unique([website_tld(website) for website in self.sites], return_inverse=True)
+        return self.group_gdc(np.arange(len(self.sites)), group_index, tlds.tolist())
+
+    # Returns the GdC of 'resamples' bootstrap resamples of a slice of websites (boolean mask, all of them if None): each resample draws the same number of
+    #   websites with replacement. Only the number of drawn websites of each kind (not on A ∪ B, on A ∪ B and compliant, on A ∪ B and not compliant) matters,
+    #   so the counts of each resample are drawn from the equivalent multinomial distribution, without materializing the resampled websites.
+    #   Returns an array with the GdC of each resample (NaN if a resample has no websites on A ∪ B).
+    def bootstrap(self, resamples=DEFAULT_RESAMPLES, mask=None, seed=None):
+        eligible = self.eligible if mask is None else self.eligible & mask
+        n = len(self.sites) if mask is None else int(np.count_nonzero(mask))
+        compliant = int(np.count_nonzero(eligible & self.compliant))
+        non_compliant = int(np.count_nonzero(eligible)) - compliant
+        if n == 0:
+            return np.full(resamples, np.nan)
+        rng = np.random.default_rng(seed)
+        counts = rng.multinomial(n, [compliant/n, non_compliant/n, (n - compliant - non_compliant)/n], size=resamples)
+        drawn_eligible = counts[:, 0] + counts[:, 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(drawn_eligible > 0, counts[:, 0]/drawn_eligible, np.nan)
+
+    # Returns the summary of the bootstrap GdC values: number of resamples, mean, standard deviation and percentile confidence interval.
+    def bootstrap_summary(self, resamples=DEFAULT_RESAMPLES, mask=None, seed=None, confidence=CONFIDENCE):
+        values = self.bootstrap(resamples, mask, seed)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return {'resamples': resamples, 'mean': None, 'std': None, 'interval': None}
+        tail = (1 - confidence)/2*100
+        low, high = np.percentile(values, [tail, 100 - tail])
+        return {
+            'resamples': resamples,
+            'mean': float(values.mean()),
+            'std': float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+            'interval': [float(low), float(high)]
+        }
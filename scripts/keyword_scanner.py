@@ -0,0 +1,110 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# keyword_scanner.py: Single-pass in-page keyword scanner used by the selenium scripts (policy-detector and consent-detector) instead of huge XPath expressions.
+#     A scanning function is injected once per page. It walks the DOM one time, matching all the keyword groups (close popups, privacy policy, cookie policy,
+#     personalize...) case-insensitively against the element own text, 'aria-label' and 'title', and returns the ranked candidate elements of each group.
+
+# Dependencies.
+import json
+import time
+
+# JavaScript scanner. It is defined on the page only once ('window.__gdprScan') and called with the keyword groups.
+#   Each group is an object with the 'include' keywords and the 'exclude' keywords (that must not appear on the element text).
+#   Candidates are ranked: text matches before attribute matches, links and buttons first, visible elements first and short texts first.
+SCANNER_JS = """
+if (!window.__gdprScan) {
+    window.__gdprScan = function(groups) {
+        var start = performance.now();
+        var escape = function(k) { return k.replace(/[.*+?^${}()|[\\]\\\\]/g, '\\\\$&'); };
+        var compiled = {};
+        var names = Object.keys(groups);
+        names.forEach(function(name) {
+            var group = groups[name];
+            compiled[name] = {
+                include: group.include.length > 0 ? new RegExp(group.include.map(escape).join('|'), 'i') : /(?!)/,
+                exclude: group.exclude.length > 0 ? new RegExp(group.exclude.map(escape).join('|'), 'i') : null,
+                found: []
+            };
+        });
+        var clickable = {A: true, BUTTON: true, INPUT: true, LABEL: true};
+        var walker = document.createTreeWalker(document.documentElement || document, NodeFilter.SHOW_ELEMENT);
+        var order = 0;
+        var scanned = 0;
+        for (var el = walker.currentNode; el; el = walker.nextNode()) {
+            scanned += 1;
+            if (el.nodeType !== 1) continue;
+            var text = '';
+            for (var child = el.firstChild; child; child = child.nextSibling) {
+                if (child.nodeType === 3) text += child.nodeValue;
+            }
+            var aria = el.getAttribute('aria-label') || '';
+            var title = el.getAttribute('title') || '';
+            if (!text && !aria && !title) continue;
+            order += 1;
+            var base = null;
+            for (var i = 0; i < names.length; i++) {
+                var group = compiled[names[i]];
+                var inText = text && group.include.test(text);
+                if (!inText && !(aria && group.include.test(aria)) && !(title && group.include.test(title))) continue;
+                if (group.exclude && text && group.exclude.test(text)) continue;
+                if (base === null) {
+                    var role = el.getAttribute('role');
+                    base = (clickable[el.tagName] || role === 'button' || role === 'link') ? 0 : 2;
+                    base += el.getClientRects().length > 0 ? 0 : 5;
+                    base += Math.min(text.trim().length / 50, 3);
+                }
+                group.found.push({element: el, score: base + (inText ? 0 : 1), order: order});
+            }
+        }
+        var result = {candidates: {}, scanned: scanned};
+        names.forEach(function(name) {
+            result.candidates[name] = compiled[name].found
+                .sort(function(a, b) { return a.score - b.score || a.order - b.order; })
+                .map(function(c) { return c.element; });
+        });
+        result.ms = performance.now() - start;
+        return result;
+    };
+}
+return window.__gdprScan(arguments[0]);
+"""
+
+
+# Scanner of keyword groups on the current page of a driver. It records the scan time of each website (also as 'keyword_scan' phases of the 'timer', see phase_timer.py).
+#   'groups' is a dict with the group names as keys and (include keywords, exclude keywords) tuples as values.
+class KeywordScanner:
+
+    def __init__(self, groups, timer=None):
+        self.groups = {
+            name: {'include': list(include), 'exclude': list(exclude)}
+            for name, (include, exclude) in groups.items()
+        }
+        self.timer = timer
+        self.times = {}
+
+    # Scans the page for the given group names (all groups if None). Returns a dict with the group names as keys and the ranked candidate elements as values.
+    def scan(self, driver, website, names=None):
+        groups = self.groups if names is None else {name: self.groups[name] for name in names}
+        start = time.monotonic()
+        result = driver.execute_script(SCANNER_JS, groups)
+        elapsed = time.monotonic() - start
+        website_times = self.times.setdefault(website, {'scans': 0, 'in_page_ms': 0, 'total_ms': 0, 'elements': 0})
+        website_times['scans'] += 1
+        website_times['in_page_ms'] += result['ms']
+        website_times['total_ms'] += elapsed*1000
+        website_times['elements'] += result['scanned']
+        if self.timer is not None:
+            self.timer.record(website, 'keyword_scan', elapsed)
+        return result['candidates']
+
+    # Returns the mean scan time (milliseconds, including the driver round trip) of each scanned page.
+    def mean_scan_ms(self):
+        scans = sum(times['scans'] for times in self.times.values())
+        if scans == 0:
+            return 0
+        return sum(times['total_ms'] for times in self.times.values()) / scans
+
+    # Stores the per-website scan times in a JSON file.
+    def save(self, path):
+        with open(path, 'w') as outfile:
+            json.dump(self.times, outfile)
@@ -0,0 +1,106 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# page_head.py: One-fetch, head-only page parser used by the website-categorizer. The website is downloaded as a stream and parsed incrementally until the
+#     end of the '<head>' element (or a bytes limit), extracting only the '<title>' and the '<meta>' tags used to categorize it. The rest of the page is never downloaded.
+
+# Dependencies.
+import re
+import codecs
+import requests
+from html.parser import HTMLParser
+
+# Default limit of downloaded bytes for each page and size of the downloaded chunks.
+MAX_BYTES = 256*1024
+CHUNK_SIZE = 16*1024
+
+# Meta tags used to categorize the websites ('name' and 'property' attribute values).
+META_NAMES = ["description","Description","keywords","Keywords"]
+META_PROPERTIES = ["og:description","og:keywords"]
+
+# Charset declared on the page ('<meta charset="...">' or '<meta http-equiv="Content-Type" content="...; charset=...">').
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_\-:.]+)', re.IGNORECASE)
+
+# Functions.
+
+# Returns the encoding of the page: the one of the 'Content-Type' header, the one declared on the first bytes of the page, or UTF-8.
+def page_encoding(response, first_chunk):
+    candidates = []
+    if 'charset' in response.headers.get('content-type', '').lower():
+        candidates.append(response.encoding)
+    match = META_CHARSET_RE.search(first_chunk)
+    if match:
+        candidates.append(match.group(1).decode('ascii'))
+    for encoding in candidates:
+        try:
+            codecs.lookup(encoding)
+            return encoding
+        except (LookupError, TypeError):
+            pass
+    return 'utf-8'
+
+
+# Incremental HTML parser that keeps the first title and the meta tags, and stops at the end of the head.
+class HeadParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.metas = []
+        self.done = False
+        self.in_title = False
+        self.title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'meta':
+            self.metas.append(dict(attrs))
+        elif tag == 'title' and self.title is None:
+            self.in_title = True
+        elif tag == 'body':
+            self.done = True
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self.in_title:
+            self.in_title = False
+            self.title = ''.join(self.title_parts)
+        elif tag == 'head':
+            self.done = True
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+
+    # Returns the lowercase texts used to categorize the website: the title and the content of the description and keywords meta tags.
+    def tags(self):
+        tags = []
+        title = self.title if self.title is not None else (''.join(self.title_parts) if self.in_title else None)
+        if title is not None:
+            tags.append(title.lower())
+        for meta in self.metas:
+            if meta.get('name') in META_NAMES and meta.get('content') is not None:
+                tags.append(meta['content'].lower())
+        for meta in self.metas:
+            if meta.get('property') in META_PROPERTIES and meta.get('content') is not None:
+                tags.append(meta['content'].lower())
+        return tags
+
+
+# Downloads the website head. It raises the 'requests' exceptions if the website cannot be downloaded.
+#   Returns the parser with the head data and the number of downloaded bytes.
+def fetch_head(url, session=None, timeout=10, max_bytes=MAX_BYTES):
+    http = session if session is not None else requests
+    parser = HeadParser()
+    downloaded = 0
+    decoder = None
+    with http.get(url, timeout=timeout, stream=True) as response:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(page_encoding(response, chunk))(errors='replace')
+            downloaded += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.done or downloaded >= max_bytes:
+                break
+    parser.close()
+    return parser, downloaded
@@ -0,0 +1,165 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# page_readiness.py: Event-driven page readiness for the selenium scripts (policy-detector and consent-detector). Instead of fixed sleeps, it waits for concrete
+#     signals: document readiness, network idle (no new resources loaded), DOM mutation quiescence and new window handles (or page changes) after clicks. Every wait has an upper bound
+#     (the page load, the clicks and the DOM quiescence after scrolls and closed popups have their own bounds), and the time spent waiting is recorded for each website
+#     so the idle overhead can be measured (also as 'wait_<signal>' phases of the timer, see phase_timer.py).
+
+# Dependencies.
+import json
+import time
+
+# Default upper bounds (seconds) of the page load waits, of the click effect waits and of the stable DOM waits (after scrolls and closed popups),
+#   and the quiet periods that define a network idle page and a stable DOM.
+DEFAULT_MAX_WAIT = 10
+DEFAULT_CLICK_WAIT = 2
+DEFAULT_QUIET_WAIT = 2
+NETWORK_IDLE_TIME = 0.5
+DOM_QUIET_TIME = 0.3
+POLL_INTERVAL = 0.05
+
+# JavaScript snippets evaluated on the page.
+DOCUMENT_READY_JS = "return document.readyState;"
+RESOURCES_JS = "return window.performance ? window.performance.getEntriesByType('resource').length : 0;"
+# Installs (once for each document) a MutationObserver that counts the DOM mutations and stores the time of the last one. Changes of the 'style' and 'class'
+#   attributes are ignored: animations, carousels and tickers change them continuously, and the DOM would never be quiet.
+OBSERVER_JS = """
+if (!window.__gdprMutations) {
+    window.__gdprMutations = {count: 0, last: Date.now()};
+    new MutationObserver(function(records) {
+        for (var i = 0; i < records.length; i++) {
+            if (records[i].type !== 'attributes' || (records[i].attributeName !== 'style' && records[i].attributeName !== 'class')) {
+                window.__gdprMutations.count += 1;
+                window.__gdprMutations.last = Date.now();
+                return;
+            }
+        }
+    }).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+"""
+# Milliseconds since the last DOM mutation, and number of DOM mutations.
+DOM_QUIET_JS = OBSERVER_JS + "return Date.now() - window.__gdprMutations.last;"
+MUTATIONS_JS = OBSERVER_JS + "return window.__gdprMutations.count;"
+
+# Functions.
+
+# Polls 'condition' until it returns a true value or 'timeout' seconds pass. Errors of the condition count as not ready.
+#   Returns the value of the condition (None if it timed out).
+def wait_until(condition, timeout, poll=POLL_INTERVAL):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            value = condition()
+            if value:
+                return value
+        except Exception:
+            pass
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(poll)
+
+
+# Waits until the document is completely loaded.
+def wait_document_ready(driver, timeout):
+    return wait_until(lambda: driver.execute_script(DOCUMENT_READY_JS) == 'complete', timeout) is not None
+
+
+# Waits until the page does not load new resources for 'idle_time' seconds.
+def wait_network_idle(driver, timeout, idle_time=NETWORK_IDLE_TIME):
+    state = {'count': -1, 'since': time.monotonic()}
+
+    def idle():
+        count = driver.execute_script(RESOURCES_JS)
+        now = time.monotonic()
+        if count != state['count']:
+            state['count'] = count
+            state['since'] = now
+        return now - state['since'] >= idle_time
+
+    return wait_until(idle, timeout) is not None
+
+
+# Waits until the DOM does not change for 'quiet_time' seconds.
+def wait_dom_quiet(driver, timeout, quiet_time=DOM_QUIET_TIME):
+    return wait_until(lambda: driver.execute_script(DOM_QUIET_JS) >= quiet_time*1000, timeout) is not None
+
+
+# Clicks the element and waits for the effect of the click: a new window appears, the URL changes or the DOM changes.
+#   Returns the handle of the new window, True if the click changed the current page, or None if nothing happened.
+def click_and_wait(driver, element, timeout):
+    handles = set(driver.window_handles)
+    url = driver.current_url
+    try:
+        mutations = driver.execute_script(MUTATIONS_JS)
+    except Exception:
+        mutations = None
+    element.click()
+
+    def effect():
+        for handle in driver.window_handles:
+            if handle not in handles:
+                return handle
+        if driver.current_url != url:
+            return True
+        return mutations is not None and driver.execute_script(MUTATIONS_JS) != mutations
+
+    return wait_until(effect, timeout)
+
+
+# Readiness waits with configurable upper bounds and per-website wait time metrics: 'max_wait' bounds the page load, 'click_wait' the effect of each click
+#   and 'quiet_wait' the stable DOM after scrolls and closed popups.
+class PageReadiness:
+
+    def __init__(self, max_wait=DEFAULT_MAX_WAIT, click_wait=DEFAULT_CLICK_WAIT, quiet_wait=DEFAULT_QUIET_WAIT, idle_time=NETWORK_IDLE_TIME, quiet_time=DOM_QUIET_TIME, timer=None):
+        self.max_wait = max_wait
+        self.click_wait = click_wait
+        self.quiet_wait = quiet_wait
+        self.idle_time = idle_time
+        self.quiet_time = quiet_time
+        self.timer = timer
+        self.waits = {}
+
+    # Adds 'seconds' of the 'signal' wait to the website metrics.
+    def record(self, website, signal, seconds):
+        website_waits = self.waits.setdefault(website, {})
+        website_waits[signal] = website_waits.get(signal, 0) + seconds
+        if self.timer is not None:
+            self.timer.record(website, 'wait_'+signal, seconds)
+
+    # Waits for a loaded page: document ready, network idle and stable DOM (all within 'max_wait' seconds).
+    def page_ready(self, driver, website):
+        start = time.monotonic()
+        wait_document_ready(driver, self.max_wait)
+        ready = time.monotonic()
+        self.record(website, 'document_ready', ready - start)
+        wait_network_idle(driver, max(0, self.max_wait - (ready - start)), self.idle_time)
+        idle = time.monotonic()
+        self.record(website, 'network_idle', idle - ready)
+        wait_dom_quiet(driver, max(0, self.max_wait - (idle - start)), self.quiet_time)
+        self.record(website, 'dom_quiet', time.monotonic() - idle)
+
+    # Waits for a stable DOM (e.g. after closing popups or scrolling), within 'quiet_wait' seconds.
+    def dom_quiet(self, driver, website):
+        start = time.monotonic()
+        wait_dom_quiet(driver, self.quiet_wait, self.quiet_time)
+        self.record(website, 'dom_quiet', time.monotonic() - start)
+
+    # Clicks the element and waits for its effect (see 'click_and_wait'). Returns the handle of the new window, True if the click changed the URL of the
+    #   current window, or None if it did neither (e.g. it only opened a modal or did nothing).
+    def click(self, driver, website, element):
+        url = driver.current_url
+        start = time.monotonic()
+        effect = click_and_wait(driver, element, self.click_wait)
+        self.record(website, 'click_effect', time.monotonic() - start)
+        if isinstance(effect, str):
+            return effect
+        return True if driver.current_url != url else None
+
+    # Returns the total wait time of each website.
+    def totals(self):
+        return {website: sum(waits.values()) for website, waits in self.waits.items()}
+
+    # Stores the per-website wait metrics in a JSON file.
+    def save(self, path):
+        with open(path, 'w') as outfile:
+            json.dump(self.waits, outfile)
@@ -0,0 +1,159 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# phase_timer.py: Timing instrumentation shared by all the scripts. The wall time of each phase of each website (reachability probe, browser launch, page load,
+#     waits, keyword scans, clicks, screenshots, WEC executions, inspection parsing, filter matching...) is recorded and written as one JSON line for each
+#     phase to a trace file (JSONL), as soon as it is measured. At the end of the run, a summary is computed: count, total, mean, p50, p95, p99 and maximum
+#     of each phase, and the slowest websites with the time of each of their phases.
+#     Phases that are not related to a website (e.g. computing the statistics) are recorded without website. The 'website' phase (whole processing of a
+#     website) is used to rank the slowest websites; if a script does not record it, the sum of the website phases is used.
+
+# Dependencies.
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Default number of slowest websites of the summary, and percentiles of each phase.
+DEFAULT_TOP = 10
+PERCENTILES = (50, 95, 99)
+
+# Phase with the whole processing time of a website.
+WEBSITE_PHASE = 'website'
+
+# Functions.
+
+# Returns the percentile 'q' (0-100) of sorted values, interpolating linearly between the closest ranks.
+def percentile(values, q):
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+# Returns the default summary file of a trace file ('timings.jsonl' -> 'timings-summary.json').
+def summary_path(trace_path):
+    root, ext = os.path.splitext(trace_path)
+    return root+'-summary.json'
+
+
+# Recorder of the phase times. If 'path' is given, each record is appended to that trace file (JSONL, created again for each run unless 'append' is true,
+#   e.g. when a crawl is resumed). The summary only includes the records of the current run.
+#   It can be used from several threads. Each record has the website (None if the phase is not related to a website), the phase name,
+#   its start (seconds since the timer was created), its duration in seconds and, if the phase raised an exception, the exception name.
+class PhaseTimer:
+
+    def __init__(self, path=None, append=False):
+        self.path = path
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.records = []
+        self.file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.file = open(path, 'a' if append else 'w')
+
+    # Context manager that records the wall time of a phase of a website.
+    @contextmanager
+    def phase(self, website, name):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.add({'site': website, 'phase': name, 'start': start - self.origin, 'seconds': time.perf_counter() - start, 'error': error})
+
+    # Records a phase measured by other means ('seconds' ago until now).
+    def record(self, website, name, seconds):
+        self.add({'site': website, 'phase': name, 'start': time.perf_counter() - self.origin - seconds, 'seconds': seconds, 'error': None})
+
+    # Adds a record, writing it to the trace file.
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+            if self.file is not None:
+                self.file.write(json.dumps(record)+'\n')
+                self.file.flush()
+
+    # Adds the records of another timer (e.g. of a worker process, see 'drain').
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    # Worker processes: stops writing to the inherited trace file and forgets the inherited records, so only the own records are returned by 'drain'.
+    def detach(self):
+        self.file = None
+        self.records = []
+
+    # Returns and forgets the buffered records.
+    def drain(self):
+        with self.lock:
+            records = self.records
+            self.records = []
+        return records
+
+    # Closes the trace file.
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    # Returns the summary of the recorded phases:
+    #   - phases: for each phase, count, errors, total, mean, p50, p95, p99 and max (seconds).
+    #   - websites: number of websites with records.
+    #   - slowest_sites: the 'top' slowest websites with their time and the total time of each of their phases.
+    def summary(self, top=DEFAULT_TOP):
+        durations = {}
+        errors = {}
+        websites = {}
+        for record in self.records:
+            durations.setdefault(record['phase'], []).append(record['seconds'])
+            if record['error']:
+                errors[record['phase']] = errors.get(record['phase'], 0) + 1
+            if record['site'] is not None:
+                phases = websites.setdefault(record['site'], {})
+                phases[record['phase']] = phases.get(record['phase'], 0) + record['seconds']
+        phases = {}
+        for name, values in durations.items():
+            values.sort()
+            phases[name] = {
+                'count': len(values),
+                'errors': errors.get(name, 0),
+                'total': sum(values),
+                'mean': sum(values)/len(values),
+                **{'p'+str(q): percentile(values, q) for q in PERCENTILES},
+                'max': values[-1]
+            }
+        totals = {
+            website: website_phases[WEBSITE_PHASE] if WEBSITE_PHASE in website_phases else sum(website_phases.values())
+            for website, website_phases in websites.items()
+        }
+        slowest = sorted(totals, key=totals.get, reverse=True)[:top]
+        return {
+            'phases': phases,
+            'websites': len(websites),
+            'slowest_sites': [{'site': website, 'seconds': totals[website], 'phases': websites[website]} for website in slowest]
+        }
+
+    # Stores the summary as a JSON file (next to the trace file if 'path' is None). Returns the summary.
+    def save_summary(self, path=None, top=DEFAULT_TOP):
+        summary = self.summary(top)
+        with open(path or summary_path(self.path), 'w') as outfile:
+            json.dump(summary, outfile)
+        return summary
+
+    # Prints the summary on terminal (percentiles of each phase and the slowest websites).
+    def print_summary(self, summary=None, top=5):
+        summary = summary or self.summary()
+        print('\nPhase timings (seconds):')
+        for name, stats in sorted(summary['phases'].items(), key=lambda item: item[1]['total'], reverse=True):
+            print(' -',name,': count',stats['count'],'- total',round(stats['total'], 3),'- p50',round(stats['p50'], 3),'- p95',round(stats['p95'], 3),'- p99',round(stats['p99'], 3),'- max',round(stats['max'], 3))
+        if summary['slowest_sites']:
+            print('Slowest websites:',', '.join(site['site']+' ('+str(round(site['seconds'], 2))+' s)' for site in summary['slowest_sites'][:top]))
+        if self.path:
+            print('Phase traces stored on "'+self.path+'" (summary: "'+summary_path(self.path)+'")')
@@ -0,0 +1,115 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# reachability.py: Shared reachability prober used by the crawl scripts (website-categorizer, policy-detector and consent-detector). It probes lots of websites
+#     concurrently (asyncio + aiohttp, with a shared connection pool and HEAD requests) and stores the results on a reachability cache file with a TTL,
+#     so the offline websites only cost one timeout for each pipeline run instead of one for each script.
+
+# Dependencies.
+import os
+import json
+import time
+import asyncio
+import aiohttp
+
+# Default cache file (shared by all the scripts executed from the same folder), TTL in seconds, concurrency and timeout.
+CACHE_FILE = 'reachability-cache.json'
+DEFAULT_TTL = 24*60*60
+DEFAULT_CONCURRENCY = 64
+DEFAULT_TIMEOUT = 10
+
+# Functions.
+
+# Parses and returns the reachability cache JSON (empty if it does not exist or it is invalid).
+def load_cache(path=CACHE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print('[WARN] - Invalid reachability cache',path,':',e)
+        return {}
+
+
+# Stores the reachability cache JSON. It is written to a temporary file and renamed, so a reader never gets a partial file.
+def save_cache(cache, path=CACHE_FILE):
+    tmp_path = path+'.'+str(os.getpid())+'.tmp'
+    with open(tmp_path, 'w') as outfile:
+        json.dump(cache, outfile)
+    os.replace(tmp_path, path)
+
+
+# Stores the reachability of URLs checked by other means (e.g. downloading the website), merging them into the cache.
+def record_results(results, cache_file=CACHE_FILE):
+    cache = load_cache(cache_file)
+    checked = time.time()
+    for url, online in results.items():
+        cache[url] = {'online': online, 'checked': checked}
+    save_cache(cache, cache_file)
+
+
+# Checks if an URL exists: any HTTP response (following redirects) means that the website is online.
+#   It uses a HEAD request, and a GET request (without reading the body) if the server closes the connection on HEAD requests.
+#   With a 'timer' (see phase_timer.py), the probe time is recorded as the 'reachability' phase of the website.
+async def probe_url(session, semaphore, url, timer=None):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            return await probe_request(session, url)
+        finally:
+            if timer is not None:
+                timer.record(url.split('://', 1)[-1], 'reachability', time.perf_counter() - start)
+
+
+# Sends the probe requests of an URL (see 'probe_url').
+async def probe_request(session, url):
+    try:
+        async with session.head(url, allow_redirects=True):
+            return True
+    except asyncio.TimeoutError:
+        return False
+    except Exception:
+        pass
+    try:
+        async with session.get(url):
+            return True
+    except Exception:
+        return False
+
+
+# Probes all the URLs concurrently sharing the same connection pool. Returns a dict with the URLs as keys and true/false as values.
+async def probe_all(urls, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, timer=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=4, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        results = await asyncio.gather(*[probe_url(session, semaphore, url, timer) for url in urls])
+    return dict(zip(urls, results))
+
+
+# Returns the reachability of the URLs (dict with the URLs as keys and true/false as values).
+#   Only the URLs that are not in the cache (or whose result is older than 'ttl' seconds) are probed, and the cache is updated with them.
+def probe_websites(urls, cache_file=CACHE_FILE, ttl=DEFAULT_TTL, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, timer=None):
+    cache = load_cache(cache_file)
+    now = time.time()
+    pending = []
+    for url in urls:
+        entry = cache.get(url)
+        if entry is None or now - entry['checked'] > ttl:
+            pending.append(url)
+    pending = list(dict.fromkeys(pending))
+    if pending:
+        print('Probing',len(pending),'websites (',len(urls)-len(pending),'cached results)...')
+        results = asyncio.run(probe_all(pending, concurrency, timeout, timer))
+        # Other scripts may have updated the cache meanwhile, so reload it before merging.
+        cache = load_cache(cache_file)
+        checked = time.time()
+        for url, online in results.items():
+            cache[url] = {'online': online, 'checked': checked}
+        save_cache(cache, cache_file)
+    return {url: cache[url]['online'] for url in urls}
+
+
+# Checks if an URL exists using the reachability cache (probing it if needed).
+def is_online(url, cache_file=CACHE_FILE, ttl=DEFAULT_TTL):
+    return probe_websites([url], cache_file, ttl)[url]
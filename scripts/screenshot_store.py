@@ -0,0 +1,203 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# screenshot_store.py: Content-addressed store of the screenshots taken by the crawl scripts (policy-detector, consent-detector and wec-executor).
+#     The selenium scripts only capture the screenshot (the encoded PNG returned by the browser) on the crawl thread: decoding, hashing and writing it is done
+#     by a background writer thread, so the disk I/O is not on the browser critical path. Each different image is stored once, named by its SHA-256 hash
+#     ('<store>/<2 first hex digits>/<hash>.png'), and the usual screenshot path of the website (e.g. 'consent-detector-results/<website>/first-level.png')
+#     is a relative symbolic link to it (a copy on file systems without symbolic links). Repeated screenshots (e.g. the same cookie wall on several websites,
+#     or identical top and bottom WEC screenshots) only take the space of one file. The store keeps an index ('<store>/index.json') with the hash of each
+#     screenshot of each website. The index is also appended to '<store>/index.jsonl' as each screenshot is stored, so the index of a resumed crawl
+#     (see crawl_journal.py) still includes the screenshots of the interrupted run.
+#     Optionally, downscaled WebP variants of each image are generated ('<store>/<2 first hex digits>/<hash>-<width>.webp'), it needs the 'pillow' library.
+
+# Dependencies.
+import os
+import io
+import json
+import time
+import base64
+import shutil
+import hashlib
+import threading
+from queue import Queue
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Index files of a store (compiled index and append-only log), and maximum number of screenshots waiting for the writer (the crawl blocks if the writer is this far behind).
+INDEX_FILE = 'index.json'
+INDEX_LOG = 'index.jsonl'
+DEFAULT_QUEUE_SIZE = 64
+
+# Quality of the WebP variants.
+WEBP_QUALITY = 80
+
+# Functions.
+
+# Returns true if the WebP variants can be generated (the 'pillow' library is installed).
+def variants_available():
+    return Image is not None
+
+
+# Returns the SHA-256 hash (hex) of the image bytes.
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Replaces 'path' with a relative symbolic link to 'target' (atomically: the link is created with a temporary name and renamed).
+#   On file systems without symbolic links, 'target' is copied.
+def link(target, path):
+    temporary = path+'.link'
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+    try:
+        os.symlink(os.path.relpath(target, os.path.dirname(path) or '.'), temporary)
+    except OSError:
+        shutil.copyfile(target, temporary)
+    os.replace(temporary, path)
+
+
+# Store of screenshots on the 'root' folder. 'variants' are the widths (pixels) of the WebP variants of each image (none by default).
+#   With a 'timer' (see phase_timer.py), the background writes are recorded as the 'screenshot_write' phase of each website.
+class ScreenshotStore:
+
+    def __init__(self, root, variants=(), timer=None, queue_size=DEFAULT_QUEUE_SIZE):
+        self.root = root
+        self.variants = sorted(set(variants))
+        self.timer = timer
+        self.index = {}
+        self.lock = threading.Lock()
+        self.screenshots = 0
+        self.unique = 0
+        self.bytes = 0
+        self.stored_bytes = 0
+        self.errors = 0
+        os.makedirs(root, exist_ok=True)
+        self.read_log()
+        self.log = open(os.path.join(root, INDEX_LOG), 'a')
+        self.queue = Queue(maxsize=queue_size)
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    # Returns the path of the index file.
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILE)
+
+    # Reads the index log of a previous run (incomplete lines of an interrupted run are ignored).
+    def read_log(self):
+        path = os.path.join(self.root, INDEX_LOG)
+        if not os.path.isfile(path):
+            return
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.index.setdefault(entry['site'], {})[entry['name']] = entry['hash']
+
+    # Returns the path of the stored image of a hash (or of its WebP variant of the given width).
+    def object_path(self, digest, width=None):
+        name = digest+'.png' if width is None else digest+'-'+str(width)+'.webp'
+        return os.path.join(self.root, digest[:2], name)
+
+    # Captures a screenshot of the driver for the website, that will be available on 'path'. Only the capture is done on the calling thread.
+    def capture(self, driver, path, website):
+        self.queue.put(('capture', driver.get_screenshot_as_base64(), path, website))
+
+    # Moves an existing screenshot file (e.g. written by the WEC) into the store, leaving a link on its path.
+    def add_file(self, path, website):
+        self.queue.put(('file', None, path, website))
+
+    # Calls 'function' with 'args' on the writer thread, once all the screenshots queued before are stored (e.g. to journal a website only when its
+    #   screenshots are on disk, see crawl_journal.py).
+    def then(self, function, *args):
+        self.queue.put(('call', function, args))
+
+    # Background writer: stores each queued screenshot (and runs the queued calls) until 'close' queues None.
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if item[0] == 'call':
+                try:
+                    item[1](*item[2])
+                except Exception as e:
+                    print('[WARN] - Problem running a screenshots store call:',e)
+                continue
+            kind, encoded, path, website = item
+            start = time.perf_counter()
+            try:
+                self.write(kind, encoded, path, website)
+            except Exception as e:
+                print('[WARN] - Website',website,': Problem storing screenshot "'+path+'":',e)
+                with self.lock:
+                    self.errors += 1
+            if self.timer is not None:
+                self.timer.record(website, 'screenshot_write', time.perf_counter() - start)
+
+    # Stores a screenshot: decodes it (captures), writes the image if its hash is new, links its path and generates the missing variants.
+    def write(self, kind, encoded, path, website):
+        if kind == 'capture':
+            data = base64.b64decode(encoded)
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+        digest = image_hash(data)
+        target = self.object_path(digest)
+        new = not os.path.exists(target)
+        if new:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if kind == 'capture':
+                with open(target+'.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(target+'.tmp', target)
+            else:
+                os.replace(path, target)
+        link(target, path)
+        for width in self.variants:
+            if not os.path.exists(self.object_path(digest, width)):
+                self.write_variant(data, digest, width)
+        with self.lock:
+            self.index.setdefault(website, {})[os.path.basename(path)] = digest
+            self.log.write(json.dumps({'site': website, 'name': os.path.basename(path), 'hash': digest})+'\n')
+            self.log.flush()
+            self.screenshots += 1
+            self.bytes += len(data)
+            if new:
+                self.unique += 1
+                self.stored_bytes += len(data)
+
+    # Writes the WebP variant of an image downscaled to 'width' pixels (keeping the aspect ratio, images narrower than 'width' are not upscaled).
+    def write_variant(self, data, digest, width):
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((width, image.height))
+            path = self.object_path(digest, width)
+            image.save(path+'.tmp', 'WEBP', quality=WEBP_QUALITY)
+            os.replace(path+'.tmp', path)
+
+    # Returns the hash of a screenshot of a website (its file name, e.g. 'first-level.png'), None if it is not stored.
+    def lookup(self, website, name):
+        with self.lock:
+            return self.index.get(website, {}).get(name)
+
+    # Waits for the pending screenshots and stores the index.
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        self.log.close()
+        with open(self.index_path(), 'w') as outfile:
+            json.dump(self.index, outfile)
+
+    # Returns the storage counters: stored screenshots, unique images, bytes of all the screenshots, bytes actually written and writer errors.
+    def stats(self):
+        return {'screenshots': self.screenshots, 'unique': self.unique, 'bytes': self.bytes, 'stored_bytes': self.stored_bytes, 'errors': self.errors}
+
+    # Prints the storage counters on terminal.
+    def print_stats(self):
+        stats = self.stats()
+        print('Screenshots stored:',stats['screenshots'],'- unique images:',stats['unique'],'- MB written:',round(stats['stored_bytes']/1e6, 2),'of',round(stats['bytes']/1e6, 2),'(see "'+self.index_path()+'")')
@@ -0,0 +1,127 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# verdict_cache.py: Memoized tracking verdicts of the protection filters for each URL. The same script URLs appear in thousands of cookies and hundreds of websites,
+#     so each URL is classified once. It keeps a bounded LRU cache in memory and optionally a persistent SQLite file shared across runs.
+#     Verdicts are keyed by the URL and the filter engine fingerprint (see filter_engine.py), so changing a filter list never reuses old verdicts.
+
+# Dependencies.
+import sqlite3
+from pathlib import Path
+from collections import OrderedDict
+
+# Default maximum number of verdicts kept in memory.
+DEFAULT_MAX_SIZE = 100000
+
+# Number of new verdicts written to the SQLite file before committing them.
+COMMIT_EVERY = 1000
+
+
+# Bounded LRU cache of URL verdicts with optional SQLite backing.
+#   A 'read_only' cache only reads the SQLite file (e.g. on worker processes, the new verdicts are merged and stored by the main process).
+class VerdictCache:
+
+    def __init__(self, fingerprint, max_size=DEFAULT_MAX_SIZE, path=None, read_only=False):
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.path = path
+        self.read_only = read_only
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pending = 0
+        self.db = None
+        if path and read_only:
+            self.db = sqlite3.connect(Path(path).absolute().as_uri()+'?mode=ro', uri=True)
+        elif path:
+            self.db = sqlite3.connect(path)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS verdicts ('
+                'fingerprint TEXT NOT NULL, url TEXT NOT NULL, blocked INTEGER NOT NULL, '
+                'PRIMARY KEY (fingerprint, url))'
+            )
+            self.db.commit()
+
+    # Returns the cached verdict of the URL (None if it is not cached).
+    def get(self, url):
+        if url in self.entries:
+            self.entries.move_to_end(url)
+            self.hits += 1
+            return self.entries[url]
+        if self.db is not None:
+            row = self.db.execute(
+                'SELECT blocked FROM verdicts WHERE fingerprint = ? AND url = ?',
+                (self.fingerprint, url)
+            ).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self.remember(url, bool(row[0]))
+                return bool(row[0])
+        self.misses += 1
+        return None
+
+    # Stores the verdict of the URL in memory (evicting the least recently used one if full) and in the SQLite file.
+    def put(self, url, verdict):
+        self.remember(url, verdict)
+        if self.db is not None and not self.read_only:
+            self.db.execute(
+                'INSERT OR REPLACE INTO verdicts (fingerprint, url, blocked) VALUES (?, ?, ?)',
+                (self.fingerprint, url, int(verdict))
+            )
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.db.commit()
+                self.pending = 0
+
+    def remember(self, url, verdict):
+        self.entries[url] = verdict
+        self.entries.move_to_end(url)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # Returns the verdict of the URL, computing it with 'classify' (and caching it) if it is not cached.
+    def lookup(self, url, classify):
+        verdict = self.get(url)
+        if verdict is None:
+            verdict = classify(url)
+            self.put(url, verdict)
+        return verdict
+
+    # Merges the verdicts and the counters of another cache (e.g. the ones of a worker process).
+    def merge(self, verdicts, stats):
+        for url, verdict in verdicts.items():
+            self.put(url, verdict)
+        self.hits += stats['hits']
+        self.disk_hits += stats['disk_hits']
+        self.misses += stats['misses']
+        self.evictions += stats['evictions']
+
+    # Resets the cache counters (the cached verdicts are kept).
+    def reset_stats(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the cache counters, useful to size the cache.
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'lookups': lookups,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+    # Commits the pending verdicts and closes the SQLite file.
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
@@ -0,0 +1,317 @@
+# gdpr-web-tracking-regulatory-compliance: A framework of tools and algorithms allowing compliance tests for web tracking techniques under EU data protection regulation (GDPR).
+# Author: ©David Martínez.
+# work_queue.py: Sharded execution of the crawl scripts (wec-executor, policy-detector and consent-detector) on several machines (or processes) at once.
+#     The websites are kept on a SQLite work queue file on a shared folder ('--queue' argument of the scripts). Each worker claims batches of websites with a
+#     lease, renews the leases of its websites while it processes them and completes each website when its results are on disk. If a worker dies, the lease
+#     of its websites expires and they are returned to the queue, so another worker processes them (a website is marked as failed after several expired
+#     leases). Each worker writes its results (same layout as a normal run) to its own folder, '<queue folder>/workers/<worker name>', and the merge step
+#     (python3 work_queue.py merge) combines the worker folders into the usual results layout, taking each website from the worker that completed it.
+#     The shared folder must support file locks (SQLite), e.g. a NFS export with locking enabled.
+
+# IMPORTANT: All the workers of a queue must execute the same script. The websites are added to the queue by the first worker (the next ones find them).
+
+# Dependencies.
+import os
+import glob
+import json
+import time
+import shutil
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from crawl_journal import CrawlJournal
+from screenshot_store import link, INDEX_FILE, INDEX_LOG
+
+# Default number of websites of each claim, lease duration (seconds), number of leases of a website before it is marked as failed and
+#   seconds between the claims of a worker waiting for the websites leased by other workers.
+DEFAULT_BATCH = 10
+DEFAULT_LEASE = 600
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL = 5
+
+# Folder of the worker results (next to the queue file).
+WORKERS_DIR = 'workers'
+
+# Results layout of each crawl stage: results folder (one subfolder for each website), screenshots store, journal and result file compiled from the journal.
+STAGES = {
+    'wec': {'results': 'wec-evidences', 'store': 'wec-screenshots', 'journal': 'wec-evidences/journal.jsonl', 'output': None},
+    'policy': {'results': 'policy-detector-results', 'store': 'policy-detector-results/screenshots', 'journal': 'policy-detector-results/journal.jsonl', 'output': 'policy_detected.json'},
+    'consent': {'results': 'consent-detector-results', 'store': 'consent-detector-results/screenshots', 'journal': 'consent-detector-results/journal.jsonl', 'output': None}
+}
+
+# Functions.
+
+# Returns the default worker name (host name and process id, unique for each worker).
+def default_worker():
+    return socket.gethostname()+'-'+str(os.getpid())
+
+
+# Work queue of websites on a SQLite file. Each website has a state: 'pending', 'leased' (with the worker and the lease expiration time), 'done'
+#   (with the status reported by the worker) or 'failed' (its lease expired 'max_attempts' times).
+class WorkQueue:
+
+    def __init__(self, path, worker=None, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = os.path.abspath(path)
+        self.worker = worker or default_worker()
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.claimed = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat = None
+        with self.transaction() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS sites ('
+                'site TEXT PRIMARY KEY, position INTEGER NOT NULL, state TEXT NOT NULL, worker TEXT, '
+                'lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, status TEXT)'
+            )
+
+    # Context manager with a connection inside a write transaction (the queue file is locked until it ends). Each operation uses its own connection,
+    #   so the queue can be used from several threads (e.g. the heartbeat and the screenshots store writer).
+    @contextmanager
+    def transaction(self):
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        finally:
+            db.close()
+
+    # Adds the websites to the queue (keeping their order). Websites already on the queue are not changed.
+    def fill(self, websites):
+        with self.transaction() as db:
+            offset = db.execute('SELECT COUNT(*) FROM sites').fetchone()[0]
+            db.executemany(
+                "INSERT OR IGNORE INTO sites (site, position, state) VALUES (?, ?, 'pending')",
+                [(website, offset + i) for i, website in enumerate(websites)]
+            )
+
+    # Returns the websites with an expired lease to the queue (or marks them as failed after 'max_attempts' leases).
+    def requeue_expired(self, db):
+        now = time.time()
+        db.execute(
+            "UPDATE sites SET state = 'failed', status = 'lease_expired', lease_until = NULL "
+            "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, self.max_attempts)
+        )
+        db.execute(
+            "UPDATE sites SET state = 'pending', worker = NULL, lease_until = NULL "
+            "WHERE state = 'leased' AND lease_until < ?", (now,)
+        )
+
+    # Claims up to 'size' pending websites (queue order) for this worker. Returns the list of claimed websites.
+    def claim(self, size):
+        with self.transaction() as db:
+            self.requeue_expired(db)
+            websites = [row[0] for row in db.execute("SELECT site FROM sites WHERE state = 'pending' ORDER BY position LIMIT ?", (size,))]
+            db.executemany(
+                "UPDATE sites SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE site = ?",
+                [(self.worker, time.time() + self.lease, website) for website in websites]
+            )
+        with self.lock:
+            self.claimed.update(websites)
+        return websites
+
+    # Renews the leases of the claimed websites that are not completed yet.
+    def renew(self):
+        with self.lock:
+            websites = list(self.claimed)
+        if not websites:
+            return
+        with self.transaction() as db:
+            db.executemany(
+                "UPDATE sites SET lease_until = ? WHERE site = ? AND worker = ? AND state = 'leased'",
+                [(time.time() + self.lease, website, self.worker) for website in websites]
+            )
+
+    # Completes a claimed website with its status. Returns false if the website is not leased by this worker anymore (its lease expired and it was
+    #   claimed by another worker, whose results are the ones merged).
+    def complete(self, website, status):
+        with self.transaction() as db:
+            updated = db.execute(
+                "UPDATE sites SET state = 'done', status = ?, lease_until = NULL WHERE site = ? AND worker = ? AND state = 'leased'",
+                (status, website, self.worker)
+            ).rowcount
+        with self.lock:
+            self.claimed.discard(website)
+        return updated > 0
+
+    # Returns a claimed website to the queue at once (e.g. the worker is stopped before processing it).
+    def release(self, website):
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE sites SET state = 'pending', worker = NULL, lease_until = NULL WHERE site = ? AND worker = ? AND state = 'leased'",
+                (website, self.worker)
+            )
+        with self.lock:
+            self.claimed.discard(website)
+
+    # Renews the leases every third of the lease duration until 'close'.
+    def heartbeat_loop(self):
+        while not self.stopped.wait(self.lease/3):
+            try:
+                self.renew()
+            except sqlite3.Error as e:
+                print('[WARN] - Cannot renew the work queue leases:',e)
+
+    # Generator of batches of 'size' claimed websites. The leases are renewed by a background thread. When there are no pending websites, it waits
+    #   until the leased ones (of any worker) are completed or returned to the queue, and it ends when all the websites are done or failed.
+    def batches(self, size=DEFAULT_BATCH):
+        if self.heartbeat is None:
+            self.heartbeat = threading.Thread(target=self.heartbeat_loop, daemon=True)
+            self.heartbeat.start()
+        while True:
+            websites = self.claim(size)
+            if websites:
+                yield websites
+                continue
+            counts = self.counts()
+            if counts.get('pending', 0) == 0 and counts.get('leased', 0) == 0:
+                return
+            time.sleep(min(POLL_INTERVAL, self.lease))
+
+    # Returns the number of websites of each state.
+    def counts(self):
+        with self.transaction() as db:
+            return dict(db.execute('SELECT state, COUNT(*) FROM sites GROUP BY state').fetchall())
+
+    # Returns the worker that completed each done website.
+    def owners(self):
+        with self.transaction() as db:
+            return dict(db.execute("SELECT site, worker FROM sites WHERE state = 'done'").fetchall())
+
+    # Returns the number of websites completed by each worker.
+    def workers(self):
+        with self.transaction() as db:
+            return dict(db.execute("SELECT worker, COUNT(*) FROM sites WHERE state = 'done' GROUP BY worker").fetchall())
+
+    # Returns the failed websites (queue order).
+    def failed(self):
+        with self.transaction() as db:
+            return [row[0] for row in db.execute("SELECT site FROM sites WHERE state = 'failed' ORDER BY position")]
+
+    # Prints the number of websites of each state on terminal.
+    def print_status(self):
+        counts = self.counts()
+        print('Work queue "'+self.path+'": pending',counts.get('pending', 0),'- leased',counts.get('leased', 0),'- done',counts.get('done', 0),'- failed',counts.get('failed', 0))
+
+    # Stops renewing the leases.
+    def close(self):
+        self.stopped.set()
+        if self.heartbeat is not None:
+            self.heartbeat.join()
+            self.heartbeat = None
+
+
+# Joins a work queue as a worker of a crawl script: adds the 'websites' to the queue and changes the current folder to the worker results folder
+#   (the input files must be read before). Returns the queue.
+def start_worker(path, worker, websites, lease=DEFAULT_LEASE):
+    queue = WorkQueue(path, worker, lease)
+    queue.fill(websites)
+    directory = os.path.join(os.path.dirname(queue.path), WORKERS_DIR, queue.worker)
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    print('Worker',queue.worker,'of the work queue "'+queue.path+'", results folder:',directory)
+    return queue
+
+
+# Copies a website folder of a worker ('source') to the merged results ('destination'). The screenshots (links to the worker screenshots store) are
+#   copied to the merged store (once for each image, with their variants) and linked again. The index of the merged store is updated.
+def merge_website(website, source, destination, source_store, store, index, index_log):
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    os.makedirs(destination)
+    source_store = os.path.realpath(source_store)
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        target = os.path.realpath(path)
+        if os.path.islink(path) and os.path.commonpath([target, source_store]) == source_store:
+            digest = os.path.basename(target).split('.')[0]
+            stored = os.path.join(store, digest[:2], os.path.basename(target))
+            if not os.path.exists(stored):
+                os.makedirs(os.path.dirname(stored), exist_ok=True)
+                for variant in glob.glob(os.path.join(os.path.dirname(target), digest+'*')):
+                    shutil.copyfile(variant, os.path.join(os.path.dirname(stored), os.path.basename(variant)))
+            link(stored, os.path.join(destination, name))
+            index.setdefault(website, {})[name] = digest
+            index_log.write(json.dumps({'site': website, 'name': name, 'hash': digest})+'\n')
+        elif os.path.isdir(path):
+            shutil.copytree(path, os.path.join(destination, name), symlinks=True)
+        else:
+            shutil.copy2(path, os.path.join(destination, name))
+
+
+# Merges the worker results of a crawl 'stage' (see STAGES) into the usual results layout on the 'output' folder: each done website is taken from
+#   the worker that completed it, the journals are combined and the result file is compiled. Returns the number of merged websites.
+def merge(queue, stage, output='.'):
+    layout = STAGES[stage]
+    owners = queue.owners()
+    root = os.path.join(os.path.dirname(queue.path), WORKERS_DIR)
+    results = os.path.join(output, layout['results'])
+    store = os.path.join(output, layout['store'])
+    os.makedirs(results, exist_ok=True)
+    os.makedirs(store, exist_ok=True)
+    journal_path = os.path.join(output, layout['journal'])
+    merged = set()
+    index = {}
+    with open(journal_path, 'w') as journal, open(os.path.join(store, INDEX_LOG), 'w') as index_log:
+        for worker in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            worker_journal = os.path.join(root, worker, layout['journal'])
+            if not os.path.isfile(worker_journal):
+                continue
+            with open(worker_journal) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    website = entry['site']
+                    if owners.get(website) != worker or website in merged:
+                        continue
+                    source = os.path.join(root, worker, layout['results'], website)
+                    if os.path.isdir(source):
+                        merge_website(website, source, os.path.join(results, website), os.path.join(root, worker, layout['store']), store, index, index_log)
+                    journal.write(json.dumps(entry)+'\n')
+                    merged.add(website)
+    with open(os.path.join(store, INDEX_FILE), 'w') as outfile:
+        json.dump(index, outfile)
+    if layout['output']:
+        journal = CrawlJournal(journal_path, resume=True)
+        journal.compile(os.path.join(output, layout['output']))
+        journal.close()
+    missing = [website for website in owners if website not in merged]
+    if missing:
+        print('[WARN] - Done websites without worker results (',len(missing),'): ',missing)
+    return len(merged)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shows the state of a work queue of the crawl scripts, or merges the results of its workers.')
+    parser.add_argument('command', choices=['status', 'merge'], help='"status": number of websites of each state and of each worker; "merge": combine the worker results.')
+    parser.add_argument('--queue', required=True, help='SQLite work queue file.')
+    parser.add_argument('--stage', choices=sorted(STAGES), help='Crawl stage of the queue (merge command): "wec" (wec-executor.py), "policy" (policy-detector.py) or "consent" (consent-detector.py).')
+    parser.add_argument('--output', default='.', help='Folder where the merged results are stored (merge command), e.g. the scripts folder.')
+    args = parser.parse_args()
+    if not os.path.isfile(args.queue):
+        parser.error('the work queue file does not exist: '+args.queue)
+
+    queue = WorkQueue(args.queue)
+    if args.command == 'status':
+        queue.print_status()
+        for worker, done in sorted(queue.workers().items()):
+            print(' -',worker,':',done,'websites')
+        failed = queue.failed()
+        if failed:
+            print('Failed websites (',len(failed),'): ',failed)
+    else:
+        if args.stage is None:
+            parser.error('the merge command needs the --stage argument')
+        merged = merge(queue, args.stage, args.output)
+        print('Merged',merged,'websites of the workers into "'+os.path.join(args.output, STAGES[args.stage]['results'])+'"')
+        queue.print_status()